@@ -6,15 +6,24 @@
 
 import configparser
 import fnmatch
+import functools
+import hashlib
+import json
 import logging
 import os
 import pathlib
 import shlex
+import shutil
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import time
 
 import pytest
 
+import graminelibos
+from graminelibos.hash_cache import get_cache_dir
 from graminelibos.regression import HAS_SGX, run_command
 
 DEFAULT_LTP_SCENARIO = 'install/runtest/syscalls'
@@ -25,6 +34,15 @@ if HAS_SGX:
 LTP_SCENARIO = os.environ.get('LTP_SCENARIO', DEFAULT_LTP_SCENARIO)
 LTP_CONFIG = os.environ.get('LTP_CONFIG', DEFAULT_LTP_CONFIG).split(' ')
 LTP_TIMEOUT_FACTOR = float(os.environ.get('LTP_TIMEOUT_FACTOR', '1'))
+LTP_INCREMENTAL = os.environ.get('LTP_INCREMENTAL') == '1'
+# if not set, `ltp-results.sqlite3` in Gramine's cache directory
+LTP_RESULTS_CACHE = os.environ.get('LTP_RESULTS_CACHE')
+
+# same as `binary_dir` in tests.toml
+LTP_BINARY_DIR = pathlib.Path('install/testcases/bin')
+
+# pylint: disable=protected-access
+GRAMINE_PKGLIBDIR = pathlib.Path(graminelibos._CONFIG_PKGLIBDIR)
 
 
 def read_scenario(scenario):
@@ -183,17 +201,114 @@ def check_must_pass(passed, failed, must_pass):
         pytest.fail('All subtests skipped, replace must-pass with skip')
 
 
-def test_ltp(cmd, section):
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def gramine_sha256():
+    """Compute a hash of the installed Gramine (PAL, LibOS and runtime libraries)."""
+
+    paths = [
+        GRAMINE_PKGLIBDIR / ('sgx' if HAS_SGX else 'direct') / 'libpal.so',
+        GRAMINE_PKGLIBDIR / ('sgx' if HAS_SGX else 'direct') / 'loader',
+        GRAMINE_PKGLIBDIR / 'libsysdb.so',
+        *sorted(path for path in (GRAMINE_PKGLIBDIR / 'runtime').rglob('*') if path.is_file()),
+    ]
+    return hashlib.sha256(
+        ''.join(f'{path} {file_sha256(path)}\n' for path in paths).encode()).hexdigest()
+
+
+def get_result_key(cmd, section, timeout):
+    """Compute the key under which the result of a test is cached.
+
+    The key covers everything that can change the result: the test binary, its manifest (which
+    under SGX also covers the trusted files), the configuration of the test, and the installed
+    Gramine. Returns None if any of the files is missing (the test will fail anyway).
+    """
+
+    manifests = [f'{cmd[0]}.manifest']
+    if HAS_SGX:
+        manifests.append(f'{cmd[0]}.manifest.sgx')
+
+    try:
+        files = {path: file_sha256(path) for path in [LTP_BINARY_DIR / cmd[0], *manifests]}
+        gramine = gramine_sha256()
+    except OSError:
+        return None
+
+    return hashlib.sha256(json.dumps({
+        'sgx': HAS_SGX,
+        'cmd': cmd,
+        'section': dict(section),
+        'timeout': timeout,
+        'files': {os.fspath(path): sha256 for path, sha256 in files.items()},
+        'gramine': gramine,
+    }, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Results (passed or failed) of previous runs of tests, keyed by `get_result_key()`.
+
+    Stored in SQLite database, which can be shared between concurrently running Pytest processes.
+    """
+
+    def __init__(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # large timeout, because concurrent processes may be waiting for each other's commits
+        self.db = sqlite3.connect(os.fspath(path), timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                '(key TEXT PRIMARY KEY, outcome TEXT NOT NULL, time REAL NOT NULL)')
+
+    def get(self, key):
+        row = self.db.execute('SELECT outcome FROM results WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, outcome):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                (key, outcome, time.time()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_result_cache():
+    path = LTP_RESULTS_CACHE
+    try:
+        path = get_cache_dir() / 'ltp-results.sqlite3' if path is None else pathlib.Path(path)
+        return ResultCache(path)
+    except (OSError, sqlite3.Error, RuntimeError) as e:
+        logging.warning('could not open LTP results cache %s: %s', path, e)
+        return None
+
+
+@pytest.fixture
+def ltp_tmpdir():
+    """Temporary directory for LTP (passed as `TMPDIR`), private to the test.
+
+    This way, concurrently running tests don't see each other's files, and the files left by
+    a test that was killed are removed. The directory has to be under `/tmp`, which is mounted
+    in the manifest.
+    """
+
+    path = tempfile.mkdtemp(prefix='gramine-ltp-', dir='/tmp')
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def run_ltp(cmd, section, timeout, tmpdir):
     must_pass = section.getintset('must-pass')
 
     loader = 'gramine-sgx' if HAS_SGX else 'gramine-direct'
-    timeout = int(section.getfloat('timeout') * LTP_TIMEOUT_FACTOR)
     full_cmd = [loader, *cmd]
 
     logging.info('command: %s', full_cmd)
     logging.info('must_pass: %s', list(must_pass) if must_pass else 'all')
 
-    returncode, stdout, _stderr = run_command(full_cmd, timeout=timeout, can_fail=True)
+    returncode, stdout, _stderr = run_command(full_cmd, timeout=timeout, can_fail=True,
+        env={**os.environ, 'TMPDIR': tmpdir})
 
     # Parse output regardless of whether `must_pass` is specified: unfortunately some tests
     # do not exit with non-zero code when failing, because they rely on `MAP_SHARED` (which
@@ -210,6 +325,25 @@ def test_ltp(cmd, section):
     check_must_pass(passed, failed, must_pass)
 
 
+def test_ltp(cmd, section, ltp_tmpdir):
+    timeout = int(section.getfloat('timeout') * LTP_TIMEOUT_FACTOR)
+
+    key = get_result_key(cmd, section, timeout)
+    cache = get_result_cache() if key is not None else None
+    if LTP_INCREMENTAL and cache is not None and cache.get(key) == 'passed':
+        pytest.skip('passed before, and neither the test nor Gramine changed since '
+            '(LTP_INCREMENTAL=1)')
+
+    try:
+        run_ltp(cmd, section, timeout, ltp_tmpdir)
+    except (Exception, pytest.fail.Exception):
+        if cache is not None:
+            cache.put(key, 'failed')
+        raise
+    if cache is not None:
+        cache.put(key, 'passed')
+
+
 def test_lint():
     cmd = ['./contrib/conf_lint.py', '--scenario', LTP_SCENARIO, *LTP_CONFIG]
     try:
@@ -258,6 +392,10 @@ Supports the following environment variables:
     LTP_SCENARIO: LTP scenario file (default: {})
     LTP_CONFIG: space-separated list of LTP config files (default: {})
     LTP_TIMEOUT_FACTOR: multiply all timeouts by given value
+    LTP_INCREMENTAL: set to 1 to skip tests which passed before, and neither the test nor
+        Gramine changed since (default: disabled)
+    LTP_RESULTS_CACHE: database of results of previous runs
+        (default: $XDG_CACHE_HOME/gramine/ltp-results.sqlite3, by default under ~/.cache)
 '''.format(sys.argv[0], DEFAULT_LTP_SCENARIO, DEFAULT_LTP_CONFIG)
         print(usage, file=sys.stderr)
         sys.exit(1)
@@ -7,6 +7,7 @@ import subprocess
 import unittest
 
 import json
+import pytest
 import tomli
 
 from graminelibos.regression import (
@@ -1393,6 +1394,7 @@ class TC_40_FileSystem(RegressionTestCase):
         stdout, _ = self.run_binary(['synthetic'])
         self.assertIn("TEST OK", stdout)
 
+    @pytest.mark.serial
     def test_070_shm(self):
         if os.path.exists('/dev/shm/shm_test'):
             os.remove('/dev/shm/shm_test')
@@ -1478,6 +1480,8 @@ class TC_50_GDB(RegressionTestCase):
     # the bug.
     @unittest.skipUnless(GDB_VERSION is not None and GDB_VERSION < (13,),
         f'missing or known buggy GDB ({GDB_VERSION=})')
+    # modifies `fork_and_access_file_testfile`, which is shared by all shards
+    @pytest.mark.serial
     def test_020_gdb_fork_and_access_file_bug(self):
         # To run this test manually, use:
         # GDB=1 GDB_SCRIPT=fork_and_access_file.gdb gramine-sgx fork_and_access_file
@@ -1505,6 +1509,7 @@ class TC_80_Socket(RegressionTestCase):
         stdout, _ = self.run_binary(['getsockopt'])
         self.assertIn('TEST OK', stdout)
 
+    @pytest.mark.serial
     def test_010_epoll(self):
         stdout, _ = self.run_binary(['epoll_test'])
         self.assertIn('TEST OK', stdout)
@@ -1546,6 +1551,7 @@ class TC_80_Socket(RegressionTestCase):
         self.assertIn('pselect() on write event returned 1 file descriptors', stdout)
         self.assertIn('pselect() on read event returned 1 file descriptors', stdout)
 
+    @pytest.mark.serial
     def test_060_getsockname(self):
         stdout, _ = self.run_binary(['getsockname'])
         self.assertIn('getsockname: Got socket name with static port OK', stdout)
@@ -1580,24 +1586,29 @@ class TC_80_Socket(RegressionTestCase):
         stdout, _ = self.run_binary(['unix'])
         self.assertIn('TEST OK', stdout)
 
+    @pytest.mark.serial
     def test_200_socket_udp(self):
         stdout, _ = self.run_binary(['udp'])
         self.assertIn('TEST OK', stdout)
 
+    @pytest.mark.serial
     def test_300_socket_tcp_msg_peek(self):
         stdout, _ = self.run_binary(['tcp_msg_peek'])
         self.assertIn('TEST OK', stdout)
 
+    @pytest.mark.serial
     def test_301_socket_tcp_ancillary(self):
         stdout, _ = self.run_binary(['tcp_ancillary'])
         self.assertIn('TEST OK', stdout)
 
     # Two tests for a responsive peer: first connect() returns EINPROGRESS, then poll/epoll
     # immediately returns because the connection is quickly refused
+    @pytest.mark.serial
     def test_305_socket_tcp_einprogress_responsive_poll(self):
         stdout, _ = self.run_binary(['tcp_einprogress', '127.0.0.1', 'poll'])
         self.assertIn('TEST OK (connection refused after initial EINPROGRESS)', stdout)
 
+    @pytest.mark.serial
     def test_306_socket_tcp_einprogress_responsive_epoll(self):
         stdout, _ = self.run_binary(['tcp_einprogress', '127.0.0.1', 'epoll'])
         self.assertIn('TEST OK (connection refused after initial EINPROGRESS)', stdout)
@@ -1606,14 +1617,17 @@ class TC_80_Socket(RegressionTestCase):
     # out because the connection cannot be established. Note that 203.0.113.1 address is taken from
     # the reserved "Documentation" range 203.0.113.0/24 (TEST-NET-3), which should never be used in
     # real networks.
+    @pytest.mark.serial
     def test_307_socket_tcp_einprogress_unresponsive_poll(self):
         stdout, _ = self.run_binary(['tcp_einprogress', '203.0.113.1', 'poll'])
         self.assertIn('TEST OK (connection timed out)', stdout)
 
+    @pytest.mark.serial
     def test_308_socket_tcp_einprogress_unresponsive_epoll(self):
         stdout, _ = self.run_binary(['tcp_einprogress', '203.0.113.1', 'epoll'])
         self.assertIn('TEST OK (connection timed out)', stdout)
 
+    @pytest.mark.serial
     def test_310_socket_tcp_ipv6_v6only(self):
         stdout, _ = self.run_binary(['tcp_ipv6_v6only'], timeout=50)
         self.assertIn('test completed successfully', stdout)
@@ -14,12 +14,38 @@ if __version__.startswith('@') and not _os.getenv('GRAMINE_IMPORT_FOR_SPHINX_ANY
         'Please install Gramine before running Python tools. See '
         'https://gramine.readthedocs.io/en/latest/devel/building.html.')
 
-# pylint: disable=wrong-import-position
-from .gen_jinja_env import make_env
+# The tools are short-lived, so public names are imported lazily, on first access: this way a tool
+# pays only for the modules it actually uses (e.g., viewing SIGSTRUCT doesn't need Jinja,
+# voluptuous or cryptography, each of which takes tens of milliseconds to import).
+_LAZY_ATTRS = {
+    'Manifest': 'manifest',
+    'ManifestError': 'manifest',
+}
+if _CONFIG_SGX_ENABLED:
+    _LAZY_ATTRS.update({
+        'get_tbssigstruct': 'sgx_sign',
+        'get_tbssigstruct_from_bytes': 'sgx_sign',
+        'get_tbssigstruct_from_manifest': 'sgx_sign',
+        'sign_with_local_key': 'sgx_sign',
+        'SGX_LIBPAL': 'sgx_sign',
+        'SGX_RSA_KEY_PATH': 'sgx_sign',
+        'Sigstruct': 'sigstruct',
+    })
 
-_env = make_env()
+def __getattr__(name):
+    # pylint: disable=import-outside-toplevel
+    import importlib
+    if name == '_env':
+        from .gen_jinja_env import get_env
+        value = get_env()
+    else:
+        try:
+            module = _LAZY_ATTRS[name]
+        except KeyError:
+            raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from None
+        value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
 
-from .manifest import Manifest, ManifestError
-if _CONFIG_SGX_ENABLED:
-    from .sgx_sign import get_tbssigstruct, sign_with_local_key, SGX_LIBPAL, SGX_RSA_KEY_PATH
-    from .sigstruct import Sigstruct
+def __dir__():
+    return sorted({*globals(), *_LAZY_ATTRS})
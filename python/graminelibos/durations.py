@@ -0,0 +1,286 @@
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Persistent record of test durations, used for scheduling tests and for detecting slowdowns
+"""
+
+import heapq
+import os
+import pathlib
+import sqlite3
+import statistics
+import sys
+
+from .hash_cache import get_cache_dir
+
+#: name of the database file in :py:func:`graminelibos.hash_cache.get_cache_dir`
+DURATIONS_DB_FILENAME = 'test-durations.sqlite3'
+#: number of most recent runs of each test kept in the database
+DEFAULT_MAX_RUNS = 50
+#: number of most recent successful runs from which the expected duration of a test is computed
+DEFAULT_WINDOW = 5
+#: a test is reported as slower if it took this much longer (as a fraction) than expected...
+DEFAULT_THRESHOLD = 0.5
+#: ... and at least this many seconds longer (shorter tests are too noisy)
+MIN_INCREASE = 1.0
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS durations (
+        nodeid TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        start_time REAL NOT NULL,
+        duration REAL NOT NULL,
+        outcome TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS durations_by_test ON durations (mode, nodeid, start_time);
+'''
+
+def default_path():
+    """Return the default path of the database.
+
+    Returns:
+        pathlib.Path: :py:data:`DURATIONS_DB_FILENAME` in
+        :py:func:`graminelibos.hash_cache.get_cache_dir`
+
+    Raises:
+        RuntimeError: when the cache directory could not be determined
+    """
+    return get_cache_dir() / DURATIONS_DB_FILENAME
+
+
+class DurationDB:
+    """Durations of tests in past Pytest sessions.
+
+    Each test is identified by its Pytest node ID and the mode (``'direct'`` or ``'sgx'``) in which
+    it ran. Only the last *max_runs* runs of each test are kept. The database can be safely shared
+    between concurrently running sessions (e.g. shards of ``gramine-test pytest --jobs N``).
+
+    Args:
+        path (path-like or None): path to the database file; it will be created if it does not
+            exist (default: :py:func:`default_path`)
+        max_runs (int): number of most recent runs of each test kept in the database
+
+    Raises:
+        OSError: when the directory for the database could not be created
+        sqlite3.Error: when the database could not be opened
+        RuntimeError: when *path* is not given and the cache directory could not be determined
+    """
+    def __init__(self, path=None, *, max_runs=DEFAULT_MAX_RUNS):
+        path = default_path() if path is None else pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        #: path to the database file
+        self.path = path
+        #: number of most recent runs of each test kept in the database
+        self.max_runs = max_runs
+
+        # large timeout, because concurrent sessions may be waiting for each other's commits
+        self._db = sqlite3.connect(os.fspath(path), timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._db:
+            self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_session(self, mode, start_time, results):
+        """Record durations of tests run in one session.
+
+        Args:
+            mode (str): ``'direct'`` or ``'sgx'``
+            start_time (float): UNIX time at which the session started
+            results (dict): mapping of node ID to ``(duration, outcome)``, with the duration in
+                seconds and the outcome as reported by Pytest (``'passed'``, ``'failed'``, ...)
+        """
+        with self._db:
+            self._db.executemany('INSERT INTO durations VALUES (?, ?, ?, ?, ?)',
+                ((nodeid, mode, start_time, duration, outcome)
+                    for nodeid, (duration, outcome) in results.items()))
+            self._db.executemany(
+                'DELETE FROM durations WHERE mode = ? AND nodeid = ? AND rowid NOT IN '
+                    '(SELECT rowid FROM durations WHERE mode = ? AND nodeid = ? '
+                        'ORDER BY start_time DESC LIMIT ?)',
+                ((mode, nodeid, mode, nodeid, self.max_runs) for nodeid in results))
+
+    def history(self, mode, *, before=None):
+        """Get durations of successful runs of all tests.
+
+        Args:
+            mode (str): ``'direct'`` or ``'sgx'``
+            before (float or None): if given, consider only sessions started before this UNIX time
+
+        Returns:
+            dict: mapping of node ID to list of durations, from the oldest to the most recent run
+        """
+        history = {}
+        for nodeid, duration in self._db.execute(
+                'SELECT nodeid, duration FROM durations '
+                    'WHERE mode = ? AND outcome = \'passed\' AND start_time < ? '
+                    'ORDER BY nodeid, start_time',
+                (mode, float('inf') if before is None else before)):
+            history.setdefault(nodeid, []).append(duration)
+        return history
+
+    def expected_durations(self, mode, *, before=None, window=DEFAULT_WINDOW):
+        """Get expected duration of each test, which is the median of its last *window* successful
+        runs.
+
+        Args:
+            mode (str): ``'direct'`` or ``'sgx'``
+            before (float or None): if given, consider only sessions started before this UNIX time
+            window (int): number of most recent runs to take into account
+
+        Returns:
+            dict: mapping of node ID to duration in seconds
+        """
+        return {nodeid: statistics.median(durations[-window:])
+            for nodeid, durations in self.history(mode, before=before).items()}
+
+    def close(self):
+        """Close the database."""
+        if self._db is None:
+            return
+        self._db.close()
+        self._db = None
+
+
+def open_duration_db(path=None, **kwargs):
+    """Open the database, printing a warning if it is not available.
+
+    A broken database (e.g. read-only cache directory) should not make the tests fail.
+
+    Args:
+        path (path-like or None): path to the database file (default: :py:func:`default_path`)
+        **kwargs: passed to :py:class:`DurationDB`
+
+    Returns:
+        DurationDB or None: the opened database
+    """
+    try:
+        if path is None:
+            path = default_path()
+        return DurationDB(path, **kwargs)
+    except (OSError, sqlite3.Error, RuntimeError) as err:
+        where = '' if path is None else f' {os.fspath(path)!r}'
+        print(f'WARNING: could not open test durations database{where}: {err!s}', file=sys.stderr)
+        return None
+
+
+def assign_shards(durations, count, groups=None):
+    """Split tests between shards, so that all shards take about the same time.
+
+    Tests in a group are assigned to the same shard, because they may share setup (like
+    ``setUpClass()``), which should not run in each shard. Longest groups are assigned first, each
+    one to the shard which has the least work so far. Groups of equal durations are assigned
+    round-robin.
+
+    Args:
+        durations (list of float): expected duration of each test
+        count (int): number of shards
+        groups (list or None): for each test, the group it belongs to (any hashable value, e.g.
+            ``(module, class)``); if not given, each test is a group of its own
+
+    Returns:
+        list of int: index of shard for each test
+    """
+    groups = list(range(len(durations)) if groups is None else groups)
+    totals = {}
+    for group, duration in zip(groups, durations):
+        totals[group] = totals.get(group, 0) + duration
+
+    group_shards = {}
+    loads = [(0, shard) for shard in range(count)]
+    # stable sort, so groups of equal durations keep their order
+    for group in sorted(totals, key=lambda group: -totals[group]):
+        load, shard = heapq.heappop(loads)
+        group_shards[group] = shard
+        heapq.heappush(loads, (load + totals[group], shard))
+    return [group_shards[group] for group in groups]
+
+
+def order_longest_first(groups, durations):
+    """Order tests so that the longest groups of tests run first.
+
+    Tests in a group (e.g. module or class) are kept together and in their original order, because
+    they may share setup (like ``setUpClass()``) or depend on each other.
+
+    Args:
+        groups (list of tuple): for each test, the groups it belongs to, from the outermost one
+            (e.g. ``(module, class)``); all tuples should have the same length
+        durations (list of float): expected duration of each test
+
+    Returns:
+        list of int: indices of tests in the new order
+    """
+    totals = {}
+    first = {}
+    for i, (test_groups, duration) in enumerate(zip(groups, durations)):
+        for level in range(1, len(test_groups) + 1):
+            prefix = test_groups[:level]
+            totals[prefix] = totals.get(prefix, 0) + duration
+            first.setdefault(prefix, i)
+
+    def sort_key(i):
+        key = []
+        for level in range(1, len(groups[i]) + 1):
+            prefix = groups[i][:level]
+            key += (-totals[prefix], first[prefix])
+        key.append(i)
+        return key
+
+    return sorted(range(len(groups)), key=sort_key)
+
+
+def find_regressions(durations, expected, *, threshold=DEFAULT_THRESHOLD,
+        min_increase=MIN_INCREASE):
+    """Find tests which took much longer than expected.
+
+    Args:
+        durations (dict): mapping of node ID to duration in seconds
+        expected (dict): mapping of node ID to expected duration in seconds (tests missing here
+            are not considered)
+        threshold (float): how much longer (as a fraction of the expected duration) a test must
+            take to be reported
+        min_increase (float): how much longer (in seconds) a test must take to be reported
+
+    Returns:
+        list of tuple: ``(nodeid, duration, expected_duration)``, the largest relative slowdowns
+        first
+    """
+    regressions = [(nodeid, duration, expected[nodeid])
+        for nodeid, duration in durations.items()
+        if nodeid in expected
+            and duration > expected[nodeid] * (1 + threshold)
+            and duration - expected[nodeid] >= min_increase]
+    regressions.sort(key=lambda regression: regression[2] / regression[1])
+    return regressions
+
+
+def summarize(history, *, runs, window=DEFAULT_WINDOW):
+    """Summarize durations of a test for a report.
+
+    Args:
+        history (list of float): durations of successful runs, from the oldest one
+        runs (int): number of most recent durations to include in the summary
+        window (int): number of runs before the last one, from which the usual duration is computed
+
+    Returns:
+        dict: ``runs`` (number of recorded runs), ``last`` (duration of the last run), ``median``
+        (median of *window* runs before the last one, or :py:obj:`None` if there are none),
+        ``change`` (relative change of the last run against the median, or :py:obj:`None`) and
+        ``recent`` (list of at most *runs* most recent durations)
+    """
+    last = history[-1]
+    previous = history[-window - 1:-1]
+    median = statistics.median(previous) if previous else None
+    return {
+        'runs': len(history),
+        'last': last,
+        'median': median,
+        'change': last / median - 1 if median else None,
+        'recent': history[-runs:],
+    }
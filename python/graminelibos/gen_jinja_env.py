@@ -1,12 +1,18 @@
+import functools
+import hashlib
+import json
 import os
 import pathlib
+import shutil
 import subprocess
 import sys
 import sysconfig
+import tempfile
 
-import jinja2
+from . import __version__, _CONFIG_PKGLIBDIR
 
-from . import _CONFIG_PKGLIBDIR
+#: path to the default loader entrypoint (LibOS)
+LIBOS_PATH = pathlib.Path(_CONFIG_PKGLIBDIR) / 'libsysdb.so'
 
 def parse_ldd(output):
     # Be careful: We have to skip vdso, which doesn't have a corresponding file on the disk (we
@@ -28,19 +34,173 @@ def parse_ldd(output):
             ret.add(line[0])
     return sorted(ret)
 
-def ldd(*args):
+@functools.lru_cache(maxsize=None)
+def _get_dependency_resolver(root):
+    from .ldd import DependencyResolver # pylint: disable=import-outside-toplevel
+    return DependencyResolver(root)
+
+def ldd(*args, root=None):
     '''
     Args:
         binaries for which to generate manifest trusted files list.
+        root: optional path to chroot, in which the binaries and libraries are to be found
+
+    The libraries are found without running the binaries (see :py:mod:`graminelibos.ldd`), and
+    parsed ELF files are remembered, so calling this multiple times is cheap.
+    '''
+    return _get_dependency_resolver(None if root is None else os.fspath(root)).resolve(*args)
+
+_PYTHON_PROBE_CACHE_VERSION = 1
+_PYTHON_PROBE_CACHE_MAX_ENTRIES = 64
+
+# environment variables which influence sys.path of the interpreter
+_PYTHON_PROBE_ENVIRON = ('HOME', 'PYTHONHOME', 'PYTHONNOUSERSITE', 'PYTHONPATH', 'PYTHONPLATLIBDIR',
+    'PYTHONSAFEPATH', 'PYTHONUSERBASE')
+
+# Run in the probed interpreter, which might be a different version than ours. Besides the results,
+# it reports the directories which could change sys.path (site-packages, where .pth files are read
+# from, even if they don't exist yet), to validate the cached results against.
+_PYTHON_PROBE_SCRIPT = '''\
+import json, site, sys, sysconfig
+watch = list(sys.path)
+for func in ('getsitepackages', 'getusersitepackages'):
+    try:
+        paths = getattr(site, func)()
+    except AttributeError:
+        continue
+    watch.extend([paths] if isinstance(paths, str) else paths)
+json.dump({
+    'watch': [path for path in watch if path],
+    'results': [eval(expr) for expr in json.loads(sys.argv[1])],
+}, sys.stdout)
+'''
+
+def _python_probe_cache_path():
+    from .hash_cache import get_cache_dir # pylint: disable=import-outside-toplevel
+    try:
+        return get_cache_dir() / 'python-probes.json'
+    except RuntimeError:
+        # no cache directory, the results will be only kept in memory
+        return None
+
+def _stat_watched(paths):
+    ret = []
+    for path in paths:
+        try:
+            ret.append([path, os.stat(path).st_mtime_ns])
+        except OSError:
+            ret.append([path, None])
+    return ret
+
+class _PythonProbeCache:
+    # Maps (interpreter, its fingerprint, environment) to watched directories with their mtimes and
+    # results of the expressions evaluated so far. Stored as JSON, because it's small and loaded as
+    # a whole by each gramine-manifest run. Without a path, it is kept only in memory.
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path is None:
+            return
+        try:
+            with open(path, 'rb') as file:
+                data = json.load(file)
+            if data['version'] != _PYTHON_PROBE_CACHE_VERSION:
+                raise ValueError('unsupported version')
+            self.entries = data['entries']
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+
+    def save(self):
+        if self.path is None:
+            return
+        while len(self.entries) > _PYTHON_PROBE_CACHE_MAX_ENTRIES:
+            del self.entries[next(iter(self.entries))]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=self.path.parent, prefix=self.path.name,
+                    suffix='.tmp', delete=False) as file:
+                json.dump({'version': _PYTHON_PROBE_CACHE_VERSION, 'entries': self.entries}, file)
+            os.replace(file.name, self.path)
+        except OSError:
+            # the cache is only an optimisation, builds should not fail because of it
+            pass
+
+@functools.lru_cache(maxsize=None)
+def _get_python_probe_cache():
+    return _PythonProbeCache(_python_probe_cache_path())
+
+def clear_python_probe_cache():
+    '''Invalidate results of :py:func:`python_query` cached on disk.'''
+    path = _python_probe_cache_path()
+    if path is not None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    _get_python_probe_cache.cache_clear()
+
+def python_query(interpreter, *expressions):
+    '''Evaluate Python expressions in another interpreter, all in one subprocess.
+
+    The expressions are evaluated with ``sys``, ``site`` and ``sysconfig`` modules imported, and
+    their values must be serialisable as JSON. The results are cached on disk, keyed by path, inode
+    and mtime of the interpreter and by environment variables which influence ``sys.path``. They
+    are also invalidated when any ``sys.path`` or site-packages directory is modified (e.g. a
+    package with ``.pth`` file is installed). To drop them explicitly, use
+    :py:func:`clear_python_probe_cache` or remove :file:`~/.cache/gramine/python-probes.json`.
+
+    Args:
+        interpreter (path-like): the interpreter, either path or name to be searched in ``$PATH``
+        expressions (str): the expressions to evaluate
+
+    Returns:
+        list: values of the expressions
     '''
-    return parse_ldd(
-        subprocess.check_output(['ldd', *(os.fspath(i) for i in args)]).decode('ascii'))
+    # pylint: disable=import-outside-toplevel
+    from .hash_cache import fingerprint
+
+    interpreter = os.fspath(interpreter)
+    resolved = shutil.which(interpreter)
+    if resolved is None:
+        # let subprocess report the error
+        resolved = interpreter
+    else:
+        resolved = os.path.abspath(resolved)
+
+    try:
+        key = json.dumps([resolved, fingerprint(os.stat(resolved)),
+            [os.environ.get(name) for name in _PYTHON_PROBE_ENVIRON]])
+    except OSError:
+        key = None
+
+    cache = _get_python_probe_cache()
+    entry = cache.entries.get(key)
+    if entry is not None and (
+            _stat_watched(path for path, _mtime in entry['watch']) != entry['watch']):
+        entry = None
+    if entry is not None and all(expr in entry['results'] for expr in expressions):
+        return [entry['results'][expr] for expr in expressions]
+
+    # evaluate everything that was cached before, so the entry stays consistent with the watched
+    # directories
+    results = entry['results'] if entry is not None else {}
+    to_evaluate = list(dict.fromkeys([*results, *expressions]))
+    output = json.loads(subprocess.check_output([resolved, '-c', _PYTHON_PROBE_SCRIPT,
+        json.dumps(to_evaluate)]))
+    results = dict(zip(to_evaluate, output['results']))
+
+    if key is not None:
+        cache.entries.pop(key, None)
+        cache.entries[key] = {'watch': _stat_watched(output['watch']), 'results': results}
+        cache.save()
+    return [results[expr] for expr in expressions]
 
 def python_get_sys_path(interpreter, include_nonexisting=False):
-    for path in subprocess.check_output([interpreter, '-c',
-        '''import sys; print('\\0'.join(path for path in sys.path if path), end='')'''
-    ]).split(b'\0'):
-        path = pathlib.Path(os.fsdecode(path))
+    sys_path, = python_query(interpreter, 'sys.path')
+    for path in sys_path:
+        if not path:
+            continue
+        path = pathlib.Path(path)
         if not include_nonexisting and not path.exists():
             continue
         yield path
@@ -66,6 +226,7 @@ def add_globals_from_python(env):
         'implementation': sys.implementation,
 
         'get_sys_path': python_get_sys_path,
+        'query': python_query,
     }
 
 class Runtimedir:
@@ -79,7 +240,7 @@ class Runtimedir:
 
 def add_globals_from_gramine(env):
     env.globals['gramine'] = {
-        'libos': pathlib.Path(_CONFIG_PKGLIBDIR) / 'libsysdb.so',
+        'libos': LIBOS_PATH,
         'pkglibdir': pathlib.Path(_CONFIG_PKGLIBDIR),
         'runtimedir': Runtimedir(),
     }
@@ -97,13 +258,73 @@ def add_globals_misc(env):
     env.globals['env'] = os.environ
     env.globals['ldd'] = ldd
 
+def make_bytecode_cache():
+    """Create persistent cache of compiled templates.
+
+    Compiling a template is most of the time spent rendering it, and the same manifest templates are
+    rendered again on each build. The compiled code is stored in a subdirectory of
+    :py:func:`graminelibos.hash_cache.get_cache_dir`, separately for each version of Gramine
+    (which defines the filters, tests and globals which the code refers to).
+
+    Returns:
+        jinja2.BytecodeCache or None: the cache, or :py:obj:`None` if the cache directory is not
+        known or not writable
+    """
+    # pylint: disable=import-outside-toplevel
+    import jinja2
+    from .hash_cache import get_cache_dir
+
+    try:
+        directory = get_cache_dir() / 'templates'
+        directory.mkdir(parents=True, exist_ok=True)
+    except (OSError, RuntimeError):
+        return None
+    if not os.access(directory, os.W_OK):
+        return None
+    return jinja2.FileSystemBytecodeCache(os.fspath(directory), f'{__version__}-%s.cache')
+
 def make_env():
+    import jinja2 # pylint: disable=import-outside-toplevel
 
     # Jinja's autoescape feature escapes HTML sequences but we're rendering TOML, hence explicitly
     # setting autoescape to False
     env = jinja2.Environment(undefined=jinja2.StrictUndefined, keep_trailing_newline=True,
-                             autoescape=False)
+                             autoescape=False,
+                             # templates are loaded by absolute path, see get_template()
+                             loader=jinja2.FileSystemLoader('/'),
+                             bytecode_cache=make_bytecode_cache())
     add_globals_from_gramine(env)
     add_globals_from_python(env)
     add_globals_misc(env)
     return env
+
+@functools.lru_cache(maxsize=None)
+def get_env():
+    """Return the environment shared by all manifests, creating it on first use."""
+    return make_env()
+
+def get_template(template):
+    """Compile a template in the shared environment, using the cache of compiled templates.
+
+    Args:
+        template (str or path-like): source of the template, or path to the template file
+
+    Returns:
+        jinja2.Template: the compiled template
+    """
+    env = get_env()
+    if isinstance(template, os.PathLike):
+        return env.get_template(os.path.abspath(template))
+
+    bytecode_cache = env.bytecode_cache
+    if bytecode_cache is None:
+        return env.from_string(template)
+
+    # from_string() does not use the cache, so do what the loader would do, with the hash of the
+    # source as template name
+    bucket = bytecode_cache.get_bucket(env, hashlib.sha256(template.encode()).hexdigest(), None,
+        template)
+    if bucket.code is None:
+        bucket.code = env.compile(template)
+        bytecode_cache.set_bucket(bucket)
+    return env.template_class.from_code(env, bucket.code, env.make_globals(None))
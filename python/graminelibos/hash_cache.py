@@ -0,0 +1,351 @@
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Persistent cache of trusted files' hashes
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import random
+import sqlite3
+import sys
+import time
+
+import tomli
+
+#: name of the hash cache file in :py:func:`get_cache_dir`
+HASH_CACHE_FILENAME = 'trusted-files.sqlite3'
+DEFAULT_HASH_CACHE_MAX_ENTRIES = 1000000
+
+# Files modified less than this many seconds before they were measured are not cached. Filesystems
+# with coarse timestamps could otherwise let a subsequent modification go unnoticed (the same
+# problem as "racy git", see Documentation/technical/racy-git.txt in git.git).
+_RACY_WINDOW = 2
+
+#: suffix appended to the path of .manifest.sgx to get the path of its fingerprints file
+BASELINE_SUFFIX = '.fingerprints.json'
+_BASELINE_VERSION = 1
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS hashes (
+        dev INTEGER NOT NULL,
+        ino INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        last_used INTEGER NOT NULL,
+        PRIMARY KEY (dev, ino, size, mtime_ns)
+    )
+'''
+
+def get_cache_dir():
+    """Return the directory of Gramine's persistent caches.
+
+    This is :file:`$XDG_CACHE_HOME/gramine`, by default :file:`~/.cache/gramine`. The home directory
+    is looked up only if ``XDG_CACHE_HOME`` is not set, because it may be unknown (e.g. for a user
+    without an entry in :file:`/etc/passwd`, as is common in containers).
+
+    Returns:
+        pathlib.Path: the directory, which might not exist yet
+
+    Raises:
+        RuntimeError: when ``XDG_CACHE_HOME`` is not set and the home directory could not be
+            determined
+    """
+    xdg_cache_home = os.getenv('XDG_CACHE_HOME')
+    if xdg_cache_home:
+        return pathlib.Path(xdg_cache_home) / 'gramine'
+
+    try:
+        home = pathlib.Path.home()
+    except KeyError as err:
+        # Python < 3.10 doesn't convert the error from pwd.getpwuid()
+        raise RuntimeError('Could not determine home directory') from err
+    return home / '.cache' / 'gramine'
+
+
+def fingerprint(stat_result):
+    """Return the key under which the file contents are cached.
+
+    Args:
+        stat_result (os.stat_result): result of :py:func:`os.stat` on the file
+
+    Returns:
+        tuple: ``(dev, inode, size, mtime_ns)``
+    """
+    return (stat_result.st_dev, stat_result.st_ino, stat_result.st_size,
+        stat_result.st_mtime_ns)
+
+
+class HashCache:
+    """On-disk cache of sha256 sums of files.
+
+    Entries are keyed by ``(dev, inode, size, mtime_ns)`` of the file, so that any modification of
+    the file (which updates mtime) invalidates the entry. The cache is stored in SQLite database,
+    which can be safely shared between concurrently running processes.
+
+    Changes are written to disk on :py:meth:`close` (the object can also be used as a context
+    manager). At this point, if there are more than *max_entries* entries, the least recently used
+    ones are evicted.
+
+    Args:
+        path (path-like or None): path to the database file; it will be created if it does not
+            exist (default: :py:data:`HASH_CACHE_FILENAME` in :py:func:`get_cache_dir`)
+        max_entries (int): maximum number of entries kept in the cache
+        verify_ratio (float): fraction of cache hits that should nevertheless be measured and
+            compared with cached value (strict mode); ``0`` disables verification, ``1`` verifies
+            every hit
+
+    Raises:
+        OSError: when the directory for the database could not be created
+        sqlite3.Error: when the database could not be opened
+        RuntimeError: when *path* is not given and the cache directory could not be determined
+    """
+    def __init__(self, path=None, *,
+            max_entries=DEFAULT_HASH_CACHE_MAX_ENTRIES, verify_ratio=0):
+        path = get_cache_dir() / HASH_CACHE_FILENAME if path is None else pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        #: path to the database file
+        self.path = path
+        #: maximum number of entries kept in the cache
+        self.max_entries = max_entries
+        #: fraction of cache hits to be verified
+        self.verify_ratio = verify_ratio
+
+        self._now = int(time.time())
+        self._used = set()
+        self._new = {}
+
+        # large timeout, because concurrent builds may be waiting for each other's commits
+        self._db = sqlite3.connect(os.fspath(path), timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._db:
+            self._db.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, stat_result):
+        """Look up sha256 of a file.
+
+        Args:
+            stat_result (os.stat_result): result of :py:func:`os.stat` on the file
+
+        Returns:
+            str or None: sha256 as str of hex digits, or :py:obj:`None` on cache miss
+        """
+        key = fingerprint(stat_result)
+        try:
+            return self._new[key]
+        except KeyError:
+            pass
+
+        row = self._db.execute(
+            'SELECT sha256 FROM hashes WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?',
+            key).fetchone()
+        if row is None:
+            return None
+        self._used.add(key)
+        return row[0]
+
+    def put(self, stat_result, sha256):
+        """Store sha256 of a file.
+
+        The file should have been stat()-ed before measuring, so that if it was modified in the
+        meantime, the entry will not match on subsequent lookups. Files that were modified too
+        recently are not stored.
+
+        Args:
+            stat_result (os.stat_result): result of :py:func:`os.stat` on the file
+            sha256 (str): sha256 as str of hex digits
+        """
+        if stat_result.st_mtime_ns >= (self._now - _RACY_WINDOW) * 1000000000:
+            return
+        self._new[fingerprint(stat_result)] = sha256
+
+    def discard(self, stat_result):
+        """Remove an entry from the cache.
+
+        Args:
+            stat_result (os.stat_result): result of :py:func:`os.stat` on the file
+        """
+        key = fingerprint(stat_result)
+        self._new.pop(key, None)
+        self._used.discard(key)
+        with self._db:
+            self._db.execute(
+                'DELETE FROM hashes WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?', key)
+
+    def should_verify(self):
+        """Decide whether a cache hit should be verified by measuring the file.
+
+        Returns:
+            bool: :py:obj:`True` for a random sample of calls, according to *verify_ratio*
+        """
+        return random.random() < self.verify_ratio
+
+    def close(self):
+        """Write new entries, evict the least recently used ones and close the database."""
+        if self._db is None:
+            return
+
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+                (key + (sha256, self._now) for key, sha256 in self._new.items()))
+            self._db.executemany(
+                'UPDATE hashes SET last_used = ? '
+                    'WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?',
+                ((self._now,) + key for key in self._used))
+
+            count, = self._db.execute('SELECT COUNT(*) FROM hashes').fetchone()
+            if count > self.max_entries:
+                self._db.execute(
+                    'DELETE FROM hashes WHERE rowid IN '
+                        '(SELECT rowid FROM hashes ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,))
+
+        self._db.close()
+        self._db = None
+
+
+@contextlib.contextmanager
+def open_hash_cache(path=None, *, enabled=True, **kwargs):
+    """Open hash cache, if enabled and available.
+
+    This is meant for command-line tools: a broken cache (e.g. read-only cache directory, or no home
+    directory to put it in) is not fatal, it just causes a warning.
+
+    Args:
+        path (path-like or None): path to the database file (default: see :py:class:`HashCache`)
+        enabled (bool): if :py:obj:`False`, don't open the cache, just return :py:obj:`None`
+        **kwargs: passed to :py:class:`HashCache`
+
+    Yields:
+        HashCache or None: the opened cache
+    """
+    if not enabled:
+        yield None
+        return
+
+    try:
+        if path is None:
+            path = get_cache_dir() / HASH_CACHE_FILENAME
+        hash_cache = HashCache(path, **kwargs)
+    except (OSError, sqlite3.Error, RuntimeError) as err:
+        where = '' if path is None else f' {os.fspath(path)!r}'
+        print(f'WARNING: could not open hash cache{where}: {err!s}', file=sys.stderr)
+        yield None
+        return
+
+    with hash_cache:
+        yield hash_cache
+
+
+class Baseline:
+    """Trusted files measured in a previous build.
+
+    This is an alternative to :py:class:`HashCache`, which does not need any state outside of the
+    build directory. The baseline consists of previously generated ``.manifest.sgx`` file, which
+    contains sha256 of each trusted file, and a sidecar file (with :py:data:`BASELINE_SUFFIX`
+    appended to the name of the manifest), which contains stat() fingerprints of those files, as of
+    the time of measurement. A file whose fingerprint didn't change since then doesn't need to be
+    measured again.
+
+    While the trusted files are expanded, the current fingerprints are collected, so they can be
+    written with :py:meth:`save` next to the new manifest, to serve as the baseline for the next
+    build.
+
+    Args:
+        hashes (dict or None): mapping of URI to ``(fingerprint, sha256)``
+    """
+    def __init__(self, hashes=None):
+        self._hashes = hashes or {}
+        self._fingerprints = {}
+        self._now = int(time.time())
+
+    @classmethod
+    def load(cls, path):
+        """Load baseline from a previously generated manifest and its sidecar file.
+
+        A missing manifest is not an error (this is the case in the first build), it just gives an
+        empty baseline. So does a missing or outdated sidecar file, which causes a warning.
+
+        Args:
+            path (path-like): path to the ``.manifest.sgx`` file
+
+        Returns:
+            Baseline: the baseline
+        """
+        try:
+            with open(path, 'rb') as file:
+                manifest_bytes = file.read()
+        except FileNotFoundError:
+            return cls()
+
+        sidecar_path = os.fspath(path) + BASELINE_SUFFIX
+        try:
+            with open(sidecar_path, 'rb') as file:
+                sidecar = json.load(file)
+            if sidecar['version'] != _BASELINE_VERSION:
+                raise ValueError(f'unsupported version {sidecar["version"]!r}')
+            if sidecar['manifest_sha256'] != hashlib.sha256(manifest_bytes).hexdigest():
+                raise ValueError('the manifest was modified')
+            fingerprints = sidecar['files']
+            trusted_files = tomli.loads(manifest_bytes.decode())['sgx']['trusted_files']
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            print(f'WARNING: ignoring baseline {os.fspath(path)!r}: {err!s}', file=sys.stderr)
+            return cls()
+
+        hashes = {}
+        for tf in trusted_files:
+            if isinstance(tf, dict) and tf.get('uri') in fingerprints and 'sha256' in tf:
+                hashes[tf['uri']] = (tuple(fingerprints[tf['uri']]), tf['sha256'])
+        return cls(hashes)
+
+    def get(self, uri, stat_result):
+        """Look up sha256 of a file and remember its fingerprint.
+
+        Args:
+            uri (str): URI of the trusted file
+            stat_result (os.stat_result): result of :py:func:`os.stat` on the file, taken before
+                measuring it (if it is to be measured)
+
+        Returns:
+            str or None: sha256 as str of hex digits, or :py:obj:`None` if the file is not in the
+            baseline or was modified since
+        """
+        key = fingerprint(stat_result)
+        # like in HashCache.put(), files modified too recently are not remembered
+        if stat_result.st_mtime_ns < (self._now - _RACY_WINDOW) * 1000000000:
+            self._fingerprints[uri] = key
+
+        try:
+            old_key, sha256 = self._hashes[uri]
+        except KeyError:
+            return None
+        return sha256 if old_key == key else None
+
+    def save(self, path):
+        """Write the sidecar file for a newly generated manifest.
+
+        Args:
+            path (path-like): path to the ``.manifest.sgx`` file, which should already be written
+        """
+        with open(path, 'rb') as file:
+            manifest_sha256 = hashlib.sha256(file.read()).hexdigest()
+
+        with open(os.fspath(path) + BASELINE_SUFFIX, 'w', encoding='utf-8') as file:
+            json.dump({
+                'version': _BASELINE_VERSION,
+                'manifest_sha256': manifest_sha256,
+                'files': self._fingerprints,
+            }, file)
@@ -0,0 +1,398 @@
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Resolution of shared library dependencies, without running the dynamic loader
+
+This emulates the search done by glibc's ``ld.so`` (see ``ld.so(8)``), by reading the dynamic
+section of ELF files. Unlike :command:`ldd`, it does not execute anything, and it can resolve
+dependencies of binaries inside a chroot.
+"""
+
+import collections
+import functools
+import os
+import pathlib
+import posixpath
+import struct
+import sysconfig
+
+from .manifest import ChrootResolver
+
+LD_SO_CACHE_PATH = '/etc/ld.so.cache'
+
+EM_386 = 3
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+_PT_INTERP = 3
+
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_STRTAB = 5
+_DT_STRSZ = 10
+_DT_SONAME = 14
+_DT_RPATH = 15
+_DT_RUNPATH = 29
+
+_LD_SO_CACHE_MAGIC = b'glibc-ld.so.cache1.1'
+# struct cache_file_new, without libs[] (glibc's sysdeps/generic/dl-cache.h)
+_LD_SO_CACHE_HEADER = struct.Struct('<20sIIB3xI12x')
+# struct file_entry_new
+_LD_SO_CACHE_ENTRY = struct.Struct('<iIIIQ')
+_FLAG_TYPE_MASK = 0x00ff
+_FLAG_ELF_LIBC6 = 0x0003
+_FLAG_REQUIRED_MASK = 0xff00
+# required flags for each (ELF class, e_machine)
+_LD_SO_CACHE_REQUIRED_FLAGS = {
+    (64, EM_X86_64): 0x0300, # FLAG_X8664_LIB64
+    (32, EM_X86_64): 0x0800, # FLAG_X8664_LIBX32
+    (32, EM_386): 0x0000,
+    (64, EM_AARCH64): 0x0a00, # FLAG_AARCH64_LIB64
+}
+
+# dynamic loader, which is loaded also when shared library is given to ldd (instead of executable)
+_DEFAULT_INTERP = {
+    (64, EM_X86_64): '/lib64/ld-linux-x86-64.so.2',
+    (32, EM_386): '/lib/ld-linux.so.2',
+    (64, EM_AARCH64): '/lib/ld-linux-aarch64.so.1',
+}
+
+def _default_library_dirs():
+    dirs = []
+    multiarch = sysconfig.get_config_var('MULTIARCH')
+    if multiarch:
+        dirs.extend([f'/lib/{multiarch}', f'/usr/lib/{multiarch}'])
+    dirs.extend(['/lib64', '/usr/lib64', '/lib', '/usr/lib'])
+    return dirs
+
+#: directories searched after ld.so.cache
+DEFAULT_LIBRARY_DIRS = _default_library_dirs()
+
+
+def parse_ld_so_cache(data):
+    """Parse the contents of ld.so.cache.
+
+    Only the "new" format (written by ldconfig since glibc 2.2, and exclusively since 2.32) is
+    supported. Entries for glibc-hwcaps subdirectories are skipped, because choosing between them
+    depends on the CPU.
+
+    Args:
+        data (bytes): contents of :file:`/etc/ld.so.cache`
+
+    Returns:
+        dict: mapping of ``(soname, required flags)`` to path of the library; when there are
+        multiple entries for a soname, the first one is taken, like ld.so does
+
+    Raises:
+        ValueError: when *data* is not a valid cache
+    """
+    # in the "compat" format, the new format follows the old one
+    offset = data.find(_LD_SO_CACHE_MAGIC)
+    if offset < 0:
+        raise ValueError('unsupported ld.so.cache format')
+    try:
+        _magic, nlibs, _len_strings, _flags, _extension_offset = _LD_SO_CACHE_HEADER.unpack_from(
+            data, offset)
+    except struct.error as err:
+        raise ValueError(f'truncated ld.so.cache: {err!s}') from err
+
+    def get_string(string_offset):
+        string_offset += offset
+        end = data.find(b'\0', string_offset)
+        if end < 0:
+            raise ValueError('truncated ld.so.cache')
+        return os.fsdecode(data[string_offset:end])
+
+    entries = {}
+    entry_offset = offset + _LD_SO_CACHE_HEADER.size
+    for _ in range(nlibs):
+        try:
+            flags, key, value, _osversion, hwcap = _LD_SO_CACHE_ENTRY.unpack_from(
+                data, entry_offset)
+        except struct.error as err:
+            raise ValueError(f'truncated ld.so.cache: {err!s}') from err
+        entry_offset += _LD_SO_CACHE_ENTRY.size
+
+        if (flags & _FLAG_TYPE_MASK) != _FLAG_ELF_LIBC6 or hwcap:
+            continue
+        entries.setdefault((get_string(key), flags & _FLAG_REQUIRED_MASK), get_string(value))
+    return entries
+
+
+class ElfInfo(collections.namedtuple('ElfInfo',
+        'elfclass machine interp soname needed rpath runpath')):
+    """Information about ELF file needed to resolve its dependencies.
+
+    Attributes:
+        elfclass (int): 32 or 64
+        machine (int): ``e_machine``, like :py:data:`EM_X86_64`
+        interp (str or None): ``PT_INTERP`` (path to the dynamic loader)
+        soname (str or None): ``DT_SONAME``
+        needed (list): ``DT_NEEDED`` entries
+        rpath (list): ``DT_RPATH`` entries, split on ``:``
+        runpath (list): ``DT_RUNPATH`` entries, split on ``:``
+    """
+    __slots__ = ()
+
+# (ELF header from e_type to e_phnum, program header, dynamic entry) for each ELF class
+_ELF_STRUCTS = {
+    32: ('16xHHIIIIIHHH', 'IIIIIIII', 'iI'),
+    64: ('16xHHIQQQIHHH', 'IIQQQQQQ', 'qQ'),
+}
+
+def _parse_elf(file):
+    ident = file.read(16)
+    if len(ident) < 16 or ident[:4] != b'\x7fELF':
+        return None
+    elfclass = {1: 32, 2: 64}.get(ident[4])
+    byteorder = {1: '<', 2: '>'}.get(ident[5])
+    if elfclass is None or byteorder is None:
+        return None
+    ehdr_fmt, phdr_fmt, dyn_fmt = (struct.Struct(byteorder + fmt)
+        for fmt in _ELF_STRUCTS[elfclass])
+
+    def read_at(offset, size):
+        file.seek(offset)
+        data = file.read(size)
+        if len(data) < size:
+            raise ValueError('truncated ELF file')
+        return data
+
+    file.seek(0)
+    _type, machine, _version, _entry, phoff, _shoff, _flags, _ehsize, phentsize, phnum = (
+        ehdr_fmt.unpack(file.read(ehdr_fmt.size)))
+
+    loads = []
+    interp = dynamic = None
+    phdrs = read_at(phoff, phentsize * phnum)
+    for i in range(phnum):
+        phdr = phdr_fmt.unpack_from(phdrs, i * phentsize)
+        if elfclass == 32:
+            p_type, p_offset, p_vaddr, _paddr, p_filesz, _memsz, _flags, _align = phdr
+        else:
+            p_type, _flags, p_offset, p_vaddr, _paddr, p_filesz, _memsz, _align = phdr
+        if p_type == _PT_LOAD:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == _PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+        elif p_type == _PT_INTERP:
+            interp = os.fsdecode(read_at(p_offset, p_filesz).split(b'\0', 1)[0])
+
+    tags = []
+    strtab_addr = strsz = None
+    if dynamic is not None:
+        data = read_at(*dynamic)
+        for tag, val in dyn_fmt.iter_unpack(data[:len(data) - len(data) % dyn_fmt.size]):
+            if tag == _DT_NULL:
+                break
+            if tag == _DT_STRTAB:
+                strtab_addr = val
+            elif tag == _DT_STRSZ:
+                strsz = val
+            elif tag in (_DT_NEEDED, _DT_SONAME, _DT_RPATH, _DT_RUNPATH):
+                tags.append((tag, val))
+
+    strings = {_DT_NEEDED: [], _DT_SONAME: [], _DT_RPATH: [], _DT_RUNPATH: []}
+    if tags:
+        if strtab_addr is None or strsz is None:
+            raise ValueError('no string table')
+        # DT_STRTAB is an address, which needs to be translated to offset in the file
+        for p_vaddr, p_offset, p_filesz in loads:
+            if p_vaddr <= strtab_addr < p_vaddr + p_filesz:
+                strtab = read_at(strtab_addr - p_vaddr + p_offset, strsz)
+                break
+        else:
+            raise ValueError('string table not in any segment')
+        for tag, val in tags:
+            strings[tag].append(os.fsdecode(strtab[val:strtab.index(b'\0', val)]))
+
+    return ElfInfo(elfclass, machine, interp, next(iter(strings[_DT_SONAME]), None),
+        strings[_DT_NEEDED],
+        [entry for value in strings[_DT_RPATH] for entry in value.split(':')],
+        [entry for value in strings[_DT_RUNPATH] for entry in value.split(':')])
+
+@functools.lru_cache(maxsize=None)
+def read_elf_info(path):
+    """Read information about dependencies of an ELF file.
+
+    Only the program headers and the dynamic section are read, so this is much faster than full
+    parsing with elftools. Results are remembered for the rest of the process, so the files should
+    not be modified in the meantime.
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        ElfInfo or None: the information, or :py:obj:`None` if the file is not a valid ELF file
+
+    Raises:
+        OSError: when the file could not be read
+    """
+    with open(path, 'rb') as file:
+        try:
+            return _parse_elf(file)
+        except (ValueError, struct.error):
+            return None
+
+
+class _LoadedObject(collections.namedtuple('_LoadedObject', 'path info loader')):
+    __slots__ = ()
+
+class DependencyResolver:
+    """Finds shared libraries loaded by executables, like :command:`ldd` does.
+
+    The search order is that of glibc's ld.so: ``DT_RPATH`` of the object and the objects which
+    loaded it (only if the object has no ``DT_RUNPATH``), ``LD_LIBRARY_PATH``, ``DT_RUNPATH`` of
+    the object, :file:`/etc/ld.so.cache` and finally the default directories. ``$ORIGIN`` is
+    expanded; other dynamic string tokens (``$LIB``, ``$PLATFORM``) are not supported and entries
+    containing them are skipped. Libraries of different ELF class or machine than the executable
+    are skipped, like ld.so does. The dynamic loader itself (``PT_INTERP``) is not included in the
+    results, and libraries which could not be found are silently omitted, both like in the output of
+    :command:`ldd`.
+
+    Args:
+        root (path-like or None): if not :py:obj:`None`, path to chroot in which the executables and
+            libraries are to be resolved; all paths (arguments and results) are then as seen inside
+            the chroot
+        library_path (list or None): directories to search before ``DT_RUNPATH``; by default, taken
+            from ``LD_LIBRARY_PATH`` environment variable, unless *root* is given
+    """
+    def __init__(self, root=None, library_path=None):
+        self.root = pathlib.Path(root) if root is not None else None
+        self._resolver = ChrootResolver(root) if root is not None else None
+        if library_path is None:
+            library_path = [] if root is not None else [
+                path for path in os.environ.get('LD_LIBRARY_PATH', '').split(':') if path]
+        self.library_path = library_path
+
+        try:
+            with open(self._outer(LD_SO_CACHE_PATH), 'rb') as file:
+                self._ld_so_cache = parse_ld_so_cache(file.read())
+        except (OSError, ValueError):
+            self._ld_so_cache = {}
+
+    def _outer(self, path):
+        # path as seen from outside of chroot
+        if self.root is None:
+            return path
+        try:
+            path = self._resolver.resolve(path)
+        except OSError:
+            # e.g. a path like /lib/file/ENOTDIR, will fail when reading
+            pass
+        return os.fspath(self.root / pathlib.PurePosixPath(path).relative_to('/'))
+
+    def _read(self, path):
+        try:
+            return read_elf_info(self._outer(path))
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+
+    def _expand_origin(self, entry, obj):
+        origin = posixpath.dirname(obj.path)
+        for token in ('${ORIGIN}', '$ORIGIN'):
+            entry = entry.replace(token, origin)
+        if '$' in entry:
+            return None
+        return entry
+
+    def _search_dirs(self, obj):
+        if not obj.info.runpath:
+            loader = obj
+            while loader is not None:
+                if not loader.info.runpath:
+                    for entry in loader.info.rpath:
+                        yield self._expand_origin(entry, loader)
+                loader = loader.loader
+        yield from self.library_path
+        for entry in obj.info.runpath:
+            yield self._expand_origin(entry, obj)
+
+    def _find(self, name, obj, main):
+        def matches(info):
+            return info is not None and (info.elfclass, info.machine) == (
+                main.info.elfclass, main.info.machine)
+
+        if '/' in name:
+            info = self._read(name)
+            return (name, info) if matches(info) else (None, None)
+
+        for directory in self._search_dirs(obj):
+            if directory is None:
+                continue
+            # empty entry means current directory, like in $PATH
+            path = posixpath.join(directory or '.', name)
+            info = self._read(path)
+            if matches(info):
+                return path, info
+
+        required = _LD_SO_CACHE_REQUIRED_FLAGS.get((main.info.elfclass, main.info.machine))
+        path = self._ld_so_cache.get((name, required))
+        if path is not None:
+            info = self._read(path)
+            if matches(info):
+                return path, info
+
+        for directory in DEFAULT_LIBRARY_DIRS:
+            path = posixpath.join(directory, name)
+            info = self._read(path)
+            if matches(info):
+                return path, info
+
+        return None, None
+
+    def resolve(self, *executables):
+        """Find all shared libraries needed by executables.
+
+        Args:
+            executables (path-like): executables or shared libraries to resolve
+
+        Returns:
+            list: sorted paths to the libraries (as str), each at most once
+
+        Raises:
+            OSError: when an executable could not be read
+        """
+        ret = set()
+        for executable in executables:
+            ret.update(self._resolve_one(os.fspath(executable)))
+        return sorted(ret)
+
+    def _resolve_one(self, executable):
+        info = read_elf_info(self._outer(executable))
+        if info is None:
+            return set()
+        main = _LoadedObject(executable, info, None)
+
+        # names (DT_NEEDED and sonames) of the objects that are already loaded
+        loaded = {}
+        interp = info.interp or _DEFAULT_INTERP.get((info.elfclass, info.machine))
+        if interp is not None:
+            interp_info = self._read(interp)
+            loaded[posixpath.basename(interp)] = interp
+            if interp_info is not None and interp_info.soname is not None:
+                loaded[interp_info.soname] = interp
+
+        libraries = set()
+        # dependencies are loaded breadth-first, which matters for which RPATH finds a library
+        queue = collections.deque([main])
+        while queue:
+            obj = queue.popleft()
+            for name in obj.info.needed:
+                if name in loaded:
+                    continue
+                path, lib_info = self._find(name, obj, main)
+                if path is None:
+                    continue
+                loaded[name] = path
+                if lib_info.soname is not None:
+                    loaded.setdefault(lib_info.soname, path)
+                if path in libraries:
+                    continue
+                libraries.add(path)
+                queue.append(_LoadedObject(path, lib_info, obj))
+
+        return libraries
@@ -10,23 +10,50 @@
 Gramine manifest management and rendering
 """
 
+import concurrent.futures
 import errno
 import hashlib
+import mmap
 import os
 import pathlib
 import posixpath
+import re
+import secrets
 import sys
 
 import tomli
 import tomli_w
 
-from . import _env
-from .manifest_check import GramineManifestSchema
+from .gen_jinja_env import LIBOS_PATH, get_template
 
 DEFAULT_ENCLAVE_SIZE_NO_EDMM = '256M'
 DEFAULT_ENCLAVE_SIZE_WITH_EDMM = '1024G'  # 1TB; note that DebugInfo is at 1TB and ASan at 1.5TB
 DEFAULT_THREAD_NUM = 4
 
+# heuristics for choosing between thread pool and process pool, see hash_trusted_files()
+_PROCESS_POOL_MIN_FILES = 1024
+_PROCESS_POOL_MAX_AVG_SIZE = 64 * 1024
+
+# buffer sizes for hash_file(), see tests/benchmarks/bench_hash_file.py
+_HASH_MMAP_MIN_SIZE = 1024 * 1024
+_HASH_MMAP_CHUNK_SIZE = 16 * 1024 * 1024
+_HASH_MIN_BUFFER_SIZE = 4 * 1024
+_HASH_MAX_BUFFER_SIZE = 256 * 1024
+
+# number of trusted files serialised at once by Manifest.dump()
+_DUMP_BATCH_SIZE = 1024
+
+# characters that need escaping in TOML basic strings
+_TOML_ESCAPE = re.compile(r'[\x00-\x08\x0a-\x1f\x7f"\\]')
+_TOML_COMPACT_ESCAPES = {
+    '\b': '\\b',
+    '\n': '\\n',
+    '\f': '\\f',
+    '\r': '\\r',
+    '"': '\\"',
+    '\\': '\\\\',
+}
+
 class ManifestError(Exception):
     """Thrown at errors in manifest parsing and handling.
 
@@ -38,81 +65,196 @@ def uri2path(uri):
         raise ManifestError(f'Unsupported URI type: {uri}')
     return pathlib.Path(uri[len('file:'):])
 
+def _hash_readinto(sha, file, size):
+    # Read directly into preallocated buffer, sized to the file so that small files don't pay for
+    # allocating large buffer. +1 is so that for regular files the second read() returns EOF. The
+    # lower bound is for files which report size 0, but have contents (like in /proc).
+    buffer = bytearray(max(_HASH_MIN_BUFFER_SIZE, min(size + 1, _HASH_MAX_BUFFER_SIZE)))
+    with memoryview(buffer) as view:
+        while True:
+            length = file.readinto(buffer)
+            if not length:
+                break
+            sha.update(view[:length])
+
+def _hash_mmap(sha, file):
+    # NOTE: if the file is truncated while mapped, we'll get SIGBUS. Trusted files are not supposed
+    # to be modified during build, so this is not considered a problem.
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mmap, 'MADV_SEQUENTIAL'): # python >= 3.8
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            for offset in range(0, len(view), _HASH_MMAP_CHUNK_SIZE):
+                sha.update(view[offset:offset + _HASH_MMAP_CHUNK_SIZE])
+
+def hash_file(path):
+    """Calculate sha256 of a file.
+
+    Large files are mapped into memory and hashed without copying; if the file can't be mapped
+    (e.g. it's on a filesystem that does not support :manpage:`mmap(2)`), or is small enough that
+    mapping doesn't pay off, it is read into a buffer instead.
 
-# loosely based on posixpath._joinrealpath
-def resolve_symlinks(path, *, chroot, seen=None):
+    Args:
+        path (path-like): path to the file
+
+    Returns:
+        str: sha256 of the file contents as hex digits
+    """
+    with open(path, 'rb', buffering=0) as file:
+        size = os.fstat(file.fileno()).st_size
+        if size >= _HASH_MMAP_MIN_SIZE:
+            sha = hashlib.sha256()
+            try:
+                _hash_mmap(sha, file)
+            except OSError:
+                pass
+            else:
+                return sha.hexdigest()
+
+        sha = hashlib.sha256()
+        _hash_readinto(sha, file, size)
+        return sha.hexdigest()
+
+
+def resolve_symlinks(path, *, chroot):
     """Resolve symlink inside chroot
 
+    This is a shorthand for resolving a single path. To resolve many paths inside the same chroot,
+    use :py:class:`ChrootResolver`, which will reuse results between paths.
+
     Args:
         path (pathlib.Path or str): the path to resolve
         chroot (pathlib.Path): path to chroot
 
+    Returns:
+        pathlib.Path: resolved path, as seen inside chroot
+
     Raises:
         OSError: When resolution fails. The following variants can be raised: ``ENOTDIR`` aka
             :py:class:`NotADirectoryError` for paths like ``a/b/file/c``; ``ELOOP`` for loops.
     """
-    path = pathlib.Path(path)
-    if not path.is_absolute():
-        raise ManifestError('only absolute paths can be measured in chroot')
-
-    if seen is None:
-        # a mapping of linksrc -> linkdest (all within chroot), but linkdest values can be None
-        # while recursing, and if None is encountered, then we'll know we have a loop
-        seen = {}
-
-    # Current state (what we already resolved). This is a path that is:
-    # - an instance of pathlib.Path;
-    # - absolute (starts with '/');
-    # - already resolved path (contains no symlinks);
-    # - inside chroot (outer_current_path is this path as seen from outside).
-    # Therefore it's safe to traverse '..' in inner_current_path by just taking .parent attribute.
-    inner_current_path = pathlib.Path('/')
-    outer_current_path = chroot / inner_current_path.relative_to('/')
-
-    for part in path.relative_to('/').parts:
-        if not outer_current_path.is_dir():
-            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), inner_current_path)
-
-        if part == posixpath.curdir: # '.'
-            continue
+    return ChrootResolver(chroot).resolve(path)
 
-        if part == posixpath.pardir: # '..'
-            inner_current_path = inner_current_path.parent # this works also for /, just returns /
-            outer_current_path = chroot / inner_current_path.relative_to('/')
-            continue
 
-        inner_current_path /= part
-        outer_current_path = chroot / inner_current_path.relative_to('/')
+# loosely based on posixpath._joinrealpath
+class ChrootResolver:
+    """Resolves symlinks inside chroot, remembering the results.
 
-        if not outer_current_path.is_symlink():
-            continue
+    All the paths handled by this class (except *chroot*) are as seen inside chroot. Once a path
+    component is resolved, the result is reused for all subsequent paths that share the prefix, so
+    resolving all paths in a tree costs one lookup per path component. The filesystem is assumed not
+    to change while the instance is in use.
 
-        # else: here's the hard part, symlink resolution
+    Args:
+        chroot (pathlib.Path): path to chroot
+    """
+    def __init__(self, chroot):
+        #: path to chroot
+        self.chroot = pathlib.Path(chroot)
 
-        if inner_current_path not in seen:
-            seen[inner_current_path] = None
-            # TODO after python >= 3.9: use Path.readlink()
-            next_path = pathlib.Path(os.readlink(outer_current_path))
+        # (resolved directory, name) -> resolved path
+        self._children = {}
+        # resolved path -> whether it's a directory
+        self._is_dir = {}
+        # A mapping of linksrc -> linkdest (all within chroot), but linkdest values can be None
+        # while recursing, and if None is encountered, then we'll know we have a loop.
+        self._links = {}
 
-            # XXX(woju 12.12.2023): The following path concatenation is suboptimal, it will cause
-            # the recurring function to traverse and stat() all parts of inner_current_path again,
-            # so it's easy to construct exploding O(n²) tree. However, to write this optimally, it
-            # would require to complicate already convoluted logic. Trees that would trigger
-            # suboptimal complexity are uncommon, so I think it's a reasonable tradeoff.
-            if not next_path.is_absolute():
-                next_path = inner_current_path.parent / next_path
+    def resolve(self, path):
+        """Resolve symlinks in a path.
 
-            seen[inner_current_path] = resolve_symlinks(next_path, chroot=chroot, seen=seen)
+        Args:
+            path (pathlib.Path or str): the path to resolve, must be absolute
+
+        Returns:
+            pathlib.Path: resolved path
 
-        if seen[inner_current_path] is None:
+        Raises:
+            OSError: When resolution fails. The following variants can be raised: ``ENOTDIR`` aka
+                :py:class:`NotADirectoryError` for paths like ``a/b/file/c``; ``ELOOP`` for loops.
+            graminelibos.ManifestError: when *path* is not absolute
+        """
+        path = pathlib.Path(path)
+        if not path.is_absolute():
+            raise ManifestError('only absolute paths can be measured in chroot')
+        return self._resolve(pathlib.Path('/'), path.relative_to('/').parts)
+
+    def _outer(self, inner_path):
+        return self.chroot / inner_path.relative_to('/')
+
+    def _check_is_dir(self, inner_path):
+        try:
+            is_dir = self._is_dir[inner_path]
+        except KeyError:
+            is_dir = self._is_dir[inner_path] = self._outer(inner_path).is_dir()
+        if not is_dir:
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), inner_path)
+
+    def _resolve(self, current, parts):
+        # *current* is what we already resolved. This is a path that is:
+        # - an instance of pathlib.Path;
+        # - absolute (starts with '/');
+        # - already resolved path (contains no symlinks);
+        # - inside chroot.
+        # Therefore it's safe to traverse '..' by just taking .parent attribute, and to resolve
+        # relative symlink targets starting from the directory containing the symlink.
+        for part in parts:
+            self._check_is_dir(current)
+
+            if part == posixpath.curdir: # '.'
+                continue
+
+            if part == posixpath.pardir: # '..'
+                current = current.parent # this works also for /, just returns /
+                continue
+
+            try:
+                current = self._children[current, part]
+                continue
+            except KeyError:
+                pass
+
+            child = current / part
+            if self._outer(child).is_symlink():
+                child = self._resolve_link(current, child)
+            self._children[current, part] = child
+            current = child
+
+        return current
+
+    def _resolve_link(self, parent, link):
+        # here's the hard part, symlink resolution
+        if link not in self._links:
+            self._links[link] = None
+            try:
+                # TODO after python >= 3.9: use Path.readlink()
+                target = pathlib.Path(os.readlink(self._outer(link)))
+                if target.is_absolute():
+                    resolved = self._resolve(pathlib.Path('/'), target.relative_to('/').parts)
+                else:
+                    resolved = self._resolve(parent, target.parts)
+            except BaseException:
+                # don't leave None, that would be misinterpreted as a loop on the next lookup
+                del self._links[link]
+                raise
+            self._links[link] = resolved
+
+        if self._links[link] is None:
             # we have a loop in symlinks
-            raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), inner_current_path)
+            raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), link)
+
+        return self._links[link]
 
-        inner_current_path = seen[inner_current_path]
-        outer_current_path = chroot / inner_current_path.relative_to('/')
-        continue
 
-    return inner_current_path
+def _dir_entry_is(method):
+    # DirEntry.is_dir() and .is_file() follow symlinks like Path.is_dir() and .is_file(), but
+    # unlike those raise exceptions for e.g. symlink loops
+    try:
+        return method()
+    except OSError as err:
+        if err.errno in (errno.ENOENT, errno.ENOTDIR, errno.EBADF, errno.ELOOP):
+            return False
+        raise
 
 
 class TrustedFile:
@@ -122,12 +264,14 @@ class TrustedFile:
         uri (str): URI
         sha256 (str or None): sha256
         chroot (pathlib.Path or None): optional path to chroot, if being measured in chroot dir
+        resolver (ChrootResolver or None): optional resolver for symlinks in *chroot*, to be shared
+            between many instances; if not given, a new one will be created
 
     Raises:
         graminelibos.ManifestError: on invalid URI values, or when *chroot* is not None and realpath
             is not absolute
     """
-    def __init__(self, uri, sha256=None, *, chroot=None):
+    def __init__(self, uri, sha256=None, *, chroot=None, resolver=None):
         #: URI of the trusted file
         self.uri = uri
         #: sha256 of the trusted file as str of hex digits, or None if not measured
@@ -141,17 +285,22 @@ class TrustedFile:
         path = pathlib.PurePosixPath(uri2path(uri))
 
         if self.chroot is None:
+            self._resolver = None
             self.realpath = pathlib.Path(path)
         else:
-            self.realpath = chroot / resolve_symlinks(path, chroot=self.chroot).relative_to('/')
+            if resolver is None:
+                resolver = ChrootResolver(self.chroot)
+            self._resolver = resolver
+            self.realpath = chroot / resolver.resolve(path).relative_to('/')
 
     @classmethod
-    def from_manifest(cls, data, *, chroot=None):
+    def from_manifest(cls, data, *, chroot=None, resolver=None):
         """Create an instance from an entry in manifest.
 
         Args:
             data (str or dict): what is found in manifest data
             chroot (pathlib.Path or None): optional path to chroot, if being measured in chroot dir
+            resolver (ChrootResolver or None): optional shared resolver for symlinks in *chroot*
 
         Returns:
             TrustedFile: a single instance of TrustedFile
@@ -171,10 +320,10 @@ class TrustedFile:
         else:
             raise ManifestError(f'Unknown trusted file format: {data!r}')
 
-        return cls(uri, sha256, chroot=chroot)
+        return cls(uri, sha256, chroot=chroot, resolver=resolver)
 
     @classmethod
-    def from_realpath(cls, realpath, *, chroot=None):
+    def from_realpath(cls, realpath, *, chroot=None, resolver=None):
         """Create an instance from a realpath.
 
         This is used for recursive expansion of directories.
@@ -182,6 +331,7 @@ class TrustedFile:
         Args:
             realpath (pathlib.Path): path to the file
             chroot (pathlib.Path or None): optional path to chroot, if being measured in chroot dir
+            resolver (ChrootResolver or None): optional shared resolver for symlinks in *chroot*
 
         Returns:
             TrustedFile: a single instance of TrustedFile
@@ -193,7 +343,25 @@ class TrustedFile:
         if chroot is not None:
             # path.relative_to(chroot) will throw ValueError if the path is not relative to chroot
             path = '/' / path.relative_to(chroot)
-        self = cls(f'file:{path}{"/" if realpath.is_dir() else ""}', chroot=chroot)
+        self = cls(f'file:{path}{"/" if realpath.is_dir() else ""}', chroot=chroot,
+            resolver=resolver)
+        return self
+
+    @classmethod
+    def _from_dir_entry(cls, entry, *, is_dir, inner_dir, chroot, resolver):
+        # Create an instance for an entry found while expanding directory. The directory itself is
+        # already resolved, so unless the entry is a symlink, there's nothing to resolve and we can
+        # avoid stat()-ing all the path components again. *inner_dir* is the path of directory as
+        # seen inside chroot (or just the path if chroot is None).
+        if chroot is not None and entry.is_symlink():
+            return cls.from_realpath(pathlib.Path(entry.path), chroot=chroot, resolver=resolver)
+
+        self = cls.__new__(cls)
+        self.uri = f'file:{posixpath.join(inner_dir, entry.name)}{"/" if is_dir else ""}'
+        self.sha256 = None
+        self.chroot = chroot
+        self._resolver = resolver
+        self.realpath = pathlib.Path(entry.path)
         return self
 
     def __repr__(self):
@@ -225,11 +393,7 @@ class TrustedFile:
             TrustedFile: self
         """
         if self.sha256 is None:
-            with open(self.realpath, 'rb') as file:
-                sha = hashlib.sha256()
-                for chunk in iter(lambda: file.read(128 * sha.block_size), b''):
-                    sha.update(chunk)
-                self.sha256 = sha.hexdigest()
+            self.sha256 = hash_file(self.realpath)
         return self
 
 
@@ -262,24 +426,7 @@ class TrustedFile:
             if self.sha256 is not None:
                 raise ManifestError(f'Directory URI ({self.uri!r}) has sha256 specified')
 
-            for realpath in sorted(self.realpath.glob('*')):
-                # this conditional could be one-lined, but please don't, it would be unreadable
-                if skip_inaccessible:
-                    if not realpath.is_file() and not realpath.is_dir():
-                        continue
-                    if not os.access(realpath, os.R_OK):
-                        continue
-
-                tf = type(self).from_realpath(realpath, chroot=self.chroot)
-
-                if not recursive:
-                    yield tf
-                else:
-                    if realpath.is_symlink() and realpath.is_dir():
-                        # do not descend into symlinked directories
-                        continue
-                    yield from tf.expand_directory(
-                        recursive=recursive, skip_inaccessible=skip_inaccessible)
+            yield from self._walk(recursive=recursive, skip_inaccessible=skip_inaccessible)
 
         else:
             if self.realpath.is_dir():
@@ -287,6 +434,214 @@ class TrustedFile:
             yield self
 
 
+    def _iter_directory(self):
+        # Returns (path as seen inside chroot, sorted list of entries) of a directory. The entries
+        # carry d_type from getdents(), so DirEntry.is_*() don't need to stat() regular files and
+        # directories. Unreadable directories are silently skipped, like pathlib.Path.glob() does.
+        realpath = os.fspath(self.realpath)
+        if self.chroot is None:
+            inner_dir = realpath
+        else:
+            inner_dir = os.fspath('/' / pathlib.PurePosixPath(realpath).relative_to(self.chroot))
+
+        try:
+            with os.scandir(realpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except PermissionError:
+            entries = []
+
+        return inner_dir, iter(entries)
+
+    def _walk(self, *, recursive, skip_inaccessible):
+        # Iterative (not recursive) depth-first walk over the directory, see expand_directory().
+        stack = [self._iter_directory()]
+
+        while stack:
+            inner_dir, entries = stack[-1]
+            try:
+                entry = next(entries)
+            except StopIteration:
+                stack.pop()
+                continue
+
+            is_dir = _dir_entry_is(entry.is_dir)
+
+            # this conditional could be one-lined, but please don't, it would be unreadable
+            if skip_inaccessible:
+                if not is_dir and not _dir_entry_is(entry.is_file):
+                    continue
+                if not os.access(entry.path, os.R_OK):
+                    continue
+
+            tf = self._from_dir_entry(entry, is_dir=is_dir, inner_dir=inner_dir,
+                chroot=self.chroot, resolver=self._resolver)
+
+            if not recursive:
+                yield tf
+            elif is_dir:
+                if entry.is_symlink():
+                    # do not descend into symlinked directories
+                    continue
+                stack.append(tf._iter_directory()) # pylint: disable=protected-access
+            else:
+                yield tf
+
+
+def _choose_executor(trusted_files, jobs):
+    if len(trusted_files) < _PROCESS_POOL_MIN_FILES:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+    total_size = 0
+    for tf in trusted_files:
+        try:
+            total_size += tf.realpath.stat().st_size
+        except OSError:
+            # will be reported when measuring
+            pass
+
+    if total_size / len(trusted_files) <= _PROCESS_POOL_MAX_AVG_SIZE:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+
+def _lookup_baseline(to_hash, baseline):
+    # Returns files that still need to be measured.
+    misses = []
+    for tf in to_hash:
+        try:
+            stat_result = os.stat(tf.realpath)
+        except OSError:
+            # will be reported when measuring
+            misses.append(tf)
+            continue
+
+        tf.sha256 = baseline.get(tf.uri, stat_result)
+        if tf.sha256 is None:
+            misses.append(tf)
+
+    return misses
+
+
+def _lookup_hash_cache(to_hash, hash_cache):
+    # Returns files that still need to be measured, stat() results to be stored in cache after
+    # measuring, and sha256 values from cache that are to be verified.
+    misses = []
+    stat_results = {}
+    expected = {}
+    for tf in to_hash:
+        try:
+            stat_result = os.stat(tf.realpath)
+        except OSError:
+            # will be reported when measuring
+            misses.append(tf)
+            continue
+
+        stat_results[tf] = stat_result
+        sha256 = hash_cache.get(stat_result)
+        if sha256 is None:
+            misses.append(tf)
+        elif hash_cache.should_verify():
+            expected[tf] = sha256
+            misses.append(tf)
+        else:
+            tf.sha256 = sha256
+
+    return misses, stat_results, expected
+
+
+def _update_hash_cache(measured, hash_cache, stat_results, expected):
+    for tf, sha256 in expected.items():
+        if tf.sha256 != sha256:
+            hash_cache.discard(stat_results[tf])
+            raise ManifestError(
+                f'Hash cache entry for {os.fspath(tf.realpath)!r} is stale (cached {sha256}, '
+                f'measured {tf.sha256}); the file was probably modified without updating its '
+                f'mtime. Please remove {os.fspath(hash_cache.path)!r} or disable the cache.')
+
+    for tf in measured:
+        if tf in stat_results:
+            hash_cache.put(stat_results[tf], tf.sha256)
+
+
+def hash_trusted_files(trusted_files, *, jobs=None, hash_cache=None, baseline=None):
+    """Ensure that all trusted files carry sha256 sum, measuring them in parallel.
+
+    Files are hashed in a thread pool, because :py:mod:`hashlib` releases GIL while hashing large
+    buffers. If there are many small files, a process pool is used instead, because then the time
+    is dominated by per-file overhead which is spent holding GIL.
+
+    Args:
+        trusted_files (iterable of TrustedFile): files to measure; those that already have sha256
+            are skipped
+        jobs (int or None): number of parallel workers; if :py:obj:`None`, use the number of CPUs
+        hash_cache (graminelibos.hash_cache.HashCache or None): optional cache of hashes, consulted
+            before measuring files and updated afterwards
+        baseline (graminelibos.hash_cache.Baseline or None): optional hashes from previous build,
+            consulted before *hash_cache*
+
+    Raises:
+        OSError: when some file could not be read; on errors in more than one file, the one that
+            comes first in *trusted_files* is raised
+        graminelibos.ManifestError: when verification of a cached hash failed
+    """
+    to_hash = [tf for tf in trusted_files if tf.sha256 is None]
+
+    if baseline is not None:
+        to_hash = _lookup_baseline(to_hash, baseline)
+
+    if hash_cache is not None:
+        to_hash, stat_results, expected = _lookup_hash_cache(to_hash, hash_cache)
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs == 1 or len(to_hash) < 2:
+        for tf in to_hash:
+            tf.ensure_hash()
+    else:
+        with _choose_executor(to_hash, jobs) as executor:
+            futures = [executor.submit(hash_file, tf.realpath) for tf in to_hash]
+            try:
+                for tf, future in zip(to_hash, futures):
+                    tf.sha256 = future.result()
+            except BaseException:
+                # don't wait for the rest of the files to be measured
+                for future in futures:
+                    future.cancel()
+                raise
+
+    if hash_cache is not None:
+        _update_hash_cache(to_hash, hash_cache, stat_results, expected)
+
+
+def _toml_escape(match):
+    char = match.group()
+    return _TOML_COMPACT_ESCAPES.get(char, f'\\u{ord(char):04x}')
+
+def _toml_string(value):
+    return f'"{_TOML_ESCAPE.sub(_toml_escape, value)}"'
+
+def _is_canonical_trusted_file(tf):
+    return (isinstance(tf, dict) and isinstance(tf.get('uri'), str)
+        and isinstance(tf.get('sha256', ''), str) and tf.keys() <= {'uri', 'sha256'})
+
+def _iter_toml_trusted_files(trusted_files):
+    # Serialise the list as TOML array of inline tables, one per line, like tomli_w < 1.1 did.
+    # This is an order of magnitude faster than tomli_w, and the format does not depend on the
+    # version of tomli_w (which matters, because the serialised manifest is measured).
+    yield '[\n'
+    for i in range(0, len(trusted_files), _DUMP_BATCH_SIZE):
+        lines = []
+        for tf in trusted_files[i:i + _DUMP_BATCH_SIZE]:
+            if 'sha256' in tf:
+                lines.append(f'    {{ uri = {_toml_string(tf["uri"])}, '
+                    f'sha256 = {_toml_string(tf["sha256"])} }},\n')
+            else:
+                lines.append(f'    {{ uri = {_toml_string(tf["uri"])} }},\n')
+        yield ''.join(lines)
+    yield ']'
+
+
 class Manifest:
     """Just a representation of a manifest.
 
@@ -339,7 +694,7 @@ class Manifest:
 
         # for convenience, users are not required to specify `loader.entrypoint.uri` and
         # `loader.entrypoint.sha256`; replace with the default LibOS
-        loader_entrypoint_uri = f'file:{_env.globals["gramine"]["libos"]}'
+        loader_entrypoint_uri = f'file:{LIBOS_PATH}'
 
         loader = manifest.setdefault('loader', {})
         loader_entrypoint = loader.setdefault('entrypoint', {})
@@ -366,18 +721,19 @@ class Manifest:
     def from_template(cls, template, variables=None):
         """Render template into Manifest.
 
-        Creates a manifest from the jinja template given as string. Optional variables may be given
-        as mapping.
+        Creates a manifest from the jinja template given as string or as path to the template file.
+        Optional variables may be given as mapping. Compiled templates are cached on disk, see
+        :py:func:`graminelibos.gen_jinja_env.make_bytecode_cache`.
 
         Args:
-            template (str): jinja2 template of the manifest
+            template (str or path-like): jinja2 template of the manifest, or path to it
             variables (:obj:`dict`, optional): Dictionary of variables that are used in
                 the template.
 
         Returns:
             Manifest: instance created from rendered template.
         """
-        return cls(_env.from_string(template).render(**(variables or {})))
+        return cls(get_template(template).render(**(variables or {})))
 
     @classmethod
     def loads(cls, s):
@@ -387,11 +743,35 @@ class Manifest:
     def load(cls, f):
         return cls.loads(f.read())
 
+    def _iter_dump(self):
+        # Yields the serialised manifest in chunks. sgx.trusted_files, which is usually most of the
+        # manifest, is serialised separately from the rest, in place of a unique placeholder.
+        sgx = self._manifest.get('sgx')
+        trusted_files = sgx.get('trusted_files') if isinstance(sgx, dict) else None
+        if (not isinstance(trusted_files, list) or not trusted_files
+                or not all(_is_canonical_trusted_file(tf) for tf in trusted_files)):
+            yield tomli_w.dumps(self._manifest)
+            return
+
+        placeholder = f'trusted-files-{secrets.token_hex(16)}'
+        manifest = {**self._manifest, 'sgx': {**sgx, 'trusted_files': placeholder}}
+        before, after = tomli_w.dumps(manifest).split(_toml_string(placeholder))
+
+        yield before
+        yield from _iter_toml_trusted_files(trusted_files)
+        yield after
+
     def dumps(self):
-        return tomli_w.dumps(self._manifest)
+        return ''.join(self._iter_dump())
 
     def dump(self, f):
-        tomli_w.dump(self._manifest, f)
+        """Write the manifest to a file.
+
+        Args:
+            f (file-like): file opened in binary mode
+        """
+        for chunk in self._iter_dump():
+            f.write(chunk.encode('utf-8'))
 
     def check(self):
         """Check the manifest against builtin schema
@@ -399,10 +779,12 @@ class Manifest:
         Raises:
             voluptuous.error.MultipleInvalid: when check fails
         """
+        # voluptuous is slow to import, and most users of this module never check manifests
+        # pylint: disable=import-outside-toplevel
+        from .manifest_check import GramineManifestCompiledSchema
+        return GramineManifestCompiledSchema(self._manifest)
 
-        return GramineManifestSchema(self._manifest)
-
-    def expand_all_trusted_files(self, chroot=None):
+    def expand_all_trusted_files(self, chroot=None, *, jobs=None, hash_cache=None, baseline=None):
         """Expand all trusted files entries.
 
         Collects all trusted files entries, hashes each of them (skipping these which already had a
@@ -413,15 +795,25 @@ class Manifest:
         Args:
             chroot (pathlib.Path or None): Optional chroot directory. If specified, trusted files
                 are expected to be found inside this directory, not in root of filesystem.
+            jobs (int or None): Number of files to be hashed in parallel. If :py:obj:`None` (the
+                default), use the number of CPUs. See :py:func:`hash_trusted_files`.
+            hash_cache (graminelibos.hash_cache.HashCache or None): Optional persistent cache of
+                hashes of trusted files.
+            baseline (graminelibos.hash_cache.Baseline or None): Optional hashes of trusted files
+                from previously generated manifest. Directories are expanded anyway, so added and
+                removed files are picked up, but files that were not modified since the previous
+                build are not measured again. The result is the same as without baseline.
 
         Raises:
             graminelibos.ManifestError: There was an error with the format of some trusted files in
                 the manifest or some of them could not be loaded from the filesystem.
 
         """
+        resolver = ChrootResolver(chroot) if chroot is not None else None
         trusted_files = {}
         for data in self['sgx']['trusted_files']:
-            for tf in TrustedFile.from_manifest(data, chroot=chroot).expand_directory():
+            for tf in TrustedFile.from_manifest(data, chroot=chroot,
+                    resolver=resolver).expand_directory():
                 if tf.uri in trusted_files:
                     # On duplicate entries, pick the one that is already measured, and if both don't
                     # have hashes, prefer existing one, to avoid dict insertion. Accept double
@@ -437,8 +829,8 @@ class Manifest:
 
                 trusted_files[tf.uri] = tf
 
-        for tf in trusted_files.values():
-            tf.ensure_hash()
+        hash_trusted_files(trusted_files.values(), jobs=jobs, hash_cache=hash_cache,
+            baseline=baseline)
 
         self['sgx']['trusted_files'] = [tf.to_manifest() for tf in trusted_files.values()]
         return [tf.realpath for tf in trusted_files.values()]
@@ -2,23 +2,49 @@
 # Copyright (C) 2024 Intel Corporation
 #                    Wojtek Porczyk <woju@invisiblethingslab.com>
 
+import concurrent.futures
+import operator
+import os
+import re
+
 from voluptuous import (
+    PREVENT_EXTRA,
     Any,
+    Marker,
+    Match,
+    MultipleInvalid,
+    Optional,
     Required,
     Schema,
 )
 
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+class _Pattern(Match):
+    # Match of the whole string. The pattern must not match NUL characters: then many strings can
+    # be checked at once, by matching them joined with NULs (see _compile_batch_pattern()), as long
+    # as the strings themselves don't contain NULs.
+    def __init__(self, pattern, msg):
+        super().__init__(rf'(?:{pattern})\Z', msg=msg)
+        self.batch_pattern = re.compile(rf'(?:{pattern})(?:\0(?:{pattern}))*\Z')
+
+# The same syntax as accepted by Gramine (see parse_size_str() and update_seal_key_mask() in C).
+
 # size (number + suffix)
-# TODO: write a better validator
-_size = str
+_size = _Pattern(r'[0-9]+[KMGkmg]?', msg='expected size (a number with optional K, M or G suffix)')
 
 # masks for sgx.seal_key.*_mask fields
-# TODO: write a better validator
-_mask64 = str
-_mask32 = str
+_mask64 = _Pattern(r'0[xX][0-9a-fA-F]{16}', msg='expected 64-bit mask (0x and 16 hex digits)')
+_mask32 = _Pattern(r'0[xX][0-9a-fA-F]{8}', msg='expected 32-bit mask (0x and 8 hex digits)')
+
+# NUL can't be passed to Gramine anyway
+_uri = _Pattern(r'(?:file|dev):[^\0]+', msg='expected URI (file:... or dev:...)')
+_file_uri = _Pattern(r'file:[^\0]+', msg='expected file URI (file:...)')
 
-# TODO: write a better validator
-_uri = str
+_sha256 = _Pattern(r'[0-9a-fA-F]{64}', msg='expected sha256 (64 hex digits)')
 
 # fs.root and fs.mounts[] are almost the same, but fs.root does not contain path= key
 _fs_base = (
@@ -58,8 +84,7 @@ GramineManifestSchema = Schema({
     },
 
     Required('loader'): {
-        # TODO: validator for sha256
-        Required('entrypoint'): {Required('uri'): _uri, 'sha256': str},
+        Required('entrypoint'): {Required('uri'): _file_uri, 'sha256': _sha256},
         'argv': [str],
         'argv_src_file': str,
         'env': {str: Any(str, {'value': str}, {'passthrough': True})},
@@ -74,7 +99,7 @@ GramineManifestSchema = Schema({
     },
 
     'sgx': {
-        'allowed_files': [str],
+        'allowed_files': [_uri],
         'cpu_features': {
             Any('avx', 'avx512', 'amx'): Any('unspecified', 'disabled', 'required'),
             Any('mpx', 'pkru'): Any('disabled', 'required'),
@@ -102,8 +127,7 @@ GramineManifestSchema = Schema({
             'xfrm_mask': _mask64,
             'misc_mask': _mask32,
         },
-        # TODO: validator for sha256
-        'trusted_files': [Any(str, {'uri': _uri, 'sha256': str})],
+        'trusted_files': [Any(_file_uri, {'uri': _file_uri, 'sha256': _sha256})],
         'use_exinfo': bool,
         'vtune_profile': bool,
     },
@@ -132,3 +156,331 @@ GramineManifestSchema = Schema({
         'fds': {'limit': int},
     },
 })
+
+
+class _NotCompilable(Exception):
+    pass
+
+def _compile_type(schema):
+    return lambda data: isinstance(data, schema)
+
+def _compile_value(schema):
+    return lambda data: data == schema
+
+def _compile_match(schema):
+    match = schema.pattern.match
+    return lambda data: isinstance(data, str) and match(data) is not None
+
+def _compile_callable(schema):
+    def check(data):
+        try:
+            schema(data)
+        except Exception: # pylint: disable=broad-except
+            return False
+        return True
+    return check
+
+def _compile_any(schema):
+    checks = tuple(_compile(validator) for validator in schema.validators)
+    return lambda data: any(check(data) for check in checks)
+
+# Lists like sgx.trusted_files can have tens of thousands of items, so for the common shapes of
+# items the whole list is checked at once ("batch"), mostly without a Python function call per item:
+# strings matched by _Pattern are joined and matched by one regex, and dicts are split into columns
+# of values for each key, which are then checked the same way.
+
+def _batch_type(schema):
+    # The type of values valid for *schema*, if *schema* can be batch-checked; otherwise None.
+    if isinstance(schema, type):
+        return schema
+    if isinstance(schema, Match):
+        return str
+    if isinstance(schema, dict):
+        return dict
+    return None
+
+def _compile_batch_pattern(schema):
+    match = schema.batch_pattern.match
+    def check(values):
+        try:
+            joined = '\0'.join(values)
+        except TypeError:
+            # not a str
+            return False
+        if not values:
+            return True
+        if joined.count('\0') != len(values) - 1:
+            # a value containing NUL would be matched as two (possibly valid) values
+            return False
+        return match(joined) is not None
+    return check
+
+def _compile_batch_dict(schema):
+    keys = []
+    required = set()
+    column_checks = []
+    for key, value in schema.items():
+        if isinstance(key, Required):
+            key = key.schema
+            required.add(key)
+        elif type(key) is Optional: # pylint: disable=unidiomatic-typecheck
+            key = key.schema
+        if not isinstance(key, str):
+            return None
+        check_column = _compile_batch(value)
+        if check_column is None:
+            return None
+        keys.append(key)
+        column_checks.append(check_column)
+    if not keys:
+        return None
+
+    getters = [operator.itemgetter(key) for key in keys]
+    def check(values):
+        # Usually all dicts have all the keys: those are split into columns by itemgetter. Extra
+        # keys are found either by itemgetter (KeyError) or by length.
+        full = [d for d in values if len(d) == len(keys)]
+        try:
+            columns = [list(map(getter, full)) for getter in getters]
+        except KeyError:
+            return False
+        if len(full) != len(values):
+            for d in values:
+                if len(d) >= len(keys):
+                    if len(d) > len(keys):
+                        return False
+                    continue
+                if not required <= d.keys():
+                    return False
+                for key, value in d.items():
+                    try:
+                        columns[keys.index(key)].append(value)
+                    except ValueError:
+                        return False
+        return all(check_column(column) for check_column, column in zip(column_checks, columns))
+    return check
+
+def _compile_batch_any(schema):
+    # Only alternatives of distinct types: each item is then checked against one of them.
+    types = tuple(_batch_type(validator) for validator in schema.validators)
+    if None in types or any(issubclass(a, b) for a in types for b in types if a is not b):
+        return None
+    checks = tuple(_compile_batch(validator) for validator in schema.validators)
+    if None in checks:
+        return None
+    def check(values):
+        partitions = [[value for value in values if isinstance(value, value_type)]
+            for value_type in types]
+        if sum(map(len, partitions)) != len(values):
+            # some values are of none of the types
+            return False
+        return all(check_values(partition) for check_values, partition in zip(checks, partitions))
+    return check
+
+def _compile_batch(schema):
+    # Returns a function, which returns True if all *values* (a list) are valid according to
+    # *schema*, or None if *schema* can't be batch-checked.
+    # pylint: disable=too-many-return-statements
+    if isinstance(schema, type):
+        return lambda values: all(isinstance(value, schema) for value in values)
+    if isinstance(schema, _Pattern):
+        return _compile_batch_pattern(schema)
+    if isinstance(schema, Match):
+        match = schema.pattern.match
+        return lambda values: all(
+            isinstance(value, str) and match(value) is not None for value in values)
+    if isinstance(schema, dict):
+        check_dicts = _compile_batch_dict(schema)
+        if check_dicts is None:
+            return None
+        return lambda values: all(isinstance(value, dict) for value in values) and check_dicts(
+            values)
+    if isinstance(schema, Any):
+        return _compile_batch_any(schema)
+    return None
+
+def _compile_list(schema):
+    if not schema:
+        raise _NotCompilable('empty list')
+    checks = tuple(_compile(item) for item in schema)
+    if len(checks) > 1:
+        return lambda data: isinstance(data, list) and all(
+            any(check(item) for check in checks) for item in data)
+
+    item, = schema
+    check_values = _compile_batch(item)
+    if check_values is not None:
+        return lambda data: isinstance(data, list) and check_values(data)
+
+    check, = checks
+    return lambda data: isinstance(data, list) and all(map(check, data))
+
+def _compile_dict(schema):
+    required = set()
+    # constant keys, which is the common case, are looked up directly; other keys (like str, or
+    # Any of some constants) are tried one by one
+    constant_keys = {}
+    other_keys = []
+    for key, value in schema.items():
+        if isinstance(key, Required):
+            key = key.schema
+            required.add(key)
+        elif type(key) is Optional: # pylint: disable=unidiomatic-typecheck
+            key = key.schema
+        elif isinstance(key, Marker):
+            # Exclusive, Inclusive, Remove
+            raise _NotCompilable(f'unsupported key: {key!r}')
+        check_value = _compile(value)
+        if isinstance(key, str):
+            constant_keys[key] = check_value
+        else:
+            other_keys.append((_compile(key), check_value))
+
+    def check_constant_keys(data):
+        if not isinstance(data, dict) or not required <= data.keys():
+            return False
+        for key, value in data.items():
+            check_value = constant_keys.get(key)
+            if check_value is None or not check_value(value):
+                return False
+        return True
+
+    def check(data):
+        if not isinstance(data, dict) or not required <= data.keys():
+            return False
+        for key, value in data.items():
+            matching = [check_value for check_key, check_value in other_keys if check_key(key)]
+            if key in constant_keys:
+                matching.append(constant_keys[key])
+            # if more than one key of the schema matches, the result depends on the order in which
+            # voluptuous tries them, so leave it to voluptuous
+            if len(matching) != 1 or not matching[0](value):
+                return False
+        return True
+
+    if other_keys:
+        return check
+    return check_constant_keys
+
+def _compile(schema):
+    # Returns a function which returns True if *data* is valid according to *schema*, and False if
+    # it's invalid (or if it can't tell for sure).
+    # pylint: disable=too-many-return-statements
+    if isinstance(schema, Schema):
+        if schema.extra != PREVENT_EXTRA or schema.required:
+            raise _NotCompilable('unsupported Schema options')
+        return _compile(schema.schema)
+    if isinstance(schema, type):
+        return _compile_type(schema)
+    if isinstance(schema, Any):
+        return _compile_any(schema)
+    if isinstance(schema, Match):
+        return _compile_match(schema)
+    if isinstance(schema, dict):
+        return _compile_dict(schema)
+    if isinstance(schema, list):
+        return _compile_list(schema)
+    if isinstance(schema, (str, int, float)) or schema is None:
+        return _compile_value(schema)
+    if callable(schema):
+        return _compile_callable(schema)
+    raise _NotCompilable(f'unsupported schema: {schema!r}')
+
+
+class CompiledSchema:
+    """Schema with a fast path for valid data.
+
+    voluptuous walks the schema for each value, which for manifests with many trusted files takes
+    seconds. This compiles the schema once into plain functions, which can only tell whether the
+    data is valid. Only when it's not, the data is validated with voluptuous, so that the errors
+    are exactly the same.
+
+    Supported are types, constants, callables, :py:class:`voluptuous.Any`,
+    :py:class:`voluptuous.Match`, lists and dicts (with :py:class:`voluptuous.Required` and
+    :py:class:`voluptuous.Optional` keys). For other schemas, the data is always validated with
+    voluptuous. Callables are assumed to only validate the data (their return value is ignored), so
+    schemas which coerce values can't be used.
+
+    Args:
+        schema (voluptuous.Schema): the schema
+    """
+    def __init__(self, schema):
+        #: the original schema
+        self.schema = schema
+        try:
+            self._check = _compile(schema)
+        except _NotCompilable:
+            self._check = lambda data: False
+
+    def __call__(self, data):
+        """Validate data.
+
+        Returns:
+            the data, if valid (not a validated copy, as returned by voluptuous)
+
+        Raises:
+            voluptuous.MultipleInvalid: when the data is invalid
+        """
+        if self._check(data):
+            return data
+        return self.schema(data)
+
+GramineManifestCompiledSchema = CompiledSchema(GramineManifestSchema)
+
+
+def check_manifest_file(path):
+    """Parse and validate a manifest file.
+
+    Args:
+        path (str or pathlib.Path): path to the manifest
+
+    Returns:
+        dict: the result, which can be serialised to JSON: ``file`` (the path), ``status``
+        (``'ok'``, ``'invalid'`` if the manifest does not conform to the schema, or ``'error'`` if
+        it could not be read or parsed) and ``errors`` (list of dicts with ``path`` into the
+        manifest and ``message``)
+    """
+    result = {'file': os.fspath(path), 'status': 'ok', 'errors': []}
+    try:
+        with open(path, 'rb') as file:
+            data = tomllib.load(file)
+    except OSError as err:
+        result['status'] = 'error'
+        result['errors'].append({'path': [], 'message': f'error reading manifest: {err!s}'})
+        return result
+    except ValueError as err:
+        # TOMLDecodeError or UnicodeDecodeError
+        result['status'] = 'error'
+        result['errors'].append({'path': [], 'message': f'error parsing manifest: {err!s}'})
+        return result
+
+    try:
+        GramineManifestCompiledSchema(data)
+    except MultipleInvalid as err:
+        result['status'] = 'invalid'
+        result['errors'].extend({'path': e.path, 'message': str(e)} for e in err.errors)
+    return result
+
+def check_manifest_files(paths, *, jobs=None):
+    """Parse and validate many manifest files in parallel.
+
+    Args:
+        paths (list): paths to the manifests
+        jobs (int or None): number of worker processes; if :py:obj:`None`, use the number of CPUs
+
+    Yields:
+        dict: results of :py:func:`check_manifest_file`, in the order of *paths*, as soon as they
+        are available
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs == 1 or len(paths) < 2:
+        yield from map(check_manifest_file, paths)
+        return
+
+    # Manifests are small, so send them to the workers in chunks, but not so big that the results
+    # are not streamed.
+    chunksize = max(1, min(16, len(paths) // (jobs * 4)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(check_manifest_file, paths, chunksize=chunksize)
@@ -1,4 +1,7 @@
+import argparse
+import collections
 import contextlib
+import json
 import logging
 import os
 import pathlib
@@ -34,49 +37,176 @@ def expectedFailureIf(predicate):
         return unittest.expectedFailure
     return lambda func: func
 
+class _ResultsLog:
+    """Outcome, duration and resource usage of commands run by each test in this Pytest session.
+
+    Collected when the Pytest plugin below is loaded, and written to a file if the
+    ``--results-json`` option is given.
+    """
+    def __init__(self):
+        self.active = False
+        self.path = None
+        self.start_time = None
+        self.current_test = None
+        self.tests = {}
+        # used with --durations-db
+        self.expected_durations = {}
+        self.regressions = []
+
+    def start(self, path):
+        self.active = True
+        self.path = path
+        self.start_time = time.time()
+        self.tests = {}
+        self.expected_durations = {}
+        self.regressions = []
+
+    def get_test(self, nodeid):
+        return self.tests.setdefault(nodeid, {'outcome': None, 'duration': 0, 'commands': []})
+
+    def add_command(self, cmd, returncode, usage):
+        if not self.active:
+            return
+        argv = [os.fspath(arg) for arg in cmd] if isinstance(cmd, (list, tuple)) else str(cmd)
+        self.get_test(self.current_test or '')['commands'].append(
+            {'cmd': argv, 'returncode': returncode, **usage})
+
+    def add_report(self, report):
+        if not self.active:
+            return
+        test = self.get_test(report.nodeid)
+        test['duration'] = round(test['duration'] + report.duration, 6)
+        if report.failed and report.when != 'call':
+            test['outcome'] = 'error'
+        elif report.when == 'call' or report.skipped:
+            test['outcome'] = report.outcome
+
+    def write(self, exitstatus):
+        if self.path is None:
+            return
+        results = {
+            'start_time': self.start_time,
+            'exitstatus': int(exitstatus),
+            'environment': {
+                'sgx': HAS_SGX,
+                'edmm': HAS_EDMM,
+                'vm': IS_VM,
+                'musl': USES_MUSL,
+                'machine': os.uname().machine,
+                'kernel': os.uname().release,
+            },
+            'tests': self.tests,
+        }
+        with open(self.path, 'w') as file:
+            json.dump(results, file, indent=1)
+            file.write('\n')
+
+_results_log = _ResultsLog()
+
 def set_open_fds_limit(n):
     if n is not None:
         resource.setrlimit(resource.RLIMIT_NOFILE, (n, n))
 
-def run_command(cmd, *, timeout, open_fds_limit=None, can_fail=False, **kwds):
-    # pylint: disable=too-many-locals
-    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                          preexec_fn=lambda: set_open_fds_limit(open_fds_limit),
-                          start_new_session=True, **kwds) as proc:
-        class LoggingSplice:
-            def __init__(self, input_pipe, output_pipe):
-                self.logged_data = b''
-                self.closed = False
-                self.at_line_start = True
-                self.input_pipe = input_pipe
-                self.output_pipe = output_pipe
-                self.start_time = time.time()
-
-            def pump_data(self, pending_reads):
-                if self.input_pipe in pending_reads:
-                    data = self.input_pipe.read(1024)
-                    self.logged_data += data
-
-                    if not data:
-                        self.closed = True
-                        return
+class _LoggingSplice:
+    """Copy data from a pipe to an output, prefixing each line with a timestamp, and log it.
 
-                    timestamped = bytearray()
-                    for ch in data:
-                        if self.at_line_start:
-                            timestamped += b'[%.3f] ' % (time.time() - self.start_time)
-                            self.at_line_start = False
+    Each read gets one timestamp (in seconds since the splice was created), which is used for all
+    the lines starting in the data that was read. The data is processed by whole reads (not byte by
+    byte), so even tests which print megabytes don't spend much time in the harness.
+    """
+    read_size = 64 * 1024
 
-                        timestamped.append(ch)
+    def __init__(self, input_pipe, output_pipe):
+        self.logged_chunks = []
+        self.closed = False
+        self.at_line_start = True
+        self.input_pipe = input_pipe
+        self.output_pipe = output_pipe
+        self.start_time = time.time()
 
-                        if ch == 10:
-                            self.at_line_start = True
-
-                    self.output_pipe.write(timestamped)
-                    self.output_pipe.flush()
+    @property
+    def logged_data(self):
+        return b''.join(self.logged_chunks)
+
+    def timestamp_lines(self, data):
+        timestamp = b'[%.3f] ' % (time.time() - self.start_time)
+        # don't insert a timestamp after the trailing newline, the next line may come much later
+        ends_with_newline = data.endswith(b'\n')
+        if ends_with_newline:
+            data = data[:-1]
+        parts = [timestamp] if self.at_line_start else []
+        parts.append(data.replace(b'\n', b'\n' + timestamp))
+        if ends_with_newline:
+            parts.append(b'\n')
+        self.at_line_start = ends_with_newline
+        return b''.join(parts)
+
+    def pump_data(self, pending_reads):
+        if self.input_pipe in pending_reads:
+            data = self.input_pipe.read(self.read_size)
+            if not data:
+                self.closed = True
+                return
+            self.logged_chunks.append(data)
+
+            self.output_pipe.write(self.timestamp_lines(data))
+            self.output_pipe.flush()
+
+class CommandResult(collections.namedtuple('CommandResult', 'returncode stdout stderr')):
+    """Result of :func:`run_command`, unpacks to ``(returncode, stdout, stderr)``.
+
+    Attributes:
+        usage (dict): resource usage of the command, see :func:`_get_usage`
+    """
+    usage = None
+
+def _wait4(proc, timeout=None):
+    """Like ``proc.wait(timeout)``, but reap the process with :func:`os.wait4`.
+
+    Returns:
+        resource.struct_rusage or None: resource usage of the process (including its children which
+        it waited for), or None if the process did not exit before the timeout
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+        if pid:
+            proc.returncode = (-os.WTERMSIG(status) if os.WIFSIGNALED(status)
+                else os.WEXITSTATUS(status))
+            return rusage
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+
+def _get_usage(rusage, wall_time):
+    return {
+        'wall_time': round(wall_time, 6),
+        'user_time': round(rusage.ru_utime, 6),
+        'system_time': round(rusage.ru_stime, 6),
+        'max_rss_kb': rusage.ru_maxrss,
+        'minor_page_faults': rusage.ru_minflt,
+        'major_page_faults': rusage.ru_majflt,
+        'voluntary_context_switches': rusage.ru_nvcsw,
+        'involuntary_context_switches': rusage.ru_nivcsw,
+    }
 
-        stdout_splice = LoggingSplice(proc.stdout.raw, sys.stdout.buffer)
-        stderr_splice = LoggingSplice(proc.stderr.raw, sys.stderr.buffer)
+def run_command(cmd, *, timeout, open_fds_limit=None, can_fail=False, **kwds):
+    """Run a command, copying its output (with timestamps) to our stdout and stderr.
+
+    Returns:
+        CommandResult: exit code, stdout and stderr, and resource usage of the main process (which
+        includes its children, as long as it waited for them)
+    """
+    # pylint: disable=too-many-locals,too-many-statements
+    start_time = time.monotonic()
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          preexec_fn=lambda: set_open_fds_limit(open_fds_limit),
+                          start_new_session=True, **kwds) as proc:
+        stdout_splice = _LoggingSplice(proc.stdout.raw, sys.stdout.buffer)
+        stderr_splice = _LoggingSplice(proc.stderr.raw, sys.stderr.buffer)
 
         # returns True if we've used only some of the time and more data can arrive later
         def try_pump(timeout):
@@ -110,12 +240,17 @@ def run_command(cmd, *, timeout, open_fds_limit=None, can_fail=False, **kwds):
         # Once we're here, we've either timed out, or both pipes got closed and the process is about
         # to exit
         time_remaining = time_end - time.time()
+        rusage = None
         if time_remaining > 0:
-            proc.wait(time_remaining)
+            rusage = _wait4(proc, time_remaining)
+            if rusage is None:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+        else:
+            rusage = _wait4(proc, 0)
+        wall_time = time.monotonic() - start_time
 
         timed_out = time_end < time.time()
 
-        proc.poll()
         main_returncode = proc.returncode
 
         # Kill the whole process group: even if we did not time out, there might be some processes
@@ -140,6 +275,13 @@ def run_command(cmd, *, timeout, open_fds_limit=None, can_fail=False, **kwds):
         while try_pump(0):
             pass
 
+        if rusage is None:
+            # the main process was killed above, collect its usage anyway
+            rusage = _wait4(proc)
+            wall_time = time.monotonic() - start_time
+        usage = _get_usage(rusage, wall_time)
+        _results_log.add_command(cmd, proc.returncode, usage)
+
         raw_stdout = stdout_splice.logged_data
         raw_stderr = stderr_splice.logged_data
 
@@ -167,7 +309,9 @@ def run_command(cmd, *, timeout, open_fds_limit=None, can_fail=False, **kwds):
         if main_returncode != 0 and not can_fail:
             raise subprocess.CalledProcessError(proc.returncode, cmd, raw_stdout, raw_stderr)
 
-        return main_returncode, stdout, stderr
+        result = CommandResult(main_returncode, stdout, stderr)
+        result.usage = usage
+        return result
 
 
 class RegressionTestCase(unittest.TestCase):
@@ -253,3 +397,168 @@ class RegressionTestCase(unittest.TestCase):
             self.assertEqual(e.returncode, returncode,
                 'failed with returncode {} (expected {})'.format(
                     e.returncode, returncode))
+
+
+# Pytest plugin used by `gramine-test pytest` (load it with `-p graminelibos.regression`).
+#
+# With `--results-json=PATH`, the results of each test, including resource usage of the commands it
+# ran (see `run_command()`), are written to a JSON file at the end of the session.
+#
+# With `--durations-db=PATH`, durations of the tests are recorded in a database (see `durations`
+# module). They are used to split the tests between shards (see below) and to run the longest ones
+# first, and tests which took much longer than usual are reported at the end of the session.
+#
+# For `gramine-test pytest --jobs N`, each of the N concurrent Pytest processes runs in its own copy
+# of the test directory (see `util_tests.run_pytest_sharded()`) and selects its part of the tests
+# with `--shard=K/N`. Tests which need an exclusive resource (e.g. a fixed TCP port) are marked with
+# `@pytest.mark.serial`, skipped by the shards with `--serial-tests=exclude`, and run afterwards on
+# their own with `--serial-tests=only`.
+
+_DURATIONS_MODE = 'sgx' if HAS_SGX else 'direct'
+
+def _parse_shard(value):
+    try:
+        index, count = (int(i) for i in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected K/N, got {value!r}')
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f'shard index must be in range 0..{count - 1}')
+    return index, count
+
+def pytest_addoption(parser):
+    group = parser.getgroup('gramine', 'Gramine parallel test execution')
+    group.addoption('--shard', type=_parse_shard, metavar='K/N',
+        help='run only the K-th (counting from 0) of N parts of the tests')
+    group.addoption('--serial-tests', choices=('include', 'exclude', 'only'), default='include',
+        help='whether to run the tests marked as serial')
+    group.addoption('--results-json', metavar='PATH',
+        help='write outcome, duration and resource usage (wall and CPU time, max RSS, page faults, '
+             'context switches) of commands run by each test to a JSON file')
+    group.addoption('--durations-db', metavar='PATH',
+        help='record durations of the tests in a database, use them to schedule the longest tests '
+             'first, and report tests which took much longer than usual')
+    group.addoption('--durations-before', type=float, metavar='TIMESTAMP',
+        help='schedule the tests using only durations recorded before this UNIX time (so that all '
+             'shards see the same durations)')
+    group.addoption('--duration-threshold', type=float, default=0.5, metavar='FRACTION',
+        help='report tests which took this much longer than usual (default: 0.5, i.e. 50%%)')
+
+def pytest_configure(config):
+    config.addinivalue_line('markers',
+        'serial: the test needs an exclusive resource (e.g. a fixed TCP port), so it cannot run '
+        'concurrently with other tests')
+
+def pytest_collection_modifyitems(config, items):
+    # pylint: disable=too-many-locals
+    serial_tests = config.getoption('serial_tests')
+    if serial_tests != 'include':
+        only = serial_tests == 'only'
+        selected, deselected = [], []
+        for item in items:
+            is_serial = item.get_closest_marker('serial') is not None
+            (selected if is_serial == only else deselected).append(item)
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+
+    db_path = config.getoption('durations_db')
+    if db_path is not None:
+        _results_log.expected_durations = _load_expected_durations(db_path,
+            before=config.getoption('durations_before'))
+    expected = _results_log.expected_durations
+    known = [expected[item.nodeid] for item in items if item.nodeid in expected]
+    if known:
+        # tests which never passed before may be long too
+        default_duration = max(known)
+        durations = [expected.get(item.nodeid, default_duration) for item in items]
+    else:
+        # this splits the groups of tests (see below) between shards by their number of tests,
+        # and the single tests round-robin, so that slow tests (which tend to be next to each
+        # other) are spread evenly
+        durations = [1] * len(items)
+
+    # keep modules together, and tests in a class (which may share setUpClass() or be numbered to
+    # run in order), but not other tests (e.g. parametrized ones)
+    groups = [(item.nodeid.split('::')[0],
+        item.parent.nodeid if getattr(item, 'cls', None) is not None else item.nodeid)
+        for item in items]
+
+    shard = config.getoption('shard')
+    if shard is not None:
+        # pylint: disable=import-outside-toplevel
+        from graminelibos.durations import assign_shards
+        index, count = shard
+        # a whole class goes to one shard, so that its setUpClass() doesn't run in each of them
+        shards = assign_shards(durations, count, groups)
+        deselected = [item for item, item_shard in zip(items, shards) if item_shard != index]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        selected = [i for i, item_shard in enumerate(shards) if item_shard == index]
+        items[:] = [items[i] for i in selected]
+        durations = [durations[i] for i in selected]
+        groups = [groups[i] for i in selected]
+
+    # when running in parallel (our shards or pytest-xdist workers), start with the longest tests,
+    # so that the shards don't wait for one long test at the end
+    if known and (shard is not None or hasattr(config, 'workerinput')):
+        # pylint: disable=import-outside-toplevel
+        from graminelibos.durations import order_longest_first
+        items[:] = [items[i] for i in order_longest_first(groups, durations)]
+
+def _load_expected_durations(path, *, before):
+    # pylint: disable=import-outside-toplevel
+    from graminelibos.durations import open_duration_db
+    db = open_duration_db(path)
+    if db is None:
+        return {}
+    with db:
+        return db.expected_durations(_DURATIONS_MODE, before=before)
+
+def _record_durations(config):
+    # pylint: disable=import-outside-toplevel
+    from graminelibos.durations import open_duration_db, find_regressions
+    results = {nodeid: (test['duration'], test['outcome'])
+        for nodeid, test in _results_log.tests.items() if test['outcome'] is not None}
+    passed = {nodeid: duration for nodeid, (duration, outcome) in results.items()
+        if outcome == 'passed'}
+    _results_log.regressions = find_regressions(passed, _results_log.expected_durations,
+        threshold=config.getoption('duration_threshold'))
+
+    db = open_duration_db(config.getoption('durations_db'))
+    if db is not None:
+        with db:
+            db.add_session(_DURATIONS_MODE, _results_log.start_time, results)
+
+def pytest_sessionstart(session):
+    path = session.config.getoption('results_json')
+    if path is not None:
+        workerinput = getattr(session.config, 'workerinput', None)
+        if workerinput is not None:
+            # pytest-xdist worker, each one runs a separate session
+            path = f'{path}.{workerinput["workerid"]}'
+        path = os.path.abspath(path)
+    _results_log.start(path)
+
+def pytest_runtest_logstart(nodeid, location): # pylint: disable=unused-argument
+    _results_log.current_test = nodeid
+
+def pytest_runtest_logreport(report):
+    _results_log.add_report(report)
+
+def pytest_runtest_logfinish(nodeid, location): # pylint: disable=unused-argument
+    _results_log.current_test = None
+
+def pytest_sessionfinish(session, exitstatus):
+    _results_log.write(exitstatus)
+    # with pytest-xdist, the main process gets reports from all the workers and records them
+    if (session.config.getoption('durations_db') is not None and _results_log.tests
+            and not hasattr(session.config, 'workerinput')):
+        _record_durations(session.config)
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results_log.regressions:
+        return
+    terminalreporter.section('tests slower than usual')
+    for nodeid, duration, expected in _results_log.regressions:
+        terminalreporter.write_line(
+            f'{duration / expected - 1:+6.0%} {duration:8.2f}s (usually {expected:.2f}s) {nodeid}')
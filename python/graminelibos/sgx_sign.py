@@ -6,11 +6,17 @@
 #                    Wojtek Porczyk <woju@invisiblethingslab.com>
 #
 
+import array
+import concurrent.futures
+import contextlib
 import functools
 import hashlib
+import io
 import os
 import pathlib
 import struct
+import sys
+import typing
 
 import click
 
@@ -20,6 +26,7 @@ from cryptography.hazmat.primitives.asymmetric import padding, rsa
 import elftools.elf.elffile
 
 from . import _CONFIG_PKGLIBDIR
+from .hash_cache import open_hash_cache
 from .manifest import Manifest
 from .sigstruct import Sigstruct
 
@@ -135,17 +142,113 @@ PAGEINFO_TCS = 0x100
 PAGEINFO_REG = 0x200
 
 
+def _iter_loadcmds(file):
+    for seg in elftools.elf.elffile.ELFFile(file).iter_segments():
+        if seg.header.p_type != 'PT_LOAD':
+            continue
+        yield (
+            seg.header.p_offset,
+            seg.header.p_vaddr,
+            seg.header.p_filesz,
+            seg.header.p_memsz,
+            seg.header.p_flags)
+
+
 def get_loadcmds(elf_filename):
     with open(elf_filename, 'rb') as file:
-        for seg in elftools.elf.elffile.ELFFile(file).iter_segments():
-            if seg.header.p_type != 'PT_LOAD':
-                continue
-            yield (
-                seg.header.p_offset,
-                seg.header.p_vaddr,
-                seg.header.p_filesz,
-                seg.header.p_memsz,
-                seg.header.p_flags)
+        yield from _iter_loadcmds(file)
+
+
+class ElfImage:
+    """Pages of an ELF file, as loaded into enclave memory.
+
+    This is parsed once for a given file, and then reused for all enclaves that load this file (see
+    :py:func:`load_elf_image`). Measurement records of the pages are also prepared only once, see
+    :py:class:`PageRecords`.
+
+    Args:
+        data (bytes): contents of the ELF file
+    """
+    def __init__(self, data):
+        file = io.BytesIO(data)
+        #: entry point (e_entry)
+        self.entry = elftools.elf.elffile.ELFFile(file).header.e_entry
+        loadcmds = list(_iter_loadcmds(file))
+
+        mapaddr = 0xffffffffffffffff
+        mapaddr_end = 0
+        for (_, addr, _, memsize, _) in loadcmds:
+            if rounddown(addr) < mapaddr:
+                mapaddr = rounddown(addr)
+            if roundup(addr + memsize) > mapaddr_end:
+                mapaddr_end = roundup(addr + memsize)
+
+        #: lowest address of the image (for PIE this is usually 0)
+        self.mapaddr = mapaddr
+        #: size of the image
+        self.size = mapaddr_end - mapaddr
+
+        #: list of ``(offset from mapaddr, p_flags, content)``, one tuple for each PT_LOAD segment,
+        #: with *content* covering whole pages
+        self.segments = []
+        for (offset, addr, filesize, memsize, prot) in loadcmds:
+            # The pages are mapped from the file starting at rounddown(offset), with the parts of
+            # the file before offset and after offset + filesize replaced by zeros.
+            m_size = roundup(addr + memsize) - rounddown(addr)
+            content = bytearray(m_size)
+            start = offset - rounddown(offset)
+            if start < m_size:
+                length = min(filesize, m_size - start)
+                if offset + length > len(data):
+                    raise Exception('wrong calculation')
+                content[start:start + length] = data[offset:offset + length]
+            self.segments.append((rounddown(addr) - mapaddr, prot, bytes(content)))
+
+        self._records = {}
+
+    def measure_segment(self, digest, index, offset, flags):
+        """Add pages of a segment to enclave measurement.
+
+        Args:
+            digest (hashlib.sha256): the measurement
+            index (int): index of the segment in :py:attr:`segments`
+            offset (int): offset of the first page of the segment from enclave base
+            flags (int): ``PAGEINFO_*`` flags of the pages
+        """
+        try:
+            records = self._records[index, flags]
+        except KeyError:
+            records = self._records[index, flags] = PageRecords(flags, self.segments[index][2])
+        records.measure(digest, offset)
+
+
+_ELF_IMAGE_CACHE_SIZE = 4
+_elf_images = {}
+
+def load_elf_image(path):
+    """Load ELF file, reusing the result of previous call for the same file.
+
+    The file is read on each call, and reused only if both path and sha256 of the contents match.
+
+    Args:
+        path (path-like): path to the ELF file
+
+    Returns:
+        ElfImage: the image
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    key = os.path.realpath(path), hashlib.sha256(data).digest()
+
+    try:
+        return _elf_images[key]
+    except KeyError:
+        pass
+
+    while len(_elf_images) >= _ELF_IMAGE_CACHE_SIZE:
+        del _elf_images[next(iter(_elf_images))]
+    image = _elf_images[key] = ElfImage(data)
+    return image
 
 
 class MemoryArea:
@@ -161,18 +264,13 @@ class MemoryArea:
         self.flags = flags
         self.measure = measure
 
+        self.elf_image = None
+
         if elf_filename:
-            mapaddr = 0xffffffffffffffff
-            mapaddr_end = 0
-            for (_, addr_, _, memsize, _) in get_loadcmds(elf_filename):
-                if rounddown(addr_) < mapaddr:
-                    mapaddr = rounddown(addr_)
-                if roundup(addr_ + memsize) > mapaddr_end:
-                    mapaddr_end = roundup(addr_ + memsize)
-
-            self.size = mapaddr_end - mapaddr
-            if mapaddr > 0:
-                self.addr = mapaddr
+            self.elf_image = load_elf_image(elf_filename)
+            self.size = self.elf_image.size
+            if self.elf_image.mapaddr > 0:
+                self.addr = self.elf_image.mapaddr
 
         if self.addr is not None:
             self.addr = rounddown(self.addr)
@@ -261,7 +359,7 @@ def gen_area_content(attr, areas, enclave_base, enclave_heap_min):
         set_tcs_field(t, offs.TCS_OSSA, '<Q', ssa_offset)
         set_tcs_field(t, offs.TCS_NSSA, '<L', offs.SSA_FRAME_NUM)
         set_tcs_field(t, offs.TCS_OENTRY, '<Q',
-                      pal_area.addr + entry_point(pal_area.elf_filename) - enclave_base)
+                      pal_area.addr + pal_area.elf_image.entry - enclave_base)
         set_tcs_field(t, offs.TCS_OGS_BASE, '<Q', tls_area.addr - enclave_base + offs.PAGESIZE * t)
         set_tcs_field(t, offs.TCS_OFS_LIMIT, '<L', 0xfff)
         set_tcs_field(t, offs.TCS_OGS_LIMIT, '<L', 0xfff)
@@ -322,36 +420,138 @@ def populate_memory_areas(attr, areas, enclave_base, enclave_heap_min):
     return areas + free_areas
 
 
-def generate_measurement(enclave_base, attr, areas, verbose=False):
-    # pylint: disable=too-many-statements,too-many-branches,too-many-locals
+# Records hashed into MRENCLAVE, see SDM vol. 3D 38.7 "ECREATE", "EADD" and "EEXTEND"
+_ECREATE = struct.Struct('<8sLQ44s')
+_EADD = struct.Struct('<8sQQ40s')
+_EEXTEND = struct.Struct('<8sQ48s')
+_EEXTEND_CHUNK_SIZE = 256
 
-    def do_ecreate(digest, size):
-        data = struct.pack('<8sLQ44s', b'ECREATE', offs.SSA_FRAME_SIZE // offs.PAGESIZE, size, b'')
-        digest.update(data)
+# approximate number of bytes of records fed to the digest at once
+_MEASUREMENT_BATCH_SIZE = 1024 * 1024
 
-    def do_eadd(digest, offset, flags):
-        assert offset < attr['enclave_size']
-        data = struct.pack('<8sQQ40s', b'EADD', offset, flags, b'')
-        digest.update(data)
 
-    def do_eextend(digest, offset, content):
-        assert offset < attr['enclave_size']
+def _page_template(flags, measure):
+    eadd = _EADD.pack(b'EADD', 0, flags, b'')
+    if not measure:
+        return eadd
+    eextend = _EEXTEND.pack(b'EEXTEND', 0, b'') + bytes(_EEXTEND_CHUNK_SIZE)
+    return eadd + eextend * (offs.PAGESIZE // _EEXTEND_CHUNK_SIZE)
 
-        if len(content) != 256:
-            raise ValueError('Exactly 256 bytes expected')
 
-        data = struct.pack('<8sQ48s', b'EEXTEND', offset, b'')
-        digest.update(data)
-        digest.update(content)
+def _set_offsets(qview, record_size, offset, count):
+    # Write offsets of *count* consecutive pages, starting at *offset*, into the records in *qview*
+    # (memoryview cast to 'Q'). Each page has *record_size* bytes of records: EADD, then optionally
+    # EEXTEND records, each followed by 256 bytes of contents. In both EADD and EEXTEND, the offset
+    # is the second uint64 field.
+    stride = record_size // 8
+
+    # (index of the offset field in the records of the first page, offset relative to the page)
+    fields = [(1, 0)]
+    if record_size > _EADD.size:
+        for chunk in range(offs.PAGESIZE // _EEXTEND_CHUNK_SIZE):
+            record = _EADD.size + chunk * (_EEXTEND.size + _EEXTEND_CHUNK_SIZE)
+            fields.append((record // 8 + 1, chunk * _EEXTEND_CHUNK_SIZE))
+
+    for first, delta in fields:
+        start = offset + delta
+        offsets = array.array('Q', range(start, start + count * offs.PAGESIZE, offs.PAGESIZE))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        qview[first:first + count * stride:stride] = offsets
 
-    def include_page(digest, addr, flags, content, measure):
-        if len(content) != offs.PAGESIZE:
-            raise ValueError('Exactly one page expected')
 
-        do_eadd(digest, addr - enclave_base, flags)
-        if measure:
-            for i in range(0, offs.PAGESIZE, 256):
-                do_eextend(digest, addr - enclave_base + i, content[i:i + 256])
+class PageRecords:
+    """EADD and EEXTEND records of measured pages with given contents.
+
+    Building the records (mostly copying the contents in 256-byte chunks between EEXTEND headers)
+    does not depend on the address at which the pages are loaded, so this can be prepared once and
+    then used for measuring the same pages in many enclaves.
+
+    Args:
+        flags (int): ``PAGEINFO_*`` flags of the pages
+        content (bytes-like): contents of the pages, the size must be a multiple of page size
+    """
+    def __init__(self, flags, content):
+        if len(content) % offs.PAGESIZE:
+            raise ValueError('Whole pages expected')
+        #: number of pages
+        self.npages = len(content) // offs.PAGESIZE
+
+        template = _page_template(flags, True)
+        self._record_size = len(template)
+        self._buffer = bytearray(template * self.npages)
+
+        dst = _EADD.size + _EEXTEND.size
+        with memoryview(content) as src, memoryview(self._buffer) as view:
+            for src_offset in range(0, len(content), _EEXTEND_CHUNK_SIZE):
+                view[dst:dst + _EEXTEND_CHUNK_SIZE] = src[src_offset:src_offset
+                    + _EEXTEND_CHUNK_SIZE]
+                dst += _EEXTEND.size + _EEXTEND_CHUNK_SIZE
+                if (src_offset + _EEXTEND_CHUNK_SIZE) % offs.PAGESIZE == 0:
+                    # skip EADD of the next page
+                    dst += _EADD.size
+
+    def measure(self, digest, offset):
+        """Add the pages to enclave measurement.
+
+        Args:
+            digest (hashlib.sha256): the measurement
+            offset (int): offset of the first page from enclave base
+        """
+        with memoryview(self._buffer) as view, view.cast('Q') as qview:
+            _set_offsets(qview, self._record_size, offset, self.npages)
+            digest.update(view)
+
+
+def measure_pages(digest, offset, flags, npages, content=None, measure=True):
+    """Add pages to enclave measurement.
+
+    This is equivalent to EADD of each page followed by (if *measure*) EEXTEND of each of its
+    256-byte chunks, but instead of packing each record separately, the records for many pages are
+    written into one buffer, which is then hashed at once. The only field that differs between the
+    pages is the offset, so the buffer is prepared once and only the offsets (and the contents, if
+    any) are updated for subsequent batches.
+
+    Args:
+        digest (hashlib.sha256): the measurement
+        offset (int): offset of the first page from enclave base
+        flags (int): ``PAGEINFO_*`` flags of the pages
+        npages (int): number of pages
+        content (bytes-like or None): contents of exactly *npages* pages, or :py:obj:`None` for
+            zero pages
+        measure (bool): whether the contents are measured (EEXTEND), or only the pages are added
+    """
+    if not npages:
+        return
+    if content is not None and len(content) != npages * offs.PAGESIZE:
+        raise ValueError(f'Exactly {npages} pages expected')
+
+    if measure and content is not None:
+        PageRecords(flags, content).measure(digest, offset)
+        return
+
+    template = _page_template(flags, measure)
+    batch_pages = max(1, _MEASUREMENT_BATCH_SIZE // len(template))
+
+    buffer = bytearray(template * min(npages, batch_pages))
+    with memoryview(buffer) as view, view.cast('Q') as qview:
+        for first_page in range(0, npages, batch_pages):
+            count = min(batch_pages, npages - first_page)
+            _set_offsets(qview, len(template), offset + first_page * offs.PAGESIZE, count)
+            digest.update(view[:count * len(template)])
+
+
+def generate_measurement(enclave_base, attr, areas, verbose=False):
+    # pylint: disable=too-many-statements,too-many-branches,too-many-locals
+
+    def do_ecreate(digest, size):
+        data = _ECREATE.pack(b'ECREATE', offs.SSA_FRAME_SIZE // offs.PAGESIZE, size, b'')
+        digest.update(data)
+
+    def include_pages(digest, addr, flags, npages, content, measure):
+        offset = addr - enclave_base
+        assert offset + npages * offs.PAGESIZE <= attr['enclave_size']
+        measure_pages(digest, offset, flags, npages, content, measure)
 
     mrenclave = hashlib.sha256()
     do_ecreate(mrenclave, attr['enclave_size'])
@@ -378,80 +578,37 @@ def generate_measurement(enclave_base, attr, areas, verbose=False):
 
         print(f'    {addr:016x}-{addr+size:016x} [{type_}:{prot}] {desc}')
 
-    def load_file(digest, file, offset, addr, filesize, memsize, desc, flags):
-        # pylint: disable=too-many-arguments
-        f_addr = rounddown(offset)
-        m_addr = rounddown(addr)
-        m_size = roundup(addr + memsize) - m_addr
-
-        if verbose:
-            print_area(m_addr, m_size, flags, desc, True)
-
-        for page in range(m_addr, m_addr + m_size, offs.PAGESIZE):
-            start = page - m_addr + f_addr
-            end = start + offs.PAGESIZE
-            start_zero = b''
-            if start < offset:
-                if offset - start >= offs.PAGESIZE:
-                    start_zero = ZERO_PAGE
-                else:
-                    start_zero = bytes(offset - start)
-            end_zero = b''
-            if end > offset + filesize:
-                if end - offset - filesize >= offs.PAGESIZE:
-                    end_zero = ZERO_PAGE
-                else:
-                    end_zero = bytes(end - offset - filesize)
-            start += len(start_zero)
-            end -= len(end_zero)
-            if start < end:
-                file.seek(start)
-                data = file.read(end - start)
-            else:
-                data = b''
-            if len(start_zero + data + end_zero) != offs.PAGESIZE:
-                raise Exception('wrong calculation')
-
-            include_page(digest, page, flags, start_zero + data + end_zero, True)
-
     if verbose:
         print('Memory:')
 
     for area in areas:
-        if area.elf_filename is not None:
-            with open(area.elf_filename, 'rb') as file:
-                loadcmds = list(get_loadcmds(area.elf_filename))
-                if loadcmds:
-                    mapaddr = 0xffffffffffffffff
-                    for (offset, addr, filesize, memsize,
-                         prot) in loadcmds:
-                        if rounddown(addr) < mapaddr:
-                            mapaddr = rounddown(addr)
-                baseaddr_ = area.addr - mapaddr
-                for (offset, addr, filesize, memsize, prot) in loadcmds:
-                    flags = area.flags
-                    if prot & 4:
-                        flags = flags | PAGEINFO_R
-                    if prot & 2:
-                        flags = flags | PAGEINFO_W
-                    if prot & 1:
-                        flags = flags | PAGEINFO_X
-
-                    if flags & PAGEINFO_X:
-                        desc = 'code'
-                    else:
-                        desc = 'data'
-                    load_file(mrenclave, file, offset, baseaddr_ + addr, filesize, memsize,
-                              desc, flags)
+        if area.elf_image is not None:
+            for i, (page_offset, prot, content) in enumerate(area.elf_image.segments):
+                flags = area.flags
+                if prot & 4:
+                    flags = flags | PAGEINFO_R
+                if prot & 2:
+                    flags = flags | PAGEINFO_W
+                if prot & 1:
+                    flags = flags | PAGEINFO_X
+
+                if flags & PAGEINFO_X:
+                    desc = 'code'
+                else:
+                    desc = 'data'
+
+                addr = area.addr + page_offset
+                if verbose:
+                    print_area(addr, len(content), flags, desc, True)
+                assert addr - enclave_base + len(content) <= attr['enclave_size']
+                area.elf_image.measure_segment(mrenclave, i, addr - enclave_base, flags)
         else:
-            for addr in range(area.addr, area.addr + area.size, offs.PAGESIZE):
-                data = ZERO_PAGE
-                if area.content is not None:
-                    start = addr - area.addr
-                    end = start + offs.PAGESIZE
-                    data = area.content[start:end]
-                    data += b'\0' * (offs.PAGESIZE - len(data)) # pad last page
-                include_page(mrenclave, addr, area.flags, data, area.measure)
+            content = None
+            if area.content is not None and area.measure:
+                content = bytearray(area.size)
+                content[:len(area.content)] = area.content[:area.size]
+            include_pages(mrenclave, area.addr, area.flags, area.size // offs.PAGESIZE, content,
+                area.measure)
 
             if verbose:
                 print_area(area.addr, area.size, area.flags, area.desc, area.measure)
@@ -462,9 +619,28 @@ def generate_measurement(enclave_base, attr, areas, verbose=False):
 def get_mrenclave_and_manifest(manifest_path, libpal, verbose=False):
     with open(manifest_path, 'rb') as f: # pylint: disable=invalid-name
         manifest_data = f.read()
+    return get_mrenclave_and_manifest_from_bytes(manifest_data, libpal, verbose=verbose)
+
+
+def get_mrenclave_and_manifest_from_bytes(manifest_data, libpal, verbose=False):
+    """Measure the enclave for a manifest that is already in memory.
+
+    This is like :py:func:`get_mrenclave_and_manifest`, but the manifest is given as bytes (e.g.
+    from :py:meth:`graminelibos.Manifest.dumps`), so it does not need to be read back from disk.
+
+    Args:
+        manifest_data (bytes): serialised manifest, exactly as it will be loaded into enclave
+        libpal (path-like): path to libpal file
+        verbose (bool): if true, print details to stdout
+
+    Returns:
+        (bytes, graminelibos.Manifest): MRENCLAVE and parsed manifest
+    """
     manifest = Manifest.loads(manifest_data.decode('utf-8'))
+    return _get_mrenclave(manifest_data, manifest['sgx'], libpal, verbose), manifest
 
-    manifest_sgx = manifest['sgx']
+
+def _get_mrenclave(manifest_data, manifest_sgx, libpal, verbose):
     attr = {
         'enclave_size': parse_size(manifest_sgx['enclave_size']),
         'edmm_enable': manifest_sgx.get('edmm_enable', False),
@@ -508,7 +684,7 @@ def get_mrenclave_and_manifest(manifest_path, libpal, verbose=False):
         print('Measurement:')
         print(f'    {mrenclave.hex()}')
 
-    return mrenclave, manifest
+    return mrenclave
 
 
 def get_tbssigstruct(manifest_path, date, libpal=SGX_LIBPAL, verbose=False):
@@ -528,9 +704,57 @@ def get_tbssigstruct(manifest_path, date, libpal=SGX_LIBPAL, verbose=False):
     """
 
     mrenclave, manifest = get_mrenclave_and_manifest(manifest_path, libpal, verbose=verbose)
+    return _make_tbssigstruct(mrenclave, manifest['sgx'], date)
+
+
+def get_tbssigstruct_from_bytes(manifest_data, date, libpal=SGX_LIBPAL, verbose=False, *,
+        manifest=None):
+    """Generate To Be Signed Sigstruct (TBSSIGSTRUCT) for a manifest that is already in memory.
+
+    This is like :py:func:`get_tbssigstruct`, but the manifest is not read from disk. If the caller
+    has also the :py:class:`graminelibos.Manifest` object from which *manifest_data* was serialised,
+    it can be passed as *manifest*, and then the manifest is not parsed at all.
+
+    Args:
+        manifest_data (bytes): Serialised manifest (the contents of ``.manifest.sgx`` file).
+        date (date): Date to put into SIGSTRUCT.
+        libpal (:obj:`str`, optional): Path to the libpal file.
+        verbose (:obj:`bool`, optional): If true, print details to stdout.
+        manifest (:obj:`graminelibos.Manifest`, optional): The manifest, which *manifest_data* is
+            serialisation of.
+
+    Returns:
+        Sigstruct: SIGSTRUCT generated from provided data.
+    """
+    if manifest is None:
+        mrenclave, manifest = get_mrenclave_and_manifest_from_bytes(manifest_data, libpal,
+            verbose=verbose)
+    else:
+        mrenclave = _get_mrenclave(manifest_data, manifest['sgx'], libpal, verbose)
+    return _make_tbssigstruct(mrenclave, manifest['sgx'], date)
+
+
+def get_tbssigstruct_from_manifest(manifest, date, libpal=SGX_LIBPAL, verbose=False):
+    """Generate To Be Signed Sigstruct (TBSSIGSTRUCT) for a :py:class:`graminelibos.Manifest`.
+
+    The manifest is serialised exactly as by :py:meth:`graminelibos.Manifest.dump`, so the result
+    is valid for ``.manifest.sgx`` file written by that method. If you need to write the file
+    anyway, use :py:func:`get_tbssigstruct_from_bytes` to avoid serialising the manifest twice.
+
+    Args:
+        manifest (graminelibos.Manifest): The manifest, with trusted files already expanded.
+        date (date): Date to put into SIGSTRUCT.
+        libpal (:obj:`str`, optional): Path to the libpal file.
+        verbose (:obj:`bool`, optional): If true, print details to stdout.
 
-    manifest_sgx = manifest['sgx']
+    Returns:
+        Sigstruct: SIGSTRUCT generated from provided data.
+    """
+    return get_tbssigstruct_from_bytes(manifest.dumps().encode('utf-8'), date, libpal, verbose,
+        manifest=manifest)
 
+
+def _make_tbssigstruct(mrenclave, manifest_sgx, date):
     sig = Sigstruct()
 
     sig['date_year'] = date.year
@@ -549,6 +773,123 @@ def get_tbssigstruct(manifest_path, date, libpal=SGX_LIBPAL, verbose=False):
     return sig
 
 
+class SignJob(typing.NamedTuple):
+    """A manifest to be signed by :py:func:`sign_many`."""
+    #: path to the input ``.manifest`` file
+    manifest: str
+    #: path to the output ``.manifest.sgx`` file
+    output: str
+    #: path to the output ``.sig`` file
+    sigfile: str
+
+
+class SignResult(typing.NamedTuple):
+    """Outcome of signing a single manifest by :py:func:`sign_many`."""
+    #: the job
+    job: SignJob
+    #: list of expanded trusted files (like returned by
+    #: :py:meth:`graminelibos.Manifest.expand_all_trusted_files`), or :py:obj:`None` on error
+    expanded: typing.Optional[list]
+    #: the signed SIGSTRUCT, or :py:obj:`None` on error
+    sigstruct: typing.Optional[Sigstruct]
+    #: the exception that caused the failure, or :py:obj:`None` on success
+    error: typing.Optional[Exception]
+
+
+def _expand_and_measure(job, *, libpal, chroot, hash_cache_kwargs, hashing_jobs):
+    with open(job.manifest, 'r', encoding='utf-8') as file:
+        manifest = Manifest.load(file)
+
+    with open_hash_cache(**hash_cache_kwargs) as hash_cache:
+        expanded = manifest.expand_all_trusted_files(chroot=chroot, jobs=hashing_jobs,
+            hash_cache=hash_cache)
+
+    manifest_data = manifest.dumps().encode('utf-8')
+    with open(job.output, 'wb') as file:
+        file.write(manifest_data)
+
+    mrenclave = _get_mrenclave(manifest_data, manifest['sgx'], libpal, False)
+    return expanded, mrenclave, manifest['sgx']
+
+
+def sign_many(jobs, sign_func, *, date, libpal=SGX_LIBPAL, chroot=None, workers=None,
+        hash_cache=True, hash_cache_verify=0):
+    """Expand, measure and sign many manifests.
+
+    This is equivalent to running :program:`gramine-sgx-sign` for each manifest, but the expensive
+    setup (loading the key, parsing libpal) is done only once, and the manifests are expanded and
+    measured in a pool of worker processes. Signing itself is done in the calling process, one
+    manifest at a time, so *sign_func* does not need to be picklable or thread-safe.
+
+    A failure in one manifest does not stop processing of the others. The failures are reported in
+    the returned list, which is in the same order as *jobs*, regardless of the order in which the
+    workers finished.
+
+    Args:
+        jobs (iterable of SignJob): manifests to sign
+        sign_func (callable): signing function, see :py:meth:`graminelibos.Sigstruct.sign`
+        date (datetime.date): date to put into SIGSTRUCT
+        libpal (path-like): path to libpal file
+        chroot (path-like or None): optional chroot, in which trusted files are measured
+        workers (int or None): number of worker processes; if :py:obj:`None`, use the number of
+            CPUs; if ``1``, everything is done in the calling process
+        hash_cache (bool): whether to use the persistent cache of hashes of trusted files
+        hash_cache_verify (float): fraction of cache hits to verify, see
+            :py:class:`graminelibos.hash_cache.HashCache`
+
+    Returns:
+        list of SignResult: the outcome for each job
+
+    Raises:
+        ValueError: when two jobs have the same output file or sigfile
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    jobs = list(jobs)
+
+    seen = set()
+    for job in jobs:
+        for path in (job.output, job.sigfile):
+            path = os.path.realpath(path)
+            if path in seen:
+                raise ValueError(f'{path!r} is output of more than one job')
+            seen.add(path)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    func = functools.partial(_expand_and_measure, libpal=libpal, chroot=chroot,
+        hash_cache_kwargs={'enabled': hash_cache, 'verify_ratio': hash_cache_verify},
+        # if manifests are processed in parallel, don't parallelise further
+        hashing_jobs=None if workers == 1 else 1)
+
+    with contextlib.ExitStack() as stack:
+        if workers == 1:
+            outcomes = [functools.partial(func, job) for job in jobs]
+        else:
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(max_workers=workers))
+            futures = [executor.submit(func, job) for job in jobs]
+            # on error (in this process) don't wait for the rest of manifests
+            stack.callback(lambda: [future.cancel() for future in futures])
+            outcomes = [future.result for future in futures]
+
+        results = []
+        for job, outcome in zip(jobs, outcomes):
+            try:
+                expanded, mrenclave, manifest_sgx = outcome()
+                sigstruct = _make_tbssigstruct(mrenclave, manifest_sgx, date)
+                sigstruct.sign(sign_func)
+                with open(job.sigfile, 'wb') as file:
+                    file.write(sigstruct.to_bytes())
+            except Exception as err: # pylint: disable=broad-except
+                results.append(SignResult(job, None, None, err))
+            else:
+                results.append(SignResult(job, expanded, sigstruct, None))
+
+    return results
+
+
 @click.command(add_help_option=False)
 @click.pass_context
 @click.help_option('--help-file')
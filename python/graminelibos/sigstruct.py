@@ -2,20 +2,35 @@
 # Copyright (C) 2021 Intel Corporation
 #                    Borys Popławski <borysp@invisiblethingslab.com>
 
+import concurrent.futures
+import hashlib
+import os
 import struct
 import sys
 
 import _graminelibos_offsets as offs # pylint: disable=import-error
 
 
+# Fields stored in yyyymmdd format in hex, see the comment in Sigstruct._pack_date()
+_DATE_FIELDS = ('date_year', 'date_month', 'date_day')
+
+# Fields which are set when signing
+_SIGNATURE_FIELDS = ('modulus', 'exponent', 'signature', 'q1', 'q2')
+
+
 class Sigstruct:
     """Class for holding SGX SIGSTRUCT.
 
     Each field can be accessed and modified using ``[]`` operator. Accessing or setting an unknown
     key raises ``KeyError`` and setting a key to a value not matching required format raises
     ``ValueError``.
+
+    The SIGSTRUCT is kept in its binary form, so :py:meth:`from_bytes` and :py:meth:`to_bytes` don't
+    need to convert the fields.
     """
 
+    __slots__ = ('_buffer', '_fields_set')
+
     fields = {
         'header': (offs.SGX_ARCH_SIGSTRUCT_HEADER, '16s'),
         'vendor': (offs.SGX_ARCH_SIGSTRUCT_VENDOR, '<L'),
@@ -51,30 +66,91 @@ class Sigstruct:
         'attribute_xfrm_mask': offs.SGX_XFRM_MASK_CONST,
     }
 
+    # (offset, struct.Struct) of each field
+    _layout = {key: (offset, struct.Struct(fmt)) for key, (offset, fmt) in fields.items()}
+
+    _all_fields = frozenset(fields)
+    _default_fields = frozenset(defaults)
+    _default_buffer = bytearray(offs.SGX_ARCH_SIGSTRUCT_SIZE)
+    for _key, _value in defaults.items():
+        _layout[_key][1].pack_into(_default_buffer, _layout[_key][0], _value)
+    _default_buffer = bytes(_default_buffer)
+    del _key, _value
+
 
     def __init__(self):
-        self._data = {}
-        for k, v in self.defaults.items():
-            self._data[k] = v
+        # Either a bytearray, or a read-only memoryview of the buffer passed to from_bytes(), which
+        # is copied only when the SIGSTRUCT is modified.
+        self._buffer = bytearray(self._default_buffer)
+        # frozenset, shared between instances until modified
+        self._fields_set = self._default_fields
 
 
     def __getitem__(self, key):
-        return self._data[key]
+        if key not in self._fields_set:
+            raise KeyError(key)
+        offset, packer = self._layout[key]
+        value, = packer.unpack_from(self._buffer, offset)
+        if key in _DATE_FIELDS:
+            return self._unpack_date(key, value)
+        return value
 
 
     def __setitem__(self, key, val):
         try:
-            struct.pack(self.fields[key][1], val)
+            offset, packer = self._layout[key]
         except KeyError:
             raise KeyError(f'unknown field name {key}')
-        except struct.error:
+
+        try:
+            # not pack_into(), which on error leaves the field zeroed
+            packed = packer.pack(self._pack_date(val) if key in _DATE_FIELDS else val)
+        except (struct.error, ValueError):
             raise ValueError(f'{val} does not match required format {self.fields[key][1]}')
 
-        self._data[key] = val
+        if not isinstance(self._buffer, bytearray):
+            self._buffer = bytearray(self._buffer)
+        self._buffer[offset:offset + packer.size] = packed
+
+        if key not in self._fields_set:
+            self._fields_set = self._fields_set | {key}
 
 
     def __contains__(self, key):
-        return key in self._data
+        return key in self._fields_set
+
+
+    @staticmethod
+    def _pack_date(val):
+        # `SIGSTRUCT.DATE` (signing date) is stored in yyyymmdd format in hex: yyyy=4 digit year,
+        # mm=1-12, dd=1-31 according to Intel SDM (Table 35-21. Layout of Enclave Signature
+        # Structure (SIGSTRUCT), Chapter 34, Volume 3, version March 2023). Further, SGX SDK and
+        # some code signing systems interpret it as "Binary-coded decimal", e.g., expecting
+        # "14 04 23 20" rather than "0e 04 e7 07" for date "2023-04-14" in its byte
+        # representation. See below for details:
+        # - https://github.com/intel/linux-sgx/blob/1efe23c20e37f868498f8287921eedfbcecdc216/sdk/sign_tool/SignTool/manage_metadata.cpp#L252-L253
+        # - https://en.wikipedia.org/wiki/Binary-coded_decimal
+        # We thus treat the date-related inputs as if they are hex numbers.
+        return int(f'{val:d}', 16)
+
+
+    @staticmethod
+    def _unpack_date(key, value):
+        try:
+            return int(f'{value:x}')
+        except ValueError:
+            print(f'Misencoded {key} in SIGSTRUCT! '
+                  f'Please consider generating a new SIGSTRUCT with "gramine-sgx-sign".',
+                  file=sys.stderr)
+            raise
+
+
+    def _verify(self, verify_sig_fields):
+        if self._fields_set is self._all_fields:
+            return
+        for key in self.fields:
+            if key not in self._fields_set and (key not in _SIGNATURE_FIELDS or verify_sig_fields):
+                raise KeyError(f'{key} is not set')
 
 
     def to_bytes(self, verify=True, verify_sig_fields=False):
@@ -91,39 +167,49 @@ class Sigstruct:
                 when `verify` is ``True``.
 
         Returns:
-            bytearray: buffer containing byte representation of this SIGSTRUCT.
+            bytes: byte representation of this SIGSTRUCT. If the SIGSTRUCT was loaded from
+            :py:class:`bytes` and not modified, this is the same object.
+
+        Raises:
+            KeyError: some SIGSTRUCT fields were not set.
+        """
+        if verify:
+            self._verify(verify_sig_fields)
+        obj = getattr(self._buffer, 'obj', None)
+        if isinstance(obj, bytes) and len(obj) == offs.SGX_ARCH_SIGSTRUCT_SIZE:
+            # not a slice of some bigger buffer
+            return obj
+        return bytes(self._buffer)
+
+
+    def to_memoryview(self, verify=True, verify_sig_fields=False):
+        """Get a read-only view of byte representation of the SIGSTRUCT, without copying it.
+
+        The view may or may not reflect later modifications of the SIGSTRUCT.
+
+        Args:
+            verify (bool): see :py:meth:`to_bytes`
+            verify_sig_fields (bool): see :py:meth:`to_bytes`
+
+        Returns:
+            memoryview: byte representation of this SIGSTRUCT.
 
         Raises:
             KeyError: some SIGSTRUCT fields were not set.
         """
-        buffer = bytearray(offs.SGX_ARCH_SIGSTRUCT_SIZE)
-        for key, (offset, fmt) in self.fields.items():
-            if key not in self:
-                if verify and (key not in ['modulus', 'exponent', 'signature', 'q1', 'q2']
-                               or verify_sig_fields):
-                    raise KeyError(f'{key} is not set')
-                continue
-            # `SIGSTRUCT.DATE` (signing date) is stored in yyyymmdd format in hex: yyyy=4 digit
-            # year, mm=1-12, dd=1-31 according to Intel SDM (Table 35-21. Layout of Enclave
-            # Signature Structure (SIGSTRUCT), Chapter 34, Volume 3, version March 2023). Further,
-            # SGX SDK and some code signing systems interpret it as "Binary-coded decimal", e.g.,
-            # expecting "14 04 23 20" rather than "0e 04 e7 07" for date "2023-04-14" in its byte
-            # representation. See below for details:
-            # - https://github.com/intel/linux-sgx/blob/1efe23c20e37f868498f8287921eedfbcecdc216/sdk/sign_tool/SignTool/manage_metadata.cpp#L252-L253
-            # - https://en.wikipedia.org/wiki/Binary-coded_decimal
-            # We thus treat the date-related inputs as if they are hex numbers.
-            if key in ['date_year', 'date_month', 'date_day']:
-                struct.pack_into(fmt, buffer, offset, int(f'{self[key]}', 16))
-                continue
-            struct.pack_into(fmt, buffer, offset, self[key])
-        return bytes(buffer)
+        if verify:
+            self._verify(verify_sig_fields)
+        view = memoryview(self._buffer)
+        # read-only views of writable buffers are available since Python 3.8
+        return view.toreadonly() if not view.readonly and hasattr(view, 'toreadonly') else view
 
 
     @classmethod
     def from_bytes(cls, buffer):
         """Load a SIGSTRUCT from bytes-like object.
 
-        Input bytes must match the required SIGSTRUCT format.
+        Input bytes must match the required SIGSTRUCT format. A read-only *buffer* (like
+        :py:class:`bytes`) is not copied, until the SIGSTRUCT is modified; other buffers are copied.
 
         Args:
             buffer (bytes-like): buffer containing SIGSTRUCT.
@@ -132,37 +218,61 @@ class Sigstruct:
             Sigstruct: parsed SIGSTRUCT object.
 
         Raises:
-            TypeError: *buffer* has a wrong type (is not bytes or bytearray).
+            TypeError: *buffer* has a wrong type (does not support the buffer protocol).
             ValueError: *buffer* does not have required length or one of the headers does not match.
         """
-        if not isinstance(buffer, bytes) and not isinstance(buffer, bytearray):
+        try:
+            view = memoryview(buffer)
+        except TypeError:
             raise TypeError(f'a bytes-like object is required, not {type(buffer).__name__}')
-        if len(buffer) != offs.SGX_ARCH_SIGSTRUCT_SIZE:
+        if view.nbytes != offs.SGX_ARCH_SIGSTRUCT_SIZE:
             raise ValueError(f'buffer len does not equal {offs.SGX_ARCH_SIGSTRUCT_SIZE}')
 
-        sig = cls()
-
-        for key, (offset, fmt) in cls.fields.items():
-            # See the analogous place in to_bytes() method for explanation.
-            if key in ['date_year', 'date_month', 'date_day']:
-                try:
-                    sig[key] = int(f'{struct.unpack_from(fmt, buffer, offset)[0]:x}')
-                except ValueError:
-                    print(f'Misencoded {key} in SIGSTRUCT! '
-                          f'Please consider generating a new SIGSTRUCT with "gramine-sgx-sign".',
-                          file=sys.stderr)
-                    raise
-                continue
-            sig[key] = struct.unpack_from(fmt, buffer, offset)[0]
-
-        if sig['header'] != cls.defaults['header']:
-            raise ValueError('header value does not mach')
-        if sig['header2'] != cls.defaults['header2']:
-            raise ValueError('header2 value does not mach')
+        sig = cls.__new__(cls)
+        sig._buffer = view.cast('B') if view.readonly else bytearray(view)
+        sig._fields_set = cls._all_fields
+
+        date = sig._buffer[offs.SGX_ARCH_SIGSTRUCT_DATE:offs.SGX_ARCH_SIGSTRUCT_DATE + 4]
+        if not date.hex().isdigit():
+            # find the misencoded field and report it
+            for key in _DATE_FIELDS:
+                sig[key] # pylint: disable=pointless-statement
+
+        for key in ('header', 'header2'):
+            offset, packer = cls._layout[key]
+            if sig._buffer[offset:offset + packer.size] != cls.defaults[key]:
+                raise ValueError(f'{key} value does not mach')
 
         return sig
 
 
+    def summary(self):
+        """Get the most important fields of the SIGSTRUCT in readable form.
+
+        This is what :program:`gramine-sgx-sigstruct-view` displays.
+
+        Returns:
+            dict: ``mr_signer``, ``mr_enclave``, ``isv_prod_id``, ``isv_svn``, ``attribute_flags``,
+            ``attribute_xfrms``, ``misc_select``, ``attribute_flags_mask``,
+            ``attribute_xfrm_mask``, ``misc_mask``, ``date`` and ``debug_enclave``; hashes and
+            masks are hex strings.
+        """
+        return {
+            'mr_signer': hashlib.sha256(self['modulus']).hexdigest(),
+            'mr_enclave': self['enclave_hash'].hex(),
+            'isv_prod_id': self['isv_prod_id'],
+            'isv_svn': self['isv_svn'],
+            'attribute_flags': hex(self['attribute_flags']),
+            'attribute_xfrms': hex(self['attribute_xfrms']),
+            'misc_select': hex(self['misc_select']),
+            'attribute_flags_mask': hex(self['attribute_flags_mask']),
+            'attribute_xfrm_mask': hex(self['attribute_xfrm_mask']),
+            'misc_mask': hex(self['misc_mask']),
+            'date': f"{self['date_year']:04}-{self['date_month']:02}-{self['date_day']:02}",
+            'debug_enclave': bool(self['attribute_flags'] & 0b10),
+        }
+
+
     def get_signing_data(self):
         data = self.to_bytes()
         assert len(data) == offs.SGX_ARCH_SIGSTRUCT_SIZE
@@ -202,3 +312,47 @@ class Sigstruct:
         self['signature'] = signature_int.to_bytes(384, byteorder='little')
         self['q1'] = q1_int.to_bytes(384, byteorder='little')
         self['q2'] = q2_int.to_bytes(384, byteorder='little')
+
+
+# Below this number of files, reading them in the current process is faster than starting worker
+# processes (parsing a SIGSTRUCT takes a few microseconds).
+_PROCESS_POOL_MIN_FILES = 5000
+
+def read_summary(path):
+    """Read a SIGSTRUCT file and get its :py:meth:`Sigstruct.summary`.
+
+    Args:
+        path (str or pathlib.Path): path to the ``.sig`` file
+
+    Returns:
+        dict: ``file`` (the path) and the summary, or ``file`` and ``error`` (a message), if the
+        file could not be read or parsed.
+    """
+    result = {'file': os.fspath(path)}
+    try:
+        with open(path, 'rb') as file:
+            result.update(Sigstruct.from_bytes(file.read()).summary())
+    except (OSError, ValueError) as err:
+        result['error'] = str(err)
+    return result
+
+def read_summaries(paths, *, jobs=None):
+    """Read many SIGSTRUCT files, in parallel if there are many of them.
+
+    Args:
+        paths (list): paths to the ``.sig`` files
+        jobs (int or None): number of worker processes; if :py:obj:`None`, use the number of CPUs
+
+    Yields:
+        dict: results of :py:func:`read_summary`, in the order of *paths*
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs == 1 or len(paths) < _PROCESS_POOL_MIN_FILES:
+        yield from map(read_summary, paths)
+        return
+
+    chunksize = max(1, min(256, len(paths) // (jobs * 4)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(read_summary, paths, chunksize=chunksize)
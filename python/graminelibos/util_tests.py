@@ -5,18 +5,23 @@
 import io
 import os
 import platform
+import shutil
 import subprocess
 import sys
+import time
 
 import tomli
 
 from . import ninja_syntax, _CONFIG_SYSLIBDIR, _CONFIG_PKGLIBDIR
 
-try:
-    from .sgx_sign import SGX_RSA_KEY_PATH as _SGX_RSA_KEY_PATH
-except ImportError:
-    # if we don't have sgx built, this won't work anyway
-    _SGX_RSA_KEY_PATH = '/dev/null'
+def _get_sgx_rsa_key_path():
+    # sgx_sign is imported only here, because it is expensive to import (cryptography, elftools)
+    try:
+        from .sgx_sign import SGX_RSA_KEY_PATH # pylint: disable=import-outside-toplevel
+    except ImportError:
+        # if we don't have sgx built, this won't work anyway
+        return '/dev/null'
+    return SGX_RSA_KEY_PATH
 
 
 class TestConfig:
@@ -38,6 +43,11 @@ class TestConfig:
 
     - `libc`: name of the libc to build against, currently supported: 'glibc' (default), 'musl'
 
+    - `scratch_paths`: files and directories in the test directory which are written by the tests,
+      so that each shard of `gramine-test pytest --jobs N` needs its own copy (directories existing
+      in the test directory are created with their subdirectories but without files, anything else
+      is not created at all); default is `["tmp"]`
+
     Ninja handles the following targets:
 
     - `NAME.manifest`, `NAME.manifest.sgx`, `NAME.sig`
@@ -69,6 +79,11 @@ class TestConfig:
 
         self.no_check = data.get('gramine-manifest-no-check', False)
 
+        self.scratch_paths = data.get('scratch_paths', ['tmp'])
+        for scratch_path in self.scratch_paths:
+            if '/' in scratch_path:
+                raise Exception(f'scratch_paths: {scratch_path!r} is not a top-level path')
+
         self.arch_libdir = _CONFIG_SYSLIBDIR
 
         # Used by LTP, for `libstdbuf.so`
@@ -84,7 +99,7 @@ class TestConfig:
 
         self.key = os.environ.get('SGX_SIGNER_KEY', None)
         if not self.key:
-            self.key = os.fspath(_SGX_RSA_KEY_PATH)
+            self.key = os.fspath(_get_sgx_rsa_key_path())
 
         self.all_manifests = self.manifests + self.sgx_manifests + self.vm_manifests
 
@@ -215,17 +230,101 @@ class TestConfig:
 def gen_build_file(conf_file_name='tests.toml'):
     config = TestConfig(conf_file_name)
     config.gen_build_file('build.ninja')
+    return config
 
 
 def exec_pytest(sgx, args):
     env = os.environ.copy()
     env['SGX'] = '1' if sgx else ''
 
-    argv = [os.path.basename(sys.executable), '-m', 'pytest'] + list(args)
+    argv = [os.path.basename(sys.executable), '-m', 'pytest', '-p', 'graminelibos.regression']
+    argv += args
     print(' '.join(argv))
     os.execve(sys.executable, argv, env)
 
 
+SHARDS_DIR = '.gramine-test-shards'
+
+# Pytest exit status when no tests were selected, which is expected for some of the shards
+_PYTEST_NO_TESTS_COLLECTED = 5
+
+def _make_shard_dir(path, scratch_paths):
+    '''
+    Create a copy of the current (test) directory, in which all the entries are symlinks to the
+    original ones, except for the scratch paths: these are private to the shard, and start with the
+    same subdirectories as the originals (which tests may expect to exist), but without any files.
+    '''
+    os.makedirs(path)
+    for name in os.listdir('.'):
+        if name in scratch_paths:
+            if os.path.isdir(name):
+                shutil.copytree(name, os.path.join(path, name),
+                    ignore=lambda directory, entries: [entry for entry in entries
+                        if not os.path.isdir(os.path.join(directory, entry))])
+        elif name not in (SHARDS_DIR, '.pytest_cache'):
+            os.symlink(os.path.abspath(name), os.path.join(path, name))
+
+
+def _combine_pytest_returncodes(returncodes):
+    ran = [returncode for returncode in returncodes if returncode != _PYTEST_NO_TESTS_COLLECTED]
+    return max(ran) if ran else _PYTEST_NO_TESTS_COLLECTED
+
+
+def run_pytest_sharded(sgx, args, *, jobs, scratch_paths):
+    '''
+    Run Pytest in `jobs` concurrent processes, each in its own copy of the test directory (see
+    `_make_shard_dir()`) and on its own part of the tests, then run the tests marked as `serial` on
+    their own. Output of each shard is printed after it finishes.
+
+    Returns:
+        int: exit status, as if a single Pytest process ran all the tests
+    '''
+    env = os.environ.copy()
+    env['SGX'] = '1' if sgx else ''
+
+    shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    # durations recorded by the shards must not change the split between the shards which did not
+    # start yet
+    argv = [sys.executable, '-m', 'pytest', '-p', 'graminelibos.regression',
+        f'--durations-before={time.time()}'] + list(args)
+
+    shards = []
+    returncodes = []
+    try:
+        for index in range(jobs):
+            shard_dir = os.path.join(SHARDS_DIR, f'shard-{index}')
+            _make_shard_dir(shard_dir, scratch_paths)
+            # pylint: disable=consider-using-with
+            log = open(os.path.join(SHARDS_DIR, f'shard-{index}.log'), 'w+b')
+            shard_argv = argv + [f'--shard={index}/{jobs}', '--serial-tests=exclude']
+            print(f'[shard {index}] ' + ' '.join(shard_argv))
+            proc = subprocess.Popen(shard_argv, cwd=shard_dir, env=env, stdout=log,
+                stderr=subprocess.STDOUT)
+            shards.append((proc, log))
+
+        for index, (proc, log) in enumerate(shards):
+            returncodes.append(proc.wait())
+            print(f'==== shard {index}/{jobs}: exit status {proc.returncode} ====', flush=True)
+            log.seek(0)
+            shutil.copyfileobj(log, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+    finally:
+        for proc, log in shards:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            log.close()
+
+    serial_dir = os.path.join(SHARDS_DIR, 'serial')
+    _make_shard_dir(serial_dir, scratch_paths)
+    serial_argv = argv + ['--serial-tests=only']
+    print('==== serial tests ====')
+    print(' '.join(serial_argv), flush=True)
+    returncodes.append(subprocess.call(serial_argv, cwd=serial_dir, env=env))
+
+    return _combine_pytest_returncodes(returncodes)
+
+
 def run_ninja(args):
     argv = ['ninja'] + list(args)
     print(' '.join(argv))
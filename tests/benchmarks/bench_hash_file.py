@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Compare throughput of trusted file hashing strategies across file sizes.
+
+Usage: python3 tests/benchmarks/bench_hash_file.py [--size BYTES]... [--total BYTES]
+"""
+
+# pylint: disable=protected-access
+
+import hashlib
+import os
+import tempfile
+import time
+
+import click
+
+from graminelibos import manifest
+
+DEFAULT_SIZES = (100, 4096, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 256 * 1024 * 1024)
+
+def hash_legacy(path):
+    # the implementation before mmap()/readinto() paths were introduced
+    with open(path, 'rb') as file:
+        sha = hashlib.sha256()
+        for chunk in iter(lambda: file.read(128 * sha.block_size), b''):
+            sha.update(chunk)
+        return sha.hexdigest()
+
+def hash_readinto(path):
+    with open(path, 'rb', buffering=0) as file:
+        sha = hashlib.sha256()
+        manifest._hash_readinto(sha, file, os.fstat(file.fileno()).st_size)
+        return sha.hexdigest()
+
+def hash_mmap(path):
+    with open(path, 'rb', buffering=0) as file:
+        sha = hashlib.sha256()
+        manifest._hash_mmap(sha, file)
+        return sha.hexdigest()
+
+STRATEGIES = {
+    'legacy': hash_legacy,
+    'readinto': hash_readinto,
+    'mmap': hash_mmap,
+    'hash_file': manifest.hash_file,
+}
+
+@click.command()
+@click.option('--size', '-s', 'sizes', type=int, multiple=True,
+    help='File size to benchmark (can be given multiple times)')
+@click.option('--total', type=int, default=256 * 1024 * 1024,
+    help='Approximate number of bytes to hash for each size and strategy')
+def main(sizes, total):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print(f'{"size":>12} {"strategy":>10} {"MB/s":>10} {"us/file":>10}')
+        for size in sizes or DEFAULT_SIZES:
+            path = os.path.join(tmpdir, f'file-{size}')
+            with open(path, 'wb') as file:
+                file.write(os.urandom(size))
+            iterations = max(3, min(10000, total // max(size, 1)))
+
+            expected = hash_legacy(path)
+            for name, func in STRATEGIES.items():
+                if name == 'mmap' and size == 0:
+                    continue
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    result = func(path)
+                elapsed = time.perf_counter() - start
+                assert result == expected, name
+                print(f'{size:12} {name:>10} {iterations * size / elapsed / 1e6:10.1f} '
+                      f'{elapsed / iterations * 1e6:10.1f}')
+
+if __name__ == '__main__':
+    main() # pylint: disable=no-value-for-parameter
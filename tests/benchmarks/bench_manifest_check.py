@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Compare manifest validation with plain voluptuous schema and with the compiled schema.
+
+Usage: python3 tests/benchmarks/bench_manifest_check.py [--entries N] [--repeat N]
+"""
+
+import time
+
+import click
+
+from graminelibos.manifest_check import GramineManifestCompiledSchema, GramineManifestSchema
+
+def make_manifest(entries):
+    return {
+        'fs': {'mounts': [{'path': '/lib', 'uri': 'file:/usr/lib'}]},
+        'libos': {'entrypoint': '/usr/bin/python3'},
+        'loader': {'entrypoint': {'uri': 'file:/usr/lib/gramine/libsysdb.so', 'sha256': '0' * 64}},
+        'sgx': {
+            'trusted_files': [
+                {'uri': f'file:/usr/lib/python3/file-{i}.py', 'sha256': f'{i:064x}'}
+                for i in range(entries)],
+            'allowed_files': [f'file:/tmp/file-{i}' for i in range(entries)],
+        },
+    }
+
+@click.command()
+@click.option('--entries', '-n', type=int, default=100000,
+    help='Number of entries in sgx.trusted_files and sgx.allowed_files')
+@click.option('--repeat', type=int, default=5, help='Number of iterations')
+def main(entries, repeat):
+    manifest = make_manifest(entries)
+    print(f'{"schema":>10} {"ms":>10}')
+    for name, schema in (('voluptuous', GramineManifestSchema),
+            ('compiled', GramineManifestCompiledSchema)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            schema(manifest)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>10} {elapsed / repeat * 1e3:10.1f}')
+
+if __name__ == '__main__':
+    main() # pylint: disable=no-value-for-parameter
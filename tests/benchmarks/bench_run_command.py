@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Measure the overhead of the test harness (regression.run_command) for tests with a lot of output.
+
+Usage: python3 tests/benchmarks/bench_run_command.py [--size BYTES] [--line-length N] [--legacy]
+"""
+
+# pylint: disable=protected-access
+
+import contextlib
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import click
+
+from graminelibos import regression
+
+class LegacyLoggingSplice:
+    # the implementation before the output was processed by whole reads
+    def __init__(self, input_pipe, output_pipe):
+        self.logged_data = b''
+        self.closed = False
+        self.at_line_start = True
+        self.input_pipe = input_pipe
+        self.output_pipe = output_pipe
+        self.start_time = time.time()
+
+    def pump_data(self, pending_reads):
+        if self.input_pipe in pending_reads:
+            data = self.input_pipe.read(1024)
+            self.logged_data += data
+
+            if not data:
+                self.closed = True
+                return
+
+            timestamped = bytearray()
+            for ch in data:
+                if self.at_line_start:
+                    timestamped += b'[%.3f] ' % (time.time() - self.start_time)
+                    self.at_line_start = False
+
+                timestamped.append(ch)
+
+                if ch == 10:
+                    self.at_line_start = True
+
+            self.output_pipe.write(timestamped)
+            self.output_pipe.flush()
+
+def make_output(size, line_length):
+    line = b'x' * (line_length - 1) + b'\n'
+    return (line * (size // line_length + 1))[:size]
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def bench_splice(splice_class, data):
+    with open(os.devnull, 'wb') as devnull:
+        input_pipe = io.BytesIO(data)
+        splice = splice_class(input_pipe, devnull)
+        while not splice.closed:
+            splice.pump_data([input_pipe])
+        assert splice.logged_data == data
+
+def bench_run_command(data):
+    with tempfile.NamedTemporaryFile() as file, open(os.devnull, 'w') as devnull:
+        file.write(data)
+        file.flush()
+        # run_command copies the output to sys.stdout
+        with contextlib.redirect_stdout(devnull):
+            _, stdout, _ = regression.run_command(['cat', file.name], timeout=600)
+        assert len(stdout) == len(data)
+
+@click.command()
+@click.option('--size', type=int, default=100 * 1024 * 1024, help='Size of the output in bytes')
+@click.option('--line-length', type=int, default=80, help='Length of lines of the output')
+@click.option('--legacy', is_flag=True,
+    help='Also measure the previous implementation (which is quadratic, use smaller --size)')
+def main(size, line_length, legacy):
+    data = make_output(size, line_length)
+    benchmarks = {
+        'splice': lambda: bench_splice(regression._LoggingSplice, data),
+        'run_command': lambda: bench_run_command(data),
+    }
+    if legacy:
+        benchmarks['legacy'] = lambda: bench_splice(LegacyLoggingSplice, data)
+
+    print(f'{"benchmark":>12} {"wall s":>10} {"cpu s":>10} {"MB/s":>10}')
+    for name, func in benchmarks.items():
+        start, start_cpu = time.perf_counter(), cpu_time()
+        func()
+        elapsed, elapsed_cpu = time.perf_counter() - start, cpu_time() - start_cpu
+        print(f'{name:>12} {elapsed:10.2f} {elapsed_cpu:10.2f} {size / elapsed / 1e6:10.1f}')
+
+if __name__ == '__main__':
+    main() # pylint: disable=no-value-for-parameter
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+"""
+Measure parsing, field access and serialisation of SIGSTRUCTs.
+
+Usage: python3 tests/benchmarks/bench_sigstruct.py [--count N]
+
+Needs Gramine installed with SGX support.
+"""
+
+import os
+import time
+
+import click
+
+from graminelibos.sigstruct import Sigstruct
+
+def make_sigstruct():
+    sig = Sigstruct()
+    sig['date_year'] = 2023
+    sig['date_month'] = 4
+    sig['date_day'] = 14
+    sig['misc_select'] = 0
+    sig['attribute_flags'] = 4
+    sig['attribute_xfrms'] = 3
+    sig['enclave_hash'] = os.urandom(32)
+    sig['isv_prod_id'] = 1
+    sig['isv_svn'] = 2
+    for key in ('modulus', 'signature', 'q1', 'q2'):
+        sig[key] = os.urandom(384)
+    sig['exponent'] = 3
+    return sig
+
+def bench_parse(blobs):
+    for blob in blobs:
+        Sigstruct.from_bytes(blob)
+
+def bench_read(blobs):
+    for blob in blobs:
+        sig = Sigstruct.from_bytes(blob)
+        sig['enclave_hash'] # pylint: disable=pointless-statement
+        sig['isv_svn'] # pylint: disable=pointless-statement
+
+def bench_roundtrip(blobs):
+    for blob in blobs:
+        Sigstruct.from_bytes(blob).to_bytes()
+
+def bench_modify(blobs):
+    for blob in blobs:
+        sig = Sigstruct.from_bytes(blob)
+        sig['isv_svn'] = 3
+        sig.to_bytes()
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'read': bench_read,
+    'roundtrip': bench_roundtrip,
+    'modify': bench_modify,
+}
+
+@click.command()
+@click.option('--count', '-n', type=int, default=100000, help='Number of SIGSTRUCTs')
+def main(count):
+    blobs = [make_sigstruct().to_bytes() for _ in range(min(count, 1000))]
+    blobs = (blobs * (count // len(blobs) + 1))[:count]
+
+    print(f'{"benchmark":>10} {"ms":>10} {"us/sigstruct":>14}')
+    for name, func in BENCHMARKS.items():
+        start = time.perf_counter()
+        func(blobs)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>10} {elapsed * 1e3:10.1f} {elapsed / count * 1e6:14.2f}')
+
+if __name__ == '__main__':
+    main() # pylint: disable=no-value-for-parameter
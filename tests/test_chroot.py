@@ -97,3 +97,44 @@ def test_enotdir_3(tmp_path):
     (tmp_path / 'target').write_text('pass')
     with pytest.raises(NotADirectoryError):
         manifest.resolve_symlinks('/target/../target', chroot=tmp_path)
+
+
+def test_resolver_enotdir_not_cached_as_eloop(tmp_path):
+    (tmp_path / 'target').write_text('pass')
+    (tmp_path / 'symlink').symlink_to('target/subdir')
+    resolver = manifest.ChrootResolver(tmp_path)
+    for _ in range(2):
+        with pytest.raises(NotADirectoryError):
+            resolver.resolve('/symlink')
+
+def test_resolver_linear(tmp_path, monkeypatch):
+    # /d/d/d/.../d, each with a relative symlink pointing to a file in the same directory
+    depth = 50
+    paths = []
+    current = tmp_path
+    inner = '/'
+    for _ in range(depth):
+        current /= 'd'
+        inner += 'd/'
+        current.mkdir()
+        (current / 'target').write_text('pass')
+        (current / 'symlink').symlink_to('target')
+        paths.append(inner + 'symlink')
+
+    stat_calls = 0
+    def wrap(orig):
+        def wrapper(*args, **kwds):
+            nonlocal stat_calls
+            stat_calls += 1
+            return orig(*args, **kwds)
+        return wrapper
+    monkeypatch.setattr(manifest.os, 'stat', wrap(manifest.os.stat))
+    monkeypatch.setattr(manifest.os, 'lstat', wrap(manifest.os.lstat))
+
+    resolver = manifest.ChrootResolver(tmp_path)
+    for path in paths:
+        inner_path = resolver.resolve(path)
+        assert (tmp_path / inner_path.relative_to('/')).read_text() == 'pass'
+
+    # each path component is looked at once, so this is linear, not quadratic in depth
+    assert 0 < stat_calls <= 5 * depth
@@ -0,0 +1,146 @@
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+
+import graminelibos
+import pytest
+from graminelibos import durations
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+@pytest.fixture
+def db(tmp_path):
+    with durations.DurationDB(tmp_path / 'durations.sqlite3', max_runs=3) as db:
+        yield db
+
+def test_duration_db(db):
+    for start_time, duration in enumerate([1.0, 2.0, 9.0, 3.0]):
+        db.add_session('direct', start_time, {'a': (duration, 'passed'), 'b': (5.0, 'failed')})
+    db.add_session('sgx', 10, {'a': (7.0, 'passed')})
+
+    # only max_runs last runs are kept, and only the passed ones are taken into account
+    assert db.history('direct') == {'a': [2.0, 9.0, 3.0]}
+    assert db.history('direct', before=3) == {'a': [2.0, 9.0]}
+    assert db.expected_durations('direct') == {'a': 3.0}
+    assert db.expected_durations('direct', window=2) == {'a': 6.0}
+    assert db.expected_durations('sgx') == {'a': 7.0}
+
+def test_open_duration_db_unavailable(tmp_path, capsys):
+    (tmp_path / 'cache').write_text('not a directory')
+    assert durations.open_duration_db(tmp_path / 'cache/durations.sqlite3') is None
+    assert 'WARNING' in capsys.readouterr().err
+
+def test_assign_shards():
+    assert durations.assign_shards([1] * 5, 2) == [0, 1, 0, 1, 0]
+    assert durations.assign_shards([1, 8, 2, 3, 4], 2) == [0, 0, 1, 1, 1]
+    # groups are not split, the longest ones are assigned first
+    assert durations.assign_shards([1] * 5, 2, ['a', 'b', 'a', 'a', 'c']) == [0, 1, 0, 0, 1]
+    assert durations.assign_shards([1, 5, 1, 1], 3, ['a', 'b', 'a', 'c']) == [1, 0, 1, 2]
+
+def test_order_longest_first():
+    groups = [('m1', 'c1'), ('m1', 'c1'), ('m1', 'f1'), ('m1', 'f2'), ('m2', 'c2'), ('m2', 'c2')]
+    # m1 (18) is longer than m2 (14), and in m1: f2 (7) > c1 (6) > f1 (5); classes keep their order
+    assert durations.order_longest_first(groups, [1, 5, 5, 7, 6, 8]) == [3, 0, 1, 2, 4, 5]
+
+def test_find_regressions():
+    expected = {'fast': 0.1, 'slow': 10.0, 'slower': 10.0, 'same': 10.0}
+    assert durations.find_regressions(
+        {'fast': 0.5, 'slow': 16.0, 'slower': 30.0, 'same': 12.0, 'new': 100.0}, expected) == [
+            ('slower', 30.0, 10.0), ('slow', 16.0, 10.0)]
+
+def test_summarize():
+    assert durations.summarize([4.0, 1.0, 2.0, 3.0], runs=2, window=2) == {
+        'runs': 4, 'last': 3.0, 'median': 1.5, 'change': 1.0, 'recent': [2.0, 3.0]}
+    assert durations.summarize([4.0], runs=2)['change'] is None
+
+
+TESTS = '''
+import os
+import time
+import pytest
+
+SCALE = float(os.environ.get('SCALE', '1'))
+
+@pytest.mark.parametrize('duration', [0.1, 0.4, 0.2, 0.3, 1.5])
+def test_sleep(duration):
+    time.sleep(duration * SCALE)
+'''
+
+@pytest.fixture
+def run_pytest(tmp_path, monkeypatch):
+    (tmp_path / 'test_sleep.py').write_text(TESTS)
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([
+        os.path.dirname(os.path.dirname(graminelibos.__file__)),
+        os.environ.get('PYTHONPATH', '')]))
+
+    def run_pytest(*args, scale=1):
+        result = subprocess.run([sys.executable, '-m', 'pytest', '-p', 'graminelibos.regression',
+            '-p', 'no:cacheprovider', '-v', '--durations-db=durations.sqlite3', *args],
+            cwd=tmp_path, env={**os.environ, 'SCALE': str(scale)}, stdout=subprocess.PIPE,
+            check=False, encoding='utf-8')
+        assert result.returncode == 0, result.stdout
+        return result.stdout
+    return run_pytest
+
+def test_plugin(run_pytest):
+    run_pytest()
+
+    # with known durations, the shards are balanced and run the longest tests first
+    outputs = [run_pytest(f'--shard={i}/2', '--durations-before=1e12') for i in range(2)]
+    assert [[line.split()[0] for line in output.splitlines() if 'PASSED' in line]
+        for output in outputs] == [
+            ['test_sleep.py::test_sleep[1.5]'],
+            ['test_sleep.py::test_sleep[0.4]', 'test_sleep.py::test_sleep[0.3]',
+             'test_sleep.py::test_sleep[0.2]', 'test_sleep.py::test_sleep[0.1]'],
+        ]
+
+    output = run_pytest('-k', '0.4 or 0.1', scale=5)
+    assert 'tests slower than usual' in output
+    assert 'test_sleep.py::test_sleep[0.4]' in output.split('tests slower than usual')[1]
+
+
+def find_tool(name):
+    path = shutil.which(name)
+    if path is None:
+        # not installed, use the script from the repo
+        path = pathlib.Path(__file__).parent.parent / 'python' / name
+    return path
+
+def test_report(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', os.fspath(tmp_path / 'cache'))
+    (tmp_path / 'tests.toml').write_text('')
+
+    def report(*args):
+        return subprocess.run([sys.executable, os.fspath(find_tool('gramine-test')), 'report',
+            *args], cwd=tmp_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            encoding='utf-8', check=False)
+
+    result = report()
+    assert result.returncode == 1
+    assert 'No durations recorded yet' in result.stdout
+
+    with durations.DurationDB(tmp_path / 'cache/gramine/test-durations.sqlite3') as db:
+        for start_time, duration in enumerate([1.0, 1.0, 1.0, 2.0]):
+            db.add_session('direct', start_time, {'test_a': (duration, 'passed'),
+                'test_b': (3.0, 'passed')})
+
+    result = report()
+    assert result.returncode == 0, result.stdout
+    lines = result.stdout.splitlines()
+    assert lines[0].split() == ['RUNS', 'LAST', 'MEDIAN', 'CHANGE', 'TREND', 'TEST']
+    assert lines[1].split() == ['4', '3.00s', '3.00s', '+0%', '▅▅▅▅', 'test_b']
+    assert lines[2].split() == ['4', '2.00s', '1.00s', '+100%', '▁▁▁█', 'test_a']
+
+    result = report('--sort=change', '--output-format=json', 'test_')
+    assert [row['test'] for row in json.loads(result.stdout)] == ['test_a', 'test_b']
+    assert json.loads(report('--output-format=json', 'test_b', '-n', '2').stdout) == [{
+        'test': 'test_b', 'runs': 4, 'last': 3.0, 'median': 3.0, 'change': 0.0,
+        'recent': [3.0, 3.0]}]
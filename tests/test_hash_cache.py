@@ -0,0 +1,143 @@
+import hashlib
+import os
+import pathlib
+
+import pytest
+from graminelibos import hash_cache, manifest
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+@pytest.fixture
+def old_file(tmp_path):
+    def old_file(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        # make it older than the racy window
+        os.utime(path, (1000000000, 1000000000))
+        return path
+    return old_file
+
+def measure(path, cache):
+    tf = manifest.TrustedFile(f'file:{path}')
+    manifest.hash_trusted_files([tf], jobs=1, hash_cache=cache)
+    return tf.sha256
+
+
+def test_hit(tmp_path, old_file):
+    path = old_file('file', b'pass')
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        assert measure(path, cache) == hashlib.sha256(b'pass').hexdigest()
+
+    # change contents, but keep the fingerprint
+    path.write_bytes(b'fail')
+    os.utime(path, (1000000000, 1000000000))
+
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        assert measure(path, cache) == hashlib.sha256(b'pass').hexdigest()
+
+def test_miss_after_modification(tmp_path, old_file):
+    path = old_file('file', b'fail')
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        measure(path, cache)
+
+    old_file('file', b'pass!')
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        assert measure(path, cache) == hashlib.sha256(b'pass!').hexdigest()
+
+def test_racy_file_not_cached(tmp_path):
+    path = tmp_path / 'file'
+    path.write_bytes(b'pass')
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        measure(path, cache)
+        assert cache.get(path.stat()) is None
+
+def test_eviction(tmp_path, old_file):
+    paths = [old_file(f'file-{i}', str(i).encode()) for i in range(10)]
+    with hash_cache.HashCache(tmp_path / 'cache', max_entries=4) as cache:
+        for path in paths:
+            measure(path, cache)
+
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        assert sum(cache.get(path.stat()) is not None for path in paths) == 4
+
+def test_verify_stale(tmp_path, old_file):
+    path = old_file('file', b'fail')
+    with hash_cache.HashCache(tmp_path / 'cache') as cache:
+        measure(path, cache)
+
+    old_file('file', b'pass')
+    with hash_cache.HashCache(tmp_path / 'cache', verify_ratio=1) as cache:
+        with pytest.raises(manifest.ManifestError, match='is stale'):
+            measure(path, cache)
+        assert cache.get(path.stat()) is None
+
+@pytest.mark.parametrize('error', [RuntimeError, KeyError])
+def test_no_home_directory(tmp_path, monkeypatch, capsys, error):
+    def home(cls):
+        raise error('no home')
+    # like in a container, for a user without an entry in /etc/passwd
+    monkeypatch.setattr(pathlib.Path, 'home', classmethod(home))
+
+    monkeypatch.setenv('XDG_CACHE_HOME', os.fspath(tmp_path / 'cache'))
+    assert hash_cache.get_cache_dir() == tmp_path / 'cache/gramine'
+
+    monkeypatch.delenv('XDG_CACHE_HOME')
+    with pytest.raises(RuntimeError):
+        hash_cache.get_cache_dir()
+    with hash_cache.open_hash_cache() as cache:
+        assert cache is None
+    assert 'WARNING: could not open hash cache' in capsys.readouterr().err
+
+
+BASELINE_MANIFEST = '''\
+loader.entrypoint = {{ uri = "file:/dev/null", sha256 = "{sha256}" }}
+sgx.trusted_files = ["file:{tmp_path}/dir/"]
+'''
+
+def build(tmp_path, baseline=None):
+    m = manifest.Manifest(BASELINE_MANIFEST.format(
+        tmp_path=tmp_path, sha256=hashlib.sha256(b'').hexdigest()))
+    m.expand_all_trusted_files(jobs=1, baseline=baseline)
+    output = tmp_path / 'manifest.sgx'
+    output.write_text(m.dumps())
+    if baseline is not None:
+        baseline.save(output)
+    return output
+
+def test_baseline(tmp_path, old_file):
+    (tmp_path / 'dir').mkdir()
+    for i in range(4):
+        old_file(f'dir/file-{i}', b'pass')
+
+    # first build, the baseline does not exist yet
+    output = build(tmp_path, hash_cache.Baseline.load(tmp_path / 'manifest.sgx'))
+    output = build(tmp_path, hash_cache.Baseline.load(output))
+
+    # unchanged fingerprint, should not be measured
+    old_file('dir/file-0', b'fail')
+    # modified
+    old_file('dir/file-1', b'pass!')
+    # removed and added
+    (tmp_path / 'dir/file-2').unlink()
+    old_file('dir/file-4', b'pass')
+
+    incremental = build(tmp_path, hash_cache.Baseline.load(output)).read_text()
+    assert incremental == build(tmp_path).read_text().replace(
+        hashlib.sha256(b'fail').hexdigest(), hashlib.sha256(b'pass').hexdigest())
+
+def test_baseline_manifest_modified(tmp_path, old_file, capsys):
+    (tmp_path / 'dir').mkdir()
+    old_file('dir/file', b'fail')
+    output = build(tmp_path, hash_cache.Baseline())
+    old_file('dir/file', b'pass')
+
+    with open(output, 'a') as file:
+        file.write('\n')
+    build(tmp_path, hash_cache.Baseline.load(output))
+    assert 'ignoring baseline' in capsys.readouterr().err
+    assert hashlib.sha256(b'pass').hexdigest() in output.read_text()
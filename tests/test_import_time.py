@@ -0,0 +1,67 @@
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+
+# The command-line tools are run many times during a build, so their startup time matters. Most of
+# it is spent importing modules, so check that each tool imports only what it needs, and that the
+# imports fit in a (generous) time budget.
+#
+# (tool, modules which the tool should not import, budget in milliseconds)
+TOOLS = [
+    ('gramine-manifest', {'cryptography', 'elftools'}, 500),
+    ('gramine-manifest-check', {'jinja2', 'cryptography', 'elftools'}, 500),
+    ('gramine-gen-depend', {'jinja2', 'voluptuous', 'cryptography', 'elftools'}, 500),
+    ('gramine-test', {'jinja2', 'voluptuous', 'cryptography', 'elftools'}, 500),
+    pytest.param('gramine-sgx-sign', {'jinja2', 'voluptuous'}, 1000,
+        marks=pytest.mark.sgx),
+    pytest.param('gramine-sgx-gen-private-key', {'jinja2', 'voluptuous'}, 1000,
+        marks=pytest.mark.sgx),
+    pytest.param('gramine-sgx-sigstruct-view',
+        {'jinja2', 'voluptuous', 'cryptography', 'elftools', 'tomli'}, 500,
+        marks=pytest.mark.sgx),
+]
+
+def find_tool(name):
+    path = shutil.which(name)
+    if path is None:
+        # not installed, use the script from the repo
+        path = pathlib.Path(__file__).parent.parent / 'python' / name
+    return path
+
+def import_times(name):
+    """Run the tool with ``-X importtime`` and parse the report.
+
+    Returns:
+        dict: mapping of each imported module to its cumulative import time in microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', os.fspath(find_tool(name)),
+            '--help'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True, encoding='utf-8')
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _self, cumulative, module = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            # modules imported by other modules are indented, top-level ones are not
+            times[module[1:]] = int(cumulative)
+    return times
+
+@pytest.mark.parametrize('name,forbidden,budget_ms', TOOLS)
+def test_import_time(name, forbidden, budget_ms):
+    times = import_times(name)
+    imported = {module.strip().split('.')[0] for module in times}
+    assert not forbidden & imported, f'{name} imports unnecessary modules'
+
+    top_level = {module: time for module, time in times.items() if not module.startswith(' ')}
+    total = sum(top_level.values())
+    slowest = sorted(top_level, key=top_level.get, reverse=True)[:5]
+    assert total < budget_ms * 1000, (
+        f'{name}: imports took {total / 1000:.0f} ms (budget is {budget_ms} ms), '
+        f'slowest: {", ".join(slowest)}')
@@ -1,3 +1,11 @@
+import glob
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from graminelibos import ldd
 from graminelibos.gen_jinja_env import parse_ldd
 
 def test_parse_ldd():
@@ -24,3 +32,42 @@ def test_parse_ldd_multiple_binaries():
 \t/lib64/ld-linux-x86-64.so.2 (0x00007f75340da000)
 ''')
     assert output == ['/lib/x86_64-linux-gnu/libc.so.6']
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    import pathlib
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+def system_ldd(*binaries):
+    return parse_ldd(subprocess.check_output(['ldd', *binaries]).decode('ascii'))
+
+@pytest.fixture
+def binaries():
+    if shutil.which('ldd') is None:
+        pytest.skip('no ldd')
+    binaries = [os.path.realpath(sys.executable), shutil.which('ls'), shutil.which('sh')]
+    # shared libraries, with rpaths if we're lucky
+    binaries.extend(sorted(glob.glob(os.path.join(
+        os.path.dirname(os.__file__), 'lib-dynload', '*.so')))[:10])
+    return [binary for binary in binaries if binary and system_ldd(binary)]
+
+def test_resolve(binaries):
+    assert binaries
+    for binary in binaries:
+        assert ldd.DependencyResolver().resolve(binary) == system_ldd(binary), binary
+    assert ldd.DependencyResolver().resolve(*binaries) == system_ldd(*binaries)
+
+def test_resolve_chroot(tmp_path, binaries):
+    binary = binaries[0]
+    for path in [binary, *system_ldd(binary), ldd.LD_SO_CACHE_PATH]:
+        (tmp_path / path.lstrip('/')).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(path, tmp_path / path.lstrip('/'))
+
+    assert ldd.DependencyResolver(root=tmp_path).resolve(binary) == system_ldd(binary)
+    # not found in chroot
+    os.unlink(tmp_path / system_ldd(binary)[0].lstrip('/'))
+    ldd.read_elf_info.cache_clear()
+    assert ldd.DependencyResolver(root=tmp_path).resolve(binary) == system_ldd(binary)[1:]
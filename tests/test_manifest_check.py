@@ -0,0 +1,222 @@
+import copy
+import gc
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+import tomli_w
+import voluptuous
+from graminelibos.manifest_check import (
+    CompiledSchema,
+    GramineManifestCompiledSchema,
+    GramineManifestSchema,
+    check_manifest_file,
+    check_manifest_files,
+)
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+
+MANIFEST = {
+    'fs': {
+        'mounts': [
+            {'path': '/lib', 'uri': 'file:/usr/lib'},
+            {'type': 'tmpfs', 'path': '/tmp'},
+            {'type': 'encrypted', 'path': '/enc', 'uri': 'file:enc', 'key_name': 'default'},
+        ],
+        'insecure__keys': {'default': '00' * 16},
+    },
+    'libos': {'entrypoint': '/app'},
+    'loader': {
+        'entrypoint': {'uri': 'file:/libsysdb.so', 'sha256': '0' * 64},
+        'env': {'A': 'a', 'B': {'value': 'b'}, 'C': {'passthrough': True}},
+        'log_level': 'error',
+    },
+    'sgx': {
+        'cpu_features': {'avx': 'required', 'mpx': 'disabled'},
+        'debug': True,
+        'enclave_size': '1G',
+        'seal_key': {'flags_mask': '0xffffffffffffffff', 'misc_mask': '0xFFFFFFFF'},
+        'trusted_files': ['file:/a', {'uri': 'file:/b'}, {'uri': 'file:/c', 'sha256': '0' * 64}],
+        'allowed_files': ['file:/d', 'dev:tty'],
+    },
+    'sys': {
+        'ioctl_structs': {'s': [{'size': 8}]},
+        'allowed_ioctls': [{'request_code': 1, 'struct': 's'}],
+        'stack': {'size': '256k'},
+    },
+}
+
+def modified(path, value):
+    manifest = copy.deepcopy(MANIFEST)
+    *path, last = path
+    obj = manifest
+    for key in path:
+        obj = obj[key]
+    if value is KeyError:
+        del obj[last]
+    else:
+        obj[last] = value
+    return manifest
+
+def errors(schema, manifest):
+    with pytest.raises(voluptuous.MultipleInvalid) as excinfo:
+        schema(manifest)
+    return str(excinfo.value), [(str(e), e.path) for e in excinfo.value.errors]
+
+def test_valid():
+    assert GramineManifestCompiledSchema(MANIFEST) is MANIFEST
+    GramineManifestSchema(MANIFEST)
+
+@pytest.mark.parametrize('path,value', [
+    (['fs', 'mounts', 1, 'type'], 'nonexistent'),
+    (['fs', 'mounts'], {}),
+    (['libos'], KeyError),
+    (['libos', 'entrypoint'], 1),
+    (['loader', 'env', 'C', 'passthrough'], False),
+    (['loader', 'entrypoint', 'uri'], 'dev:tty'),
+    (['loader', 'entrypoint', 'sha256'], '0' * 63),
+    (['loader', 'log_level'], 'verbose'),
+    (['loader', 'nonexistent'], 1),
+    (['sgx', 'cpu_features', 'avx'], 'maybe'),
+    (['sgx', 'cpu_features', 'mpx'], 'unspecified'),
+    (['sgx', 'debug'], 1),
+    (['sgx', 'enclave_size'], '256MB'),
+    (['sgx', 'enclave_size'], 256),
+    (['sgx', 'seal_key', 'misc_mask'], '0xffff'),
+    (['sgx', 'seal_key', 'flags_mask'], '0xffffffffffffffffff'),
+    (['sgx', 'trusted_files', 1], 1),
+    (['sgx', 'trusted_files', 2, 'uri'], None),
+    (['sgx', 'trusted_files', 2, 'size'], 1),
+    (['sgx', 'trusted_files', 2, 'sha256'], 'x' * 64),
+    (['sgx', 'trusted_files', 0], 'dev:tty'),
+    (['sgx', 'trusted_files', 0], 'file:'),
+    (['sgx', 'trusted_files', 0], 'file:/a\0b'),
+    (['sgx', 'trusted_files', 0], 'file:/a\0file:/b'),
+    (['sgx', 'trusted_files', 2, 'sha256'], 'a' * 64 + '\0' + 'b' * 64),
+    (['sgx', 'trusted_files'], 'file:/a'),
+    (['sgx', 'allowed_files', 0], b'file:/d'),
+    (['sgx', 'allowed_files', 1], '/d'),
+    (['sys', 'stack', 'size'], '1T'),
+    (['sys', 'allowed_ioctls', 0, 'request_code'], KeyError),
+])
+def test_same_errors(path, value):
+    manifest = modified(path, value)
+    assert errors(GramineManifestCompiledSchema, manifest) == errors(
+        GramineManifestSchema, manifest)
+
+def test_unsupported_schema():
+    schema = CompiledSchema(voluptuous.Schema({voluptuous.Remove('a'): int}))
+    assert schema({'a': 1}) == {}
+
+
+def types_only(schema):
+    # the schema as it was before sizes, masks, URIs and hashes were validated
+    if isinstance(schema, voluptuous.Match):
+        return str
+    if isinstance(schema, voluptuous.Schema):
+        return voluptuous.Schema(types_only(schema.schema))
+    if isinstance(schema, voluptuous.Any):
+        return voluptuous.Any(*map(types_only, schema.validators))
+    if isinstance(schema, dict):
+        return {key: types_only(value) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [types_only(item) for item in schema]
+    return schema
+
+def test_validation_time():
+    # Validation of values (sizes, hashes etc.) must not make checking of big manifests noticeably
+    # slower than checking only their types. See also tests/benchmarks/bench_manifest_check.py.
+    entries = 20000
+    manifest = copy.deepcopy(MANIFEST)
+    manifest['sgx']['trusted_files'] = [
+        {'uri': f'file:/usr/lib/python3/file-{i}.py', 'sha256': f'{i:064x}'}
+        for i in range(entries)]
+    manifest['sgx']['allowed_files'] = [f'file:/tmp/file-{i}' for i in range(entries)]
+
+    schemas = (CompiledSchema(types_only(GramineManifestSchema)), GramineManifestCompiledSchema)
+    best = [float('inf')] * len(schemas)
+    gc.disable()
+    try:
+        # interleaved, so that the load of the machine affects both the same way
+        for _ in range(7):
+            for i, schema in enumerate(schemas):
+                start = time.perf_counter()
+                assert schema(manifest) is manifest
+                best[i] = min(best[i], time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    reference, compiled = best
+    assert compiled < 2 * reference
+
+
+@pytest.fixture
+def manifests(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'ok.manifest').write_text(tomli_w.dumps(MANIFEST))
+    (tmp_path / 'sub/invalid.manifest').write_text(
+        tomli_w.dumps(modified(['libos', 'entrypoint'], 1)))
+    (tmp_path / 'sub/broken.manifest').write_text('libos.entrypoint = ')
+    (tmp_path / 'manifest.template').write_text('{{ not a manifest }}')
+    return tmp_path
+
+def test_check_manifest_file(manifests):
+    assert check_manifest_file(manifests / 'ok.manifest') == {
+        'file': os.fspath(manifests / 'ok.manifest'), 'status': 'ok', 'errors': []}
+
+    result = check_manifest_file(manifests / 'sub/invalid.manifest')
+    assert result['status'] == 'invalid'
+    assert [error['path'] for error in result['errors']] == [['libos', 'entrypoint']]
+
+    assert check_manifest_file(manifests / 'sub/broken.manifest')['status'] == 'error'
+    assert check_manifest_file(manifests / 'nonexistent')['status'] == 'error'
+
+def test_check_manifest_files(manifests):
+    paths = [manifests / name for name in ('sub/invalid.manifest', 'ok.manifest', 'nonexistent')]
+    paths *= 10
+    results = list(check_manifest_files(paths, jobs=4))
+    assert results == [check_manifest_file(path) for path in paths]
+    assert [result['file'] for result in results] == list(map(os.fspath, paths))
+
+def run_tool(*args, stdin=None):
+    path = shutil.which('gramine-manifest-check')
+    if path is None:
+        # not installed, use the script from the repo
+        path = pathlib.Path(__file__).parent.parent / 'python' / 'gramine-manifest-check'
+    return subprocess.run([sys.executable, os.fspath(path), *map(os.fspath, args)],
+        stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8',
+        check=False)
+
+def test_tool_json(manifests):
+    result = run_tool('--format', 'json', manifests)
+    assert result.returncode == 2
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [(line['file'], line['status']) for line in lines] == [
+        (os.fspath(manifests / 'ok.manifest'), 'ok'),
+        (os.fspath(manifests / 'sub/broken.manifest'), 'error'),
+        (os.fspath(manifests / 'sub/invalid.manifest'), 'invalid'),
+    ]
+
+def test_tool_text(manifests):
+    result = run_tool(manifests / 'ok.manifest', manifests / 'sub/invalid.manifest')
+    assert result.returncode == 1
+    assert result.stdout == (f'{manifests}/sub/invalid.manifest: error in manifest: expected str '
+        "for dictionary value @ data['libos']['entrypoint']\n")
+
+    with open(manifests / 'sub/invalid.manifest') as file:
+        result = run_tool(stdin=file)
+    assert result.returncode == 1
+    assert result.stdout.startswith('error in manifest: ')
+
+    assert run_tool(manifests / 'ok.manifest').returncode == 0
@@ -0,0 +1,235 @@
+# pylint: disable=protected-access
+
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+
+import graminelibos
+import pytest
+from graminelibos import regression, util_tests
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    import pathlib
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+
+class Pipe(io.BytesIO):
+    # returns the data in the given chunks, like a pipe written to by a process
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = list(chunks)
+
+    def read(self, size=-1):
+        return self.chunks.pop(0) if self.chunks else b''
+
+def splice(chunks):
+    input_pipe, output_pipe = Pipe(chunks), io.BytesIO()
+    splice = regression._LoggingSplice(input_pipe, output_pipe)
+    while not splice.closed:
+        splice.pump_data([input_pipe])
+    return splice.logged_data, output_pipe.getvalue()
+
+def test_logging_splice():
+    chunks = [b'first line\nsecond ', b'line\n', b'\n', b'third line\nno newline at the end']
+    logged, output = splice(chunks)
+    assert logged == b''.join(chunks)
+
+    timestamp = rb'\[[0-9]+\.[0-9]{3}\] '
+    assert re.fullmatch(b''.join((
+        timestamp, b'first line\n',
+        timestamp, b'second line\n',
+        timestamp, b'\n',
+        timestamp, b'third line\n',
+        timestamp, b'no newline at the end',
+    )), output), output
+
+def test_logging_splice_big():
+    data = b''.join(b'line %d\n' % i for i in range(100000))
+    logged, output = splice(data[i:i + 4096] for i in range(0, len(data), 4096))
+    assert logged == data
+    lines = output.split(b'\n')
+    assert len(lines) == 100001
+    assert all(re.fullmatch(rb'\[[0-9]+\.[0-9]{3}\] line [0-9]+', line) for line in lines[:-1])
+
+def test_run_command(capfd):
+    returncode, stdout, stderr = regression.run_command(
+        ['sh', '-c', 'printf "a\\nb"; printf "c\\n" >&2; exit 3'], timeout=10, can_fail=True)
+    assert (returncode, stdout, stderr) == (3, 'a\nb', 'c\n')
+    captured = capfd.readouterr()
+    assert re.fullmatch(r'\[[0-9.]+\] a\n\[[0-9.]+\] b', captured.out)
+    assert re.fullmatch(r'\[[0-9.]+\] c\n', captured.err)
+
+def test_run_command_usage():
+    # allocate and touch 64 MB, then burn some CPU time
+    result = regression.run_command([sys.executable, '-c',
+        'data = bytearray(64 << 20)\nwhile sum(range(10**6)) and data: data = data[:-1 << 20]'],
+        timeout=60)
+    returncode, stdout, _stderr = result
+    assert (returncode, stdout) == (0, '')
+    usage = result.usage
+    assert usage['max_rss_kb'] > 64 << 10
+    assert usage['minor_page_faults'] > 0
+    assert 0 < usage['user_time'] + usage['system_time'] <= usage['wall_time'] + 0.1
+
+def test_run_command_usage_dangling_child():
+    # the child keeps the pipes open until the timeout, the main process is reaped after that
+    result = regression.run_command(['sh', '-c', 'sleep 20 & echo started'], timeout=0.5)
+    assert tuple(result) == (0, 'started\n', '')
+    assert 0.5 <= result.usage['wall_time'] < 5
+
+RESULTS_TESTS = '''
+import sys
+import pytest
+from graminelibos.regression import run_command
+
+def test_commands():
+    run_command([sys.executable, '-c', 'pass'], timeout=60)
+    run_command([sys.executable, '-c', 'exit(1)'], timeout=60, can_fail=True)
+
+def test_failure():
+    run_command(['false'], timeout=60)
+
+@pytest.mark.skip
+def test_skipped():
+    pass
+'''
+
+def test_results_json(tmp_path, monkeypatch):
+    (tmp_path / 'test_results.py').write_text(RESULTS_TESTS)
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([
+        os.path.dirname(os.path.dirname(graminelibos.__file__)),
+        os.environ.get('PYTHONPATH', '')]))
+    subprocess.run([sys.executable, '-m', 'pytest', '-p', 'graminelibos.regression',
+        '-p', 'no:cacheprovider', '--results-json=results.json'], cwd=tmp_path,
+        stdout=subprocess.DEVNULL, check=False)
+
+    results = json.loads((tmp_path / 'results.json').read_text())
+    assert results['exitstatus'] == 1
+    tests = results['tests']
+    assert {name: test['outcome'] for name, test in tests.items()} == {
+        'test_results.py::test_commands': 'passed',
+        'test_results.py::test_failure': 'failed',
+        'test_results.py::test_skipped': 'skipped',
+    }
+    commands = tests['test_results.py::test_commands']['commands']
+    assert [(command['cmd'][1:], command['returncode']) for command in commands] == [
+        (['-c', 'pass'], 0), (['-c', 'exit(1)'], 1)]
+    assert all(command['wall_time'] > 0 and command['max_rss_kb'] > 0 for command in commands)
+    assert tests['test_results.py::test_failure']['commands'][0]['returncode'] == 1
+
+
+SHARDED_TESTS = '''
+import os
+import pytest
+
+@pytest.mark.parametrize('i', range(10))
+def test_parallel(i):
+    with open('input') as f:
+        assert f.read() == 'input'
+    open(f'tmp/test_parallel_{i}', 'w').close()
+
+@pytest.mark.serial
+def test_serial():
+    open('tmp/test_serial', 'w').close()
+'''
+
+@pytest.fixture
+def sharded_test_dir(tmp_path, monkeypatch):
+    (tmp_path / 'test_sharded.py').write_text(SHARDED_TESTS)
+    (tmp_path / 'input').write_text('input')
+    (tmp_path / 'tmp').mkdir()
+    monkeypatch.chdir(tmp_path)
+    # the shards must import graminelibos from wherever we do (possibly a relative PYTHONPATH)
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([
+        os.path.dirname(os.path.dirname(graminelibos.__file__)),
+        os.environ.get('PYTHONPATH', '')]))
+    return tmp_path
+
+def scratch_files(path):
+    return set(os.listdir(path / 'tmp'))
+
+def test_run_pytest_sharded(sharded_test_dir, capfd):
+    (sharded_test_dir / 'output').write_text('left from a previous run')
+    returncode = util_tests.run_pytest_sharded(False, ['-p', 'no:cacheprovider', '-q'], jobs=3,
+        scratch_paths=['tmp', 'output', 'nonexistent'])
+    assert returncode == 0, capfd.readouterr().out
+
+    # each test ran exactly once, in its shard's own scratch directory
+    shards_dir = sharded_test_dir / util_tests.SHARDS_DIR
+    shards = [scratch_files(shards_dir / f'shard-{i}') for i in range(3)]
+    assert all(len(files) in (3, 4) for files in shards)
+    assert set.union(*shards) == {f'test_parallel_{i}' for i in range(10)}
+    assert scratch_files(shards_dir / 'serial') == {'test_serial'}
+    assert scratch_files(sharded_test_dir) == set()
+    # scratch files are not created in the shards, only the directories
+    assert set(os.listdir(shards_dir / 'shard-0')) - {'__pycache__'} == {
+        'input', 'test_sharded.py', 'tmp'}
+
+    output = capfd.readouterr().out
+    assert output.count('==== shard') == 3
+    assert '1 passed, 10 deselected' in output
+
+def test_run_pytest_sharded_nested_scratch(sharded_test_dir, capfd):
+    (sharded_test_dir / 'tmp/sub/dir').mkdir(parents=True)
+    (sharded_test_dir / 'tmp/sub/old').write_text('left from a previous run')
+    (sharded_test_dir / 'test_nested.py').write_text(
+        "def test_nested():\n    open('tmp/sub/dir/file', 'w').close()\n")
+    returncode = util_tests.run_pytest_sharded(False, ['-p', 'no:cacheprovider', '-q'], jobs=2,
+        scratch_paths=['tmp'])
+    assert returncode == 0, capfd.readouterr().out
+
+    # the subdirectories of a scratch directory are recreated in each shard, but not the files
+    shards_dir = sharded_test_dir / util_tests.SHARDS_DIR
+    for shard in ('shard-0', 'shard-1', 'serial'):
+        assert (shards_dir / shard / 'tmp/sub/dir').is_dir()
+        assert not (shards_dir / shard / 'tmp/sub/old').exists()
+    assert sum((shards_dir / f'shard-{i}/tmp/sub/dir/file').exists() for i in range(2)) == 1
+
+CLASS_TESTS = '''
+import unittest
+
+class TC_Class(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        open('tmp/setup_class', 'w').close()
+
+    def test_000(self):
+        open('tmp/test_class_0', 'w').close()
+
+    def test_010(self):
+        open('tmp/test_class_1', 'w').close()
+
+    def test_020(self):
+        open('tmp/test_class_2', 'w').close()
+'''
+
+def test_run_pytest_sharded_class(sharded_test_dir, capfd):
+    (sharded_test_dir / 'test_class.py').write_text(CLASS_TESTS)
+    returncode = util_tests.run_pytest_sharded(False, ['-p', 'no:cacheprovider', '-q'], jobs=3,
+        scratch_paths=['tmp'])
+    assert returncode == 0, capfd.readouterr().out
+
+    # the whole class ran in one shard, so setUpClass() ran only once
+    shards_dir = sharded_test_dir / util_tests.SHARDS_DIR
+    class_files = {'setup_class', 'test_class_0', 'test_class_1', 'test_class_2'}
+    assert sorted(len(scratch_files(shards_dir / f'shard-{i}') & class_files)
+        for i in range(3)) == [0, 0, 4]
+
+def test_run_pytest_sharded_failure(sharded_test_dir, capfd):
+    (sharded_test_dir / 'input').write_text('modified')
+    returncode = util_tests.run_pytest_sharded(False, ['-p', 'no:cacheprovider', '-q'], jobs=2,
+        scratch_paths=['tmp'])
+    assert returncode == 1
+    assert capfd.readouterr().out.count(' failed') == 2
+
+def test_run_pytest_sharded_no_tests(sharded_test_dir, capfd):
+    returncode = util_tests.run_pytest_sharded(False, ['-p', 'no:cacheprovider', '-k', 'nothing'],
+        jobs=2, scratch_paths=['tmp'])
+    assert returncode == 5, capfd.readouterr().out
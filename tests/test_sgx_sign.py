@@ -5,6 +5,10 @@
 
 # pylint: disable=import-outside-toplevel
 
+import datetime
+import functools
+import pathlib
+
 import pytest
 
 from cryptography.hazmat.primitives import hashes, serialization
@@ -75,3 +79,137 @@ def test_sign_from_pem_path_with_passphrase(tmp_rsa_key):
         exponent, modulus, signature = sign_with_private_key_from_pem_path(data, key_path,
             passphrase)
         verify_signature(data, exponent, modulus, signature, key_file, passphrase)
+
+@pytest.mark.sgx
+@pytest.mark.parametrize('npages,measure,with_content', [
+    (1, False, False),
+    (3, True, False),
+    (3, True, True),
+    (20000, False, False),
+    (300, True, True),
+])
+def test_measure_pages(npages, measure, with_content):
+    import hashlib
+    import struct
+    from graminelibos import sgx_sign
+    pagesize = sgx_sign.offs.PAGESIZE
+
+    content = None
+    if with_content:
+        content = bytes(i % 251 for i in range(npages * pagesize))
+
+    # the reference implementation: one record at a time
+    expected = hashlib.sha256()
+    for page in range(npages):
+        offset = 0x10000 + page * pagesize
+        expected.update(struct.pack('<8sQQ40s', b'EADD', offset, sgx_sign.PAGEINFO_REG, b''))
+        if not measure:
+            continue
+        for i in range(0, pagesize, 256):
+            expected.update(struct.pack('<8sQ48s', b'EEXTEND', offset + i, b''))
+            if content is None:
+                expected.update(bytes(256))
+            else:
+                expected.update(content[page * pagesize + i:page * pagesize + i + 256])
+
+    digest = hashlib.sha256()
+    sgx_sign.measure_pages(digest, 0x10000, sgx_sign.PAGEINFO_REG, npages, content, measure)
+    assert digest.hexdigest() == expected.hexdigest()
+
+@pytest.mark.sgx
+def test_load_elf_image(tmpdir):
+    import hashlib
+    import shutil
+    import sys
+    from graminelibos import sgx_sign
+
+    # TODO: use `tmp_path` fixture after we drop support for distros (RHEL 8, CentOS Stream 8)
+    # that have old pytest version (< 3.9.0) installed
+    path = tmpdir.join('elf')
+    shutil.copy(sys.executable, path)
+
+    image = sgx_sign.load_elf_image(path)
+    assert sgx_sign.load_elf_image(path) is image
+    assert image.entry == sgx_sign.entry_point(path)
+    assert len(image.segments) == len(list(sgx_sign.get_loadcmds(path)))
+
+    for i, (_, _, content) in enumerate(image.segments):
+        # measure twice, to check that cached records are reused correctly
+        for offset in (0, 0x10000):
+            expected = hashlib.sha256()
+            sgx_sign.measure_pages(expected, offset, sgx_sign.PAGEINFO_REG,
+                len(content) // sgx_sign.offs.PAGESIZE, content)
+            digest = hashlib.sha256()
+            image.measure_segment(digest, i, offset, sgx_sign.PAGEINFO_REG)
+            assert digest.hexdigest() == expected.hexdigest()
+
+    with open(path, 'ab') as file:
+        file.write(b'\0')
+    assert sgx_sign.load_elf_image(path) is not image
+
+@pytest.mark.sgx
+def test_sign_many(tmpdir, tmp_rsa_key):
+    import hashlib
+    from graminelibos.sgx_sign import (SignJob, sign_many, sign_with_private_key_from_pem_path,
+        get_tbssigstruct)
+
+    # TODO: use `tmp_path` fixture after we drop support for distros (RHEL 8, CentOS Stream 8)
+    # that have old pytest version (< 3.9.0) installed
+    jobs = []
+    for i in range(4):
+        tmpdir.join(f'file-{i}').write(str(i))
+        trusted_file = tmpdir.join(f'file-{i}' if i != 2 else 'nonexistent')
+        manifest = tmpdir.join(f'{i}.manifest')
+        manifest.write(
+            f'loader.entrypoint = {{ uri = "file:/dev/null", '
+                f'sha256 = "{hashlib.sha256(b"").hexdigest()}" }}\n'
+            f'sgx.trusted_files = ["file:{trusted_file}"]\n')
+        jobs.append(SignJob(str(manifest), f'{manifest}.sgx', str(tmpdir.join(f'{i}.sig'))))
+
+    key_path = tmp_rsa_key()
+    date = datetime.date(2000, 1, 1)
+    results = sign_many(jobs,
+        functools.partial(sign_with_private_key_from_pem_path, path=key_path),
+        date=date, workers=2, hash_cache=False)
+
+    assert [result.job for result in results] == jobs
+    assert isinstance(results[2].error, FileNotFoundError)
+    for i in (0, 1, 3):
+        assert results[i].error is None
+        assert results[i].expanded == [pathlib.Path(tmpdir.join(f'file-{i}'))]
+        with open(jobs[i].sigfile, 'rb') as file:
+            assert file.read() == results[i].sigstruct.to_bytes()
+        assert (results[i].sigstruct['enclave_hash']
+            == get_tbssigstruct(jobs[i].output, date)['enclave_hash'])
+
+    with pytest.raises(ValueError):
+        sign_many([jobs[0], jobs[0]], None, date=date)
+
+@pytest.mark.sgx
+def test_get_tbssigstruct_from_manifest(tmpdir, monkeypatch):
+    import hashlib
+    from graminelibos import Manifest, manifest as manifest_module
+    from graminelibos.sgx_sign import (get_tbssigstruct, get_tbssigstruct_from_bytes,
+        get_tbssigstruct_from_manifest)
+
+    # TODO: use `tmp_path` fixture after we drop support for distros (RHEL 8, CentOS Stream 8)
+    # that have old pytest version (< 3.9.0) installed
+    tmpdir.join('file').write('pass')
+    manifest = Manifest(
+        f'loader.entrypoint = {{ uri = "file:/dev/null", '
+            f'sha256 = "{hashlib.sha256(b"").hexdigest()}" }}\n'
+        f'sgx.trusted_files = ["file:{tmpdir.join("file")}"]\n')
+    manifest.expand_all_trusted_files()
+    output = tmpdir.join('manifest.sgx')
+    with open(output, 'wb') as file:
+        manifest.dump(file)
+
+    date = datetime.date(2000, 1, 1)
+    expected = get_tbssigstruct(output, date).to_bytes()
+    assert get_tbssigstruct_from_bytes(output.read_binary(), date).to_bytes() == expected
+
+    # the manifest should not be parsed again
+    def fail(*args, **kwds):
+        raise AssertionError('unexpected parsing of manifest')
+    monkeypatch.setattr(manifest_module.tomli, 'loads', fail)
+    assert get_tbssigstruct_from_manifest(manifest, date).to_bytes() == expected
@@ -0,0 +1,180 @@
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# Copyright (C) 2026 Intel Corporation
+
+# These tests are omitted when Gramine is installed without SGX support, because
+# graminelibos.sigstruct is not installed in such case. This is also why the module is imported in
+# each test function.
+# pylint: disable=import-outside-toplevel
+
+import csv
+import io
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+
+def make_sigstruct():
+    from graminelibos.sigstruct import Sigstruct
+    sig = Sigstruct()
+    sig['date_year'] = 2023
+    sig['date_month'] = 4
+    sig['date_day'] = 14
+    sig['misc_select'] = 0
+    sig['attribute_flags'] = 4
+    sig['attribute_xfrms'] = 3
+    sig['enclave_hash'] = bytes(range(32))
+    sig['isv_prod_id'] = 1
+    sig['isv_svn'] = 2
+    return sig
+
+@pytest.mark.sgx
+def test_roundtrip():
+    from graminelibos.sigstruct import Sigstruct
+    sig = make_sigstruct()
+    with pytest.raises(KeyError):
+        sig.to_bytes(verify_sig_fields=True)
+    for key in ('modulus', 'signature', 'q1', 'q2'):
+        sig[key] = bytes([len(key)]) * 384
+    sig['exponent'] = 3
+
+    data = sig.to_bytes(verify_sig_fields=True)
+    assert len(data) == 1808
+    # date is "binary-coded decimal"
+    assert data[20:24] == b'\x14\x04\x23\x20'
+
+    for buffer in (data, bytearray(data), memoryview(data)):
+        parsed = Sigstruct.from_bytes(buffer)
+        assert {key: parsed[key] for key in Sigstruct.fields} == {
+            key: sig[key] for key in Sigstruct.fields}
+        assert parsed.to_bytes() == data
+
+@pytest.mark.sgx
+def test_zero_copy():
+    from graminelibos.sigstruct import Sigstruct
+    data = make_sigstruct().to_bytes()
+    sig = Sigstruct.from_bytes(data)
+    assert sig.to_bytes() is data
+    assert sig.to_memoryview().obj is data
+
+    # copied on write
+    sig['isv_svn'] = 3
+    assert Sigstruct.from_bytes(data)['isv_svn'] == 2
+    assert sig.to_bytes() != data
+    assert Sigstruct.from_bytes(sig.to_memoryview())['isv_svn'] == 3
+
+    assert Sigstruct.from_bytes(memoryview(b'x' + data)[1:]).to_bytes() == data
+
+    # writable buffers are copied, so later changes of the buffer don't affect the SIGSTRUCT
+    buffer = bytearray(data)
+    sig = Sigstruct.from_bytes(buffer)
+    buffer[:] = bytes(len(buffer))
+    assert sig.to_bytes() == data
+
+@pytest.mark.sgx
+@pytest.mark.parametrize('key,value', [
+    ('isv_svn', 0x10000),
+    ('isv_svn', -1),
+    ('date_year', '2023'),
+    ('date_year', 99999),
+    ('header', 'header'),
+])
+def test_invalid_value(key, value):
+    sig = make_sigstruct()
+    with pytest.raises(ValueError):
+        sig[key] = value
+    assert sig.to_bytes() == make_sigstruct().to_bytes()
+
+@pytest.mark.sgx
+def test_invalid_buffer():
+    from graminelibos.sigstruct import Sigstruct
+    data = make_sigstruct().to_bytes()
+    with pytest.raises(TypeError):
+        Sigstruct.from_bytes(data.hex())
+    with pytest.raises(ValueError):
+        Sigstruct.from_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        Sigstruct.from_bytes(b'\0' + data[1:])
+    with pytest.raises(ValueError):
+        # month 0x1f
+        Sigstruct.from_bytes(data[:21] + b'\x1f' + data[22:])
+    with pytest.raises(KeyError):
+        Sigstruct()['nonexistent'] = 0
+
+@pytest.mark.sgx
+def test_read_summaries(tmp_path, monkeypatch):
+    from graminelibos import sigstruct
+    paths = []
+    for i in range(10):
+        sig = make_sigstruct()
+        sig['isv_svn'] = i
+        paths.append(tmp_path / f'{i}.sig')
+        paths[-1].write_bytes(sig.to_bytes())
+    (tmp_path / 'bad.sig').write_bytes(b'not a sigstruct')
+    paths.append(tmp_path / 'bad.sig')
+
+    summary = sigstruct.read_summary(paths[3])
+    assert summary['file'] == str(paths[3])
+    assert summary['isv_svn'] == 3
+    assert summary['mr_enclave'] == bytes(range(32)).hex()
+    assert summary['date'] == '2023-04-14'
+    assert summary['debug_enclave'] is False
+    assert 'error' in sigstruct.read_summary(paths[-1])
+
+    monkeypatch.setattr(sigstruct, '_PROCESS_POOL_MIN_FILES', 2)
+    assert list(sigstruct.read_summaries(paths, jobs=4)) == list(
+        map(sigstruct.read_summary, paths))
+
+@pytest.mark.sgx
+def test_view_many(tmp_path):
+    for i in range(4):
+        sig = make_sigstruct()
+        sig['isv_svn'] = i
+        sig['attribute_flags'] = 0b110 if i % 2 else 0b100
+        (tmp_path / f'{i}.sig').write_bytes(sig.to_bytes())
+
+    def run(*args):
+        path = shutil.which('gramine-sgx-sigstruct-view')
+        if path is None:
+            # not installed, use the script from the repo
+            path = pathlib.Path(__file__).parent.parent / 'python' / 'gramine-sgx-sigstruct-view'
+        return subprocess.run([sys.executable, os.fspath(path), *args, os.fspath(tmp_path)],
+            stdout=subprocess.PIPE, encoding='utf-8', check=False)
+
+    result = run('--output-format=jsonl', '--filter=debug_enclave=true', '--fail-on-match')
+    assert result.returncode == 1
+    assert [json.loads(line)['isv_svn'] for line in result.stdout.splitlines()] == [1, 3]
+
+    result = run('--output-format=csv', '--filter', 'isv_svn != 0x1', '-v')
+    assert result.returncode == 0
+    rows = list(csv.DictReader(io.StringIO(result.stdout)))
+    assert [(row['isv_svn'], row['debug_enclave'], row['date']) for row in rows] == [
+        ('0', 'false', '2023-04-14'), ('2', 'false', '2023-04-14'), ('3', 'true', '2023-04-14')]
+
+    # hex fields are compared as numbers, whatever base or zero padding the filter uses
+    for value in ('0x4', '0x04', '0X0004', '4', '004', '0b100'):
+        result = run('--output-format=jsonl', f'--filter=attribute_flags={value}')
+        assert result.returncode == 0
+        assert [json.loads(line)['isv_svn'] for line in result.stdout.splitlines()] == [0, 2]
+    result = run('--output-format=jsonl', '--filter=attribute_flags!=04', '--fail-on-match')
+    assert result.returncode == 1
+    assert [json.loads(line)['isv_svn'] for line in result.stdout.splitlines()] == [1, 3]
+    assert run('--filter=attribute_flags=0xzz').returncode == 2
+
+    # invalid filters are reported before any output, even if nothing would be compared
+    for expr in ('isv_svn=abc', 'debug_enclave=yes', 'nonexistent=1'):
+        result = run('--output-format=csv', f'--filter={expr}')
+        assert (result.returncode, result.stdout) == (2, '')
+        result = run('--output-format=csv', f'--filter={expr}', '--glob=nothing*')
+        assert (result.returncode, result.stdout) == (2, '')
@@ -0,0 +1,112 @@
+# pylint: disable=protected-access
+
+import os
+import sys
+
+import jinja2
+import pytest
+from graminelibos import gen_jinja_env, manifest
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    import pathlib
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+TEMPLATE = '''\
+loader.entrypoint = {{ uri = "file:/dev/null", sha256 = "{{{{ '0' * 64 }}}}" }}
+libos.entrypoint = "{{{{ entrypoint }}}}"
+loader.argv = ["{value}"]
+'''
+
+@pytest.fixture
+def compile_count(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', os.fspath(tmp_path / 'cache'))
+    counter = {'count': 0}
+    orig_compile = jinja2.Environment.compile
+    def compile_wrapper(*args, **kwargs):
+        counter['count'] += 1
+        return orig_compile(*args, **kwargs)
+    monkeypatch.setattr(jinja2.Environment, 'compile', compile_wrapper)
+
+    gen_jinja_env.get_env.cache_clear()
+    yield counter
+    gen_jinja_env.get_env.cache_clear()
+
+def render(template):
+    # each run of gramine-manifest creates new environment
+    gen_jinja_env.get_env.cache_clear()
+    return manifest.Manifest.from_template(template, {'entrypoint': 'app'})
+
+@pytest.mark.parametrize('from_file', [False, True])
+def test_template_cache(tmp_path, compile_count, from_file):
+    def template(value):
+        if not from_file:
+            return TEMPLATE.format(value=value)
+        path = tmp_path / 'manifest.template'
+        path.write_text(TEMPLATE.format(value=value))
+        return path
+
+    assert render(template('a'))['loader']['argv'] == ['a']
+    assert render(template('a'))['loader']['argv'] == ['a']
+    assert compile_count['count'] == 1
+    assert list((tmp_path / 'cache/gramine/templates').iterdir())
+
+    # modified template is compiled again
+    assert render(template('b'))['loader']['argv'] == ['b']
+    assert compile_count['count'] == 2
+
+def test_template_cache_unavailable(tmp_path, compile_count):
+    (tmp_path / 'cache').write_text('not a directory')
+    assert render(TEMPLATE.format(value='a'))['libos']['entrypoint'] == 'app'
+    assert render(TEMPLATE.format(value='a'))['libos']['entrypoint'] == 'app'
+    assert compile_count['count'] == 2
+
+
+@pytest.fixture
+def probe_count(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', os.fspath(tmp_path / 'cache'))
+    counter = {'count': 0}
+    orig_check_output = gen_jinja_env.subprocess.check_output
+    def check_output_wrapper(*args, **kwargs):
+        counter['count'] += 1
+        return orig_check_output(*args, **kwargs)
+    monkeypatch.setattr(gen_jinja_env.subprocess, 'check_output', check_output_wrapper)
+
+    gen_jinja_env.clear_python_probe_cache()
+    yield counter
+    gen_jinja_env.clear_python_probe_cache()
+
+def test_python_query_cache(tmp_path, probe_count, monkeypatch):
+    sys_path = list(gen_jinja_env.python_get_sys_path(sys.executable))
+    assert sys_path
+    assert probe_count['count'] == 1
+
+    # new process, cached on disk; one subprocess for multiple expressions
+    gen_jinja_env._get_python_probe_cache.cache_clear()
+    assert list(gen_jinja_env.python_get_sys_path(sys.executable)) == sys_path
+    assert gen_jinja_env.python_query(sys.executable, 'sys.version', 'sys.platform') == [
+        sys.version, sys.platform]
+    assert probe_count['count'] == 2
+    assert gen_jinja_env.python_query(sys.executable, 'sys.path', 'sys.platform')[1] == sys.platform
+    assert probe_count['count'] == 2
+
+    # environment changes sys.path
+    monkeypatch.setenv('PYTHONPATH', os.fspath(tmp_path))
+    assert tmp_path in gen_jinja_env.python_get_sys_path(sys.executable)
+    assert probe_count['count'] == 3
+
+def test_python_query_watch(tmp_path, probe_count, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', os.fspath(tmp_path / 'dir'))
+    (tmp_path / 'dir').mkdir()
+    gen_jinja_env.python_query(sys.executable, 'sys.path')
+    gen_jinja_env.python_query(sys.executable, 'sys.path')
+    assert probe_count['count'] == 1
+
+    # a directory in sys.path was modified (e.g. a .pth file was installed)
+    (tmp_path / 'dir/file').write_text('')
+    os.utime(tmp_path / 'dir', ns=(0, 0))
+    gen_jinja_env.python_query(sys.executable, 'sys.path')
+    assert probe_count['count'] == 2
@@ -0,0 +1,161 @@
+# pylint: disable=protected-access
+
+import hashlib
+import io
+
+import pytest
+import tomli
+from graminelibos import manifest
+
+
+# TODO: use tmp_path after deprecating *EL8
+if tuple(int(i) for i in pytest.__version__.split('.')[:2]) < (3, 9):
+    import pathlib
+    @pytest.fixture
+    def tmp_path(tmpdir):
+        return pathlib.Path(tmpdir)
+
+MANIFEST_TEMPLATE = '''\
+loader.entrypoint = {{ uri = "file:/dev/null", sha256 = "{sha256}" }}
+sgx.trusted_files = [
+    "file:{tmp_path}/",
+    "file:{tmp_path}/file-0",
+]
+'''
+
+@pytest.fixture
+def trusted_dir(tmp_path):
+    for i in range(20):
+        (tmp_path / f'file-{i}').write_bytes(b'x' * i * 1000)
+    (tmp_path / 'subdir').mkdir()
+    (tmp_path / 'subdir/file').write_text('pass')
+    return tmp_path
+
+def load_manifest(tmp_path):
+    return manifest.Manifest(MANIFEST_TEMPLATE.format(
+        tmp_path=tmp_path, sha256=hashlib.sha256(b'').hexdigest()))
+
+def expand(tmp_path, jobs):
+    m = load_manifest(tmp_path)
+    m.expand_all_trusted_files(jobs=jobs)
+    return m.dumps()
+
+
+def test_expand_serial(trusted_dir):
+    m = load_manifest(trusted_dir)
+    expanded = m.expand_all_trusted_files(jobs=1)
+
+    assert expanded == sorted(expanded)
+    assert len(expanded) == 21
+    assert m['sgx']['trusted_files'][-1] == {
+        'uri': f'file:{trusted_dir}/subdir/file',
+        'sha256': hashlib.sha256(b'pass').hexdigest(),
+    }
+
+def test_expand_parallel_threads(trusted_dir):
+    assert expand(trusted_dir, jobs=4) == expand(trusted_dir, jobs=1)
+
+def test_expand_parallel_processes(trusted_dir, monkeypatch):
+    monkeypatch.setattr(manifest, '_PROCESS_POOL_MIN_FILES', 2)
+    assert expand(trusted_dir, jobs=4) == expand(trusted_dir, jobs=1)
+
+def test_expand_parallel_missing_file(trusted_dir):
+    m = load_manifest(trusted_dir)
+    m['sgx']['trusted_files'].append({'uri': f'file:{trusted_dir}/nonexistent'})
+    with pytest.raises(FileNotFoundError):
+        m.expand_all_trusted_files(jobs=4)
+
+
+@pytest.mark.parametrize('uri', [
+    'file:/plain',
+    'file:/quote"backslash\\',
+    'file:/control\x00\x01\t\n\r\x1f\x7f',
+    'file:/unicode/zażółć/€',
+])
+def test_dump_trusted_files(uri):
+    m = manifest.Manifest(MANIFEST_TEMPLATE.format(
+        tmp_path='/nonexistent', sha256=hashlib.sha256(b'').hexdigest()))
+    m['sgx']['trusted_files'] = [{'uri': uri, 'sha256': '0' * 64}, {'uri': 'file:/no-hash'}]
+    m['sgx']['subtable'] = {'key': 'value'}
+
+    dumped = m.dumps()
+    assert tomli.loads(dumped) == tomli.loads(manifest.tomli_w.dumps(m._manifest))
+    # canonical format, regardless of tomli_w version
+    assert '\ntrusted_files = [\n    { uri = "' in dumped
+    assert '\n    { uri = "file:/no-hash" },\n]\n' in dumped
+
+    file = io.BytesIO()
+    m.dump(file)
+    assert file.getvalue() == dumped.encode()
+
+def test_dump_noncanonical():
+    m = load_manifest('/nonexistent')
+    m['sgx']['trusted_files'] = [{'uri': 'file:/a', 'extra': 1}]
+    assert tomli.loads(m.dumps()) == m._manifest
+
+
+@pytest.mark.parametrize('size', [
+    0,
+    1,
+    manifest._HASH_MAX_BUFFER_SIZE + 1,
+    manifest._HASH_MMAP_MIN_SIZE,
+    manifest._HASH_MMAP_CHUNK_SIZE + 1,
+])
+def test_hash_file(tmp_path, size):
+    data = bytes(i % 251 for i in range(size))
+    (tmp_path / 'file').write_bytes(data)
+    assert manifest.hash_file(tmp_path / 'file') == hashlib.sha256(data).hexdigest()
+
+def test_hash_file_zero_size_with_contents():
+    # files in /proc report size 0, but have contents
+    with open('/proc/self/status', 'rb') as file:
+        assert file.read()
+    assert manifest.hash_file('/proc/self/status') != hashlib.sha256(b'').hexdigest()
+
+
+@pytest.fixture
+def count_syscalls(monkeypatch):
+    counts = {}
+    def wrap(name):
+        orig = getattr(manifest.os, name)
+        def wrapper(*args, **kwds):
+            counts[name] = counts.get(name, 0) + 1
+            return orig(*args, **kwds)
+        monkeypatch.setattr(manifest.os, name, wrapper)
+    for name in ('stat', 'lstat', 'access', 'scandir'):
+        wrap(name)
+    return counts
+
+@pytest.mark.parametrize('chroot', [False, True])
+def test_expand_directory_syscalls(tmp_path, count_syscalls, chroot):
+    ndirs, nfiles = 10, 20
+    for i in range(ndirs):
+        (tmp_path / f'dir-{i}').mkdir()
+        for j in range(nfiles):
+            (tmp_path / f'dir-{i}/file-{j}').write_text('')
+
+    if chroot:
+        tf = manifest.TrustedFile('file:/', chroot=tmp_path)
+    else:
+        tf = manifest.TrustedFile(f'file:{tmp_path}/')
+    count_syscalls.clear()
+    expanded = list(tf.expand_directory())
+
+    assert len(expanded) == ndirs * nfiles
+    # one access() per entry, one scandir() per directory, and stat() only for the top directory
+    # (regular files and directories are recognised by d_type from getdents())
+    assert count_syscalls.get('access', 0) == ndirs * (nfiles + 1)
+    assert count_syscalls.get('scandir', 0) == ndirs + 1
+    assert count_syscalls.get('stat', 0) + count_syscalls.get('lstat', 0) <= 1
+
+def test_expand_directory_order(tmp_path):
+    for path in ('b', 'a/z', 'a.b', '.hidden', 'a/b/c', 'B'):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text('')
+    (tmp_path / 'symlink').symlink_to('a')
+
+    assert [tf.uri for tf in manifest.TrustedFile(f'file:{tmp_path}/').expand_directory()] == [
+        f'file:{tmp_path}/{path}' for path in ('.hidden', 'B', 'a/b/c', 'a/z', 'a.b', 'b')]
+    assert [tf.uri for tf in manifest.TrustedFile(f'file:{tmp_path}/').expand_directory(
+            recursive=False)] == [
+        f'file:{tmp_path}/{path}' for path in ('.hidden', 'B', 'a/', 'a.b', 'b', 'symlink/')]